@@ -0,0 +1,109 @@
+# benchmarks/bench_import.py
+"""
+Import-time benchmark and budget guard for the pyserpZotero entry points.
+
+Each module is imported in fresh interpreters with -X importtime. The median total
+import time is compared with the budget, and the heavy dependencies that must only
+load on first use are checked for in sys.modules. Exits with status 1 if a module is
+over budget or pulls in a heavy dependency, so it can run as a CI step.
+
+Example:
+    python benchmarks/bench_import.py --budget 0.3 --repeat 5
+"""
+from pathlib import Path
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+MODULES = ("pyserpZotero.pyserpZotero", "pyserpZotero.ai")
+
+# Top-level packages that must not be imported just by importing pyserpZotero
+HEAVY = ("pandas", "numpy", "wordcloud", "matplotlib", "arxiv", "pyzotero", "bibtexparser", "serpapi",
+         "langchain", "langchain_core", "langchain_community", "langchain_openai", "langchain_text_splitters",
+         "sentence_transformers", "torch", "faiss", "fitz", "openai")
+
+PROBE = "import json, sys; import {module}; print(json.dumps(sorted(sys.modules)))"
+
+
+def measure(module):
+    """
+    Import module once in a fresh interpreter.
+
+    Returns:
+    - tuple: Total import time in seconds, {module: self time in seconds}, and the loaded module names.
+    """
+    env  = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(SRC), os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE.format(module=module)],
+                          capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    self_times, total = dict(), 0.0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        self_times[name.strip()] = int(own) / 1e6
+        if not name.startswith("  "):   # top-level imports; their cumulative times add up to the total
+            total += int(cumulative) / 1e6
+    return total, self_times, json.loads(proc.stdout)
+
+
+def bench(module, repeat, top):
+    totals, self_times, loaded = [], dict(), set()
+    for _ in range(repeat):
+        total, own, modules = measure(module)
+        totals.append(total)
+        loaded.update(modules)
+        for name, seconds in own.items():
+            self_times.setdefault(name, []).append(seconds)
+    slowest = sorted(((statistics.median(times), name) for name, times in self_times.items()), reverse=True)[:top]
+    heavy   = sorted(name for name in loaded if name.split(".")[0] in HEAVY)
+    return {
+        "module": module,
+        "median_s": statistics.median(totals),
+        "min_s": min(totals),
+        "max_s": max(totals),
+        "slowest": [{"module": name, "self_ms": seconds * 1000} for seconds, name in slowest],
+        "heavy_modules": heavy,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=list(MODULES), help="Modules to import")
+    parser.add_argument("--budget", type=float, default=0.3, help="Maximum median import time in seconds")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results to PATH as JSON")
+    args = parser.parse_args(argv)
+
+    results, failed = [], False
+    for module in args.modules:
+        result = bench(module, args.repeat, args.top)
+        results.append(result)
+        over   = result["median_s"] > args.budget
+        print(f"\n=== {module} ===")
+        print(f"import time: median {result['median_s'] * 1000:.0f}ms (min {result['min_s'] * 1000:.0f}ms, "
+              f"max {result['max_s'] * 1000:.0f}ms), budget {args.budget * 1000:.0f}ms"
+              + (" -- OVER BUDGET" if over else ""))
+        for entry in result["slowest"]:
+            print(f"  {entry['self_ms']:>8.1f}ms  {entry['module']}")
+        if result["heavy_modules"]:
+            print("heavy dependencies imported eagerly: " + ", ".join(result["heavy_modules"]))
+        failed = failed or over or bool(result["heavy_modules"])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end benchmark of search_scholar -> search2zotero -> processBibsAndUpload ->
+attempt_pdf_download against local stub services.
+
+Each library size runs in its own process, so peak memory is measured per size.
+Every stage is timed per call and reported as latency percentiles, together with
+overall throughput, peak RSS and, with --tracemalloc, peak Python heap.
+
+Example:
+    python benchmarks/bench_pipeline.py --sizes 1000 10000 100000 --latency 0.02 --failure-rate 0.01
+"""
+from contextlib import redirect_stdout
+from pathlib import Path
+from queue import Empty
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from stubs import StubServices
+
+# Method name on SerpZot -> stage name in the report
+STAGES = {
+    "load_library":    "library sync",
+    "search_scholar":  "search",
+    "serp_request":    "serpapi call",
+    "resolveResultId": "resolve doi",
+    "fetch_bib":       "fetch bibtex",
+    "upload_citations": "zotero upload",
+    "fetch_pdf":       "fetch pdf",
+    "attach_pdf":      "attach pdf",
+}
+PERCENTILES = (50, 90, 99)
+
+
+class StageTimer:
+    """
+    Collects the duration of every call to the instrumented SerpZot methods.
+    """
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES.values()}
+        self.lock    = threading.Lock()
+
+    def instrument(self, serp_zot):
+        for method, stage in STAGES.items():
+            setattr(serp_zot, method, self.timed(stage, getattr(serp_zot, method)))
+
+    def timed(self, stage, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.samples[stage].append(elapsed)
+        return wrapper
+
+    def report(self):
+        stages = dict()
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            stats   = {"count": len(ordered), "total_s": sum(ordered), "max_ms": ordered[-1] * 1000}
+            for p in PERCENTILES:
+                stats[f"p{p}_ms"] = ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000
+            stages[stage] = stats
+        return stages
+
+
+def bench_config(stubs, workdir, paced):
+    config = {
+        "SERP_API_KEY": "benchmark", "ZOT_ID": "1", "ZOT_KEY": "benchmark",
+        "DOWNLOAD_DEST": os.path.join(workdir, "downloads"),
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "ENABLE_PDF_DOWNLOAD": True,
+        "SERP_CACHE_MODE": "off",
+        "ENDPOINTS": stubs.endpoints(),
+    }
+    if not paced:
+        # Measure our own overhead rather than the politeness limits of the real services
+        unlimited = {"rate": 1e6, "burst": 1e6, "concurrency": 64}
+        config["RATE_LIMITS"] = {host: unlimited for host in stubs.endpoints()}
+    return config
+
+
+def run_size(size, options):
+    """
+    Run the pipeline once per repeat against a library of size items.
+
+    Returns:
+    - dict: The measurements for this size.
+    """
+    import yaml
+    from pyserpZotero.pyserpZotero import SerpZot
+
+    if options["tracemalloc"]:
+        tracemalloc.start()
+
+    stubs = StubServices(library_size=size, latency=options["latency"], jitter=options["jitter"],
+                         failure_rate=options["failure_rate"], results_per_term=options["results_per_term"],
+                         pdf_rate=options["pdf_rate"], seed=options["seed"]).start()
+    workdir = tempfile.mkdtemp(prefix="psz-bench-")
+    os.chdir(workdir)
+    with open("config.yaml", "w") as f:
+        yaml.safe_dump(bench_config(stubs, workdir, options["paced"]), f)
+
+    terms = [f"synthetic benchmark topic {n}" for n in range(options["terms"])]
+    runs  = []
+    try:
+        for repeat in range(options["repeat"]):
+            sink = sys.stdout if options["verbose"] else open(os.devnull, "w")
+            with redirect_stdout(sink):
+                serp_zot = SerpZot()
+                timer    = StageTimer()
+                timer.instrument(serp_zot)
+                start    = time.perf_counter()
+                serp_zot.batch_search2zotero(terms, max_searches=options["results_per_term"])
+                elapsed  = time.perf_counter() - start
+            candidates = len(getattr(serp_zot, "doiSet", ()) or ())
+            runs.append({
+                "repeat": repeat,
+                "wall_s": elapsed,
+                "candidates": candidates,
+                "citations_created": len(serp_zot.CITATION_DICT),
+                "candidates_per_s": candidates / elapsed if elapsed else 0.0,
+                "stages": timer.report(),
+            })
+    finally:
+        stubs.stop()
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "library_size": size,
+        "runs": runs,
+        "stub_requests": stubs.request_counts(),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if options["tracemalloc"]:
+        result["peak_heap_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+
+def _run_size_in_child(size, options, results):
+    results.put(run_size(size, options))
+
+
+def print_report(result):
+    print(f"\n=== Library size {result['library_size']:,} ===")
+    memory = f"peak RSS {result['peak_rss_mb']:.0f} MiB"
+    if "peak_heap_mb" in result:
+        memory += f", peak Python heap {result['peak_heap_mb']:.0f} MiB"
+    print(memory)
+    for run in result["runs"]:
+        print(f"run {run['repeat']}: {run['wall_s']:.2f}s wall, {run['candidates']} candidates "
+              f"({run['candidates_per_s']:.1f}/s), {run['citations_created']} citations created")
+        print(f"  {'stage':<14}{'count':>7}{'total s':>10}" + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+              + f"{'max ms':>10}")
+        for stage, stats in run["stages"].items():
+            print(f"  {stage:<14}{stats['count']:>7}{stats['total_s']:>10.2f}"
+                  + "".join(f"{stats[f'p{p}_ms']:>10.1f}" for p in PERCENTILES) + f"{stats['max_ms']:>10.1f}")
+    print("stub requests: " + ", ".join(f"{name} {count}" for name, count in result["stub_requests"].items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="Synthetic Zotero library sizes to benchmark (e.g. 1000 10000 100000)")
+    parser.add_argument("--terms", type=int, default=5, help="Search terms per run")
+    parser.add_argument("--results-per-term", type=int, default=40, help="Google Scholar results per term")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds every stub waits before answering")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Extra random stub latency, in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of stub requests answered with 503")
+    parser.add_argument("--pdf-rate", type=float, default=0.5, help="Share of papers with a PDF available")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Runs per size; later runs see the caches and library the earlier ones left")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--paced", action="store_true", help="Keep the real per-host rate limits")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also measure the peak Python heap (slower)")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results to PATH as JSON")
+    args = parser.parse_args(argv)
+
+    options = {name: value for name, value in vars(args).items() if name not in ("sizes", "json")}
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in args.sizes:
+        queue   = context.Queue()
+        process = context.Process(target=_run_size_in_child, args=(size, options, queue))
+        process.start()
+        result  = None
+        while result is None:
+            try:
+                result = queue.get(timeout=1)
+            except Empty:
+                if not process.is_alive():
+                    raise SystemExit(f"Benchmark for library size {size} failed (exit code {process.exitcode})")
+        process.join()
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
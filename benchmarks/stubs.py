@@ -0,0 +1,427 @@
+# benchmarks/stubs.py
+"""
+Local stand-ins for the web services pyserpZotero talks to.
+
+Every service runs on its own ThreadingHTTPServer on 127.0.0.1 and answers with
+deterministic synthetic data, after a configurable latency and with a configurable
+share of 503 responses. StubServices.endpoints() gives the ENDPOINTS config entry
+that points pyserpZotero at them.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+from xml.sax.saxutils import escape
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+try:
+    from .synthetic import PDF_BYTES, synthetic_library, synthetic_title
+except ImportError:
+    from synthetic import PDF_BYTES, synthetic_library, synthetic_title
+
+
+def digest(*parts):
+    return hashlib.sha1(":".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def hit(rate, *parts):
+    """
+    Deterministically pick rate of all keys, so reruns see the same PDFs and matches.
+    """
+    return int(digest(*parts)[:8], 16) / 0xFFFFFFFF < rate
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads      = True
+    request_queue_size  = 128
+
+    def __init__(self, handler, latency=0.0, jitter=0.0, failure_rate=0.0, seed=0, **options):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency      = latency
+        self.jitter       = jitter
+        self.failure_rate = failure_rate
+        self.rng          = random.Random(seed)
+        self.rng_lock     = threading.Lock()
+        self.options      = options
+        self.requests     = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def delay_and_fail(self):
+        """
+        Sleep for the configured latency and decide whether this request fails.
+        """
+        with self.rng_lock:
+            self.requests += 1
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            fail  = self.rng.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        return fail
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def query(self):
+        return {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+
+    @property
+    def route(self):
+        return unquote(urlsplit(self.path).path)
+
+    def body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def send(self, status, payload=b"", content_type="application/json", headers=None):
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def handle_request(self, method):
+        # Drain the body first so keep-alive connections stay in sync
+        body = self.body() if method in ("POST", "PUT", "PATCH") else b""
+        if self.server.delay_and_fail():
+            return self.send(503, {"error": "stub failure"}, headers={"Retry-After": "0"})
+        try:
+            getattr(self, "serve_" + method.lower())(body)
+        except Exception as e:
+            self.send(500, {"error": str(e)})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def serve_get(self, body):
+        self.send(404, {"error": "not found"})
+
+    def serve_post(self, body):
+        self.send(405, {"error": "method not allowed"})
+
+
+class SerpApiHandler(StubHandler):
+    """
+    google_scholar pages with results_per_term results per query, and
+    google_scholar_cite answers whose APA snippet carries the result's title.
+    """
+    def serve_get(self, body):
+        q       = self.query
+        total   = self.server.options.get("results_per_term", 40)
+        if q.get("engine") == "google_scholar_cite":
+            title = synthetic_title(q.get("q", ""))
+            return self.send(200, {"citations": [
+                {"title": "MLA", "snippet": f"Doe, J. \"{title}.\" Journal of Stubs (2021)."},
+                {"title": "APA", "snippet": f"Doe, J. (2021). {title}. Journal of Stubs."},
+            ]})
+        start   = int(q.get("start", 0))
+        num     = int(q.get("num", 20))
+        results = [{"position": n,
+                    "result_id": digest(q.get("q"), n)[:12],
+                    "title": synthetic_title(digest(q.get("q"), n)[:12]),
+                    "snippet": f"Synthetic abstract {n} for {q.get('q')}."}
+                   for n in range(start, min(total, start + num))]
+        self.send(200, {"search_metadata": {"status": "Success"}, "organic_results": results})
+
+
+class CrossrefHandler(StubHandler):
+    def serve_get(self, body):
+        citation = self.query.get("query.bibliographic", "")
+        self.send(200, {"status": "ok", "message": {"items": [{"DOI": "10.5555/stub." + digest(citation)[:10]}]}})
+
+
+class DoiHandler(StubHandler):
+    """
+    BibTeX by content negotiation, like doi.org with Accept: application/x-bibtex.
+    """
+    def serve_get(self, body):
+        doi   = self.route.lstrip("/")
+        title = synthetic_title(doi)
+        bib   = (f"@article{{{digest(doi)[:8]},\n"
+                 f"  title = {{{title}}},\n"
+                 f"  author = {{Doe, Jane and Roe, Richard}},\n"
+                 f"  journal = {{Journal of Stubs}},\n"
+                 f"  volume = {{{int(digest(doi)[:2], 16)}}},\n"
+                 f"  number = {{1}},\n"
+                 f"  year = {{2021}},\n"
+                 f"  month = {{mar}},\n"
+                 f"  url = {{http://dx.doi.org/{doi}}},\n"
+                 f"  doi = {{{doi}}}\n}}")
+        self.send(200, bib, content_type="application/x-bibtex; charset=utf-8")
+
+
+class ArxivHandler(StubHandler):
+    """
+    The arXiv Atom API for search_query/id_list queries, plus the PDFs it links to.
+    A pdf_rate share of title searches find their paper.
+    """
+    def entry(self, arxiv_id, title):
+        return f"""<entry>
+  <id>http://arxiv.org/abs/{arxiv_id}v1</id>
+  <updated>2021-03-01T00:00:00Z</updated>
+  <published>2021-03-01T00:00:00Z</published>
+  <title>{escape(title)}</title>
+  <summary>Synthetic abstract.</summary>
+  <author><name>Jane Doe</name></author>
+  <arxiv:doi>10.5555/arxiv.{arxiv_id}</arxiv:doi>
+  <link title="doi" href="http://dx.doi.org/10.5555/arxiv.{arxiv_id}" rel="related"/>
+  <link href="http://arxiv.org/abs/{arxiv_id}v1" rel="alternate" type="text/html"/>
+  <link title="pdf" href="http://arxiv.org/pdf/{arxiv_id}v1" rel="related" type="application/pdf"/>
+  <arxiv:primary_category term="cs.DL" scheme="http://arxiv.org/schemas/atom"/>
+  <category term="cs.DL" scheme="http://arxiv.org/schemas/atom"/>
+</entry>"""
+
+    def serve_get(self, body):
+        if self.route.startswith("/pdf/"):
+            return self.send(200, PDF_BYTES, content_type="application/pdf")
+
+        q       = self.query
+        rate    = self.server.options.get("pdf_rate", 0.5)
+        entries = []
+        for arxiv_id in filter(None, q.get("id_list", "").split(",")):
+            entries.append(self.entry(arxiv_id, synthetic_title(arxiv_id)))
+        query = q.get("search_query", "")
+        for title in re.findall(r'ti:"([^"]*)"', query):
+            if hit(rate, "arxiv", title.lower()):
+                entries.append(self.entry(f"2101.{int(digest(title.lower())[:4], 16) % 100000:05d}", title))
+        if query.startswith("all:"):
+            entries += [self.entry(f"2102.{n:05d}", synthetic_title(digest(query, n)[:12])) for n in range(10)]
+        entries = entries[int(q.get("start", 0)):][:int(q.get("max_results", 10))]
+
+        feed = f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"
+      xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <title>arXiv Query</title>
+  <id>http://arxiv.org/api/stub</id>
+  <updated>2021-03-01T00:00:00Z</updated>
+  <opensearch:totalResults>{len(entries)}</opensearch:totalResults>
+  <opensearch:startIndex>{q.get("start", 0)}</opensearch:startIndex>
+  <opensearch:itemsPerPage>{len(entries)}</opensearch:itemsPerPage>
+  {"".join(entries)}
+</feed>"""
+        self.send(200, feed, content_type="application/atom+xml; charset=utf-8")
+
+
+class PreprintHandler(StubHandler):
+    """
+    bioRxiv / medRxiv: search pages linking DOIs, and full-text PDFs for a pdf_rate share of them.
+    """
+    def serve_get(self, body):
+        route = self.route
+        if route.startswith("/search/"):
+            term  = route[len("/search/"):]
+            links = "\n".join(f'<a href="https://doi.org/10.1101/{digest(term, n)[:10]}">paper</a>'
+                              for n in range(self.server.options.get("results_per_term", 10)))
+            return self.send(200, f"<html><body>{links}</body></html>", content_type="text/html")
+        if route.startswith("/content/") and route.endswith(".pdf"):
+            if hit(self.server.options.get("pdf_rate", 0.5), "preprint", route):
+                return self.send(200, PDF_BYTES, content_type="application/pdf")
+        self.send(404, "<html>Not found</html>", content_type="text/html")
+
+
+class SciHubHandler(StubHandler):
+    def serve_get(self, body):
+        self.send(404, "<html>Not found</html>", content_type="text/html")
+
+
+class ZoteroHandler(StubHandler):
+    """
+    The parts of the Zotero Web API pyserpZotero uses, over an in-memory library:
+    paged item listing with since=, deletions, item templates, item creation,
+    children and file upload authorization (always answered with "exists").
+    """
+    LIBRARY = re.compile(r"^/(users|groups)/[^/]+")
+
+    def serve_get(self, body):
+        store = self.server.store
+        route = self.LIBRARY.sub("", self.route)
+        q     = self.query
+        if route == "/items/new":
+            template = {"itemType": q.get("itemType", "journalArticle"), "title": "", "creators": [],
+                        "abstractNote": "", "publicationTitle": "", "volume": "", "issue": "", "pages": "",
+                        "date": "", "DOI": "", "url": "", "accessDate": "", "extra": "", "tags": [],
+                        "collections": [], "relations": {}}
+            if q.get("itemType") == "attachment":
+                template.update({"linkMode": q.get("linkMode"), "contentType": "", "charset": "",
+                                 "filename": "", "md5": None, "mtime": None})
+            return self.send(200, template, headers={"Last-Modified-Version": str(store.version)})
+        if route == "/deleted":
+            since = int(q.get("since", 0))
+            with store.lock:
+                deleted = [key for key, version in store.deleted.items() if version > since]
+            return self.send(200, {"collections": [], "items": deleted, "searches": [], "tags": [], "settings": []},
+                             headers={"Last-Modified-Version": str(store.version)})
+        match = re.match(r"^/items/([A-Z0-9]+)/children$", route)
+        if match:
+            children = [store.items[key] for key in store.children.get(match.group(1), ())]
+            return self.send(200, children, headers={"Last-Modified-Version": str(store.version)})
+        if route in ("/items", "/items/top"):
+            since = int(q.get("since", 0))
+            with store.lock:
+                items = [item for item in store.items.values() if item["version"] > since]
+                if route == "/items/top":
+                    items = [item for item in items if not item["data"].get("parentItem")]
+            start = int(q.get("start", 0))
+            limit = min(int(q.get("limit", 25)), 100)
+            page  = items[start:start + limit]
+            headers = {"Last-Modified-Version": str(store.version), "Total-Results": str(len(items))}
+            if start + limit < len(items):
+                params = dict(q, start=start + limit, limit=limit)
+                headers["Link"] = f'<{self.server.url}{urlsplit(self.path).path}?{urlencode(params)}>; rel="next"'
+            return self.send(200, page, headers=headers)
+        self.send(404, {"error": "not found"})
+
+    def serve_post(self, body):
+        store = self.server.store
+        route = self.LIBRARY.sub("", self.route)
+        if route == "/items":
+            successful, success, failed = {}, {}, {}
+            for n, data in enumerate(json.loads(body or b"[]")):
+                if not data.get("itemType"):
+                    failed[str(n)] = {"code": 400, "message": "itemType is required"}
+                    continue
+                item = store.create(data)
+                successful[str(n)] = item
+                success[str(n)]    = item["key"]
+            return self.send(200, {"successful": successful, "success": success, "unchanged": {}, "failed": failed},
+                             headers={"Last-Modified-Version": str(store.version)})
+        if re.match(r"^/items/[A-Z0-9]+/file$", route):
+            return self.send(200, {"exists": 1})
+        self.send(404, {"error": "not found"})
+
+
+class LibraryStore:
+    """
+    The in-memory Zotero library behind ZoteroHandler.
+    """
+    def __init__(self, items=()):
+        self.lock     = threading.Lock()
+        self.items    = dict()
+        self.children = dict()
+        self.deleted  = dict()   # item key -> library version it was deleted at
+        self.version  = 1
+        self.created  = 0
+        for item in items:
+            self._index(item)
+
+    def _index(self, item):
+        self.items[item["key"]] = item
+        parent = item["data"].get("parentItem")
+        if parent:
+            self.children.setdefault(parent, []).append(item["key"])
+
+    def create(self, data):
+        with self.lock:
+            self.version += 1
+            self.created += 1
+            key  = digest("created", self.created)[:8].upper()
+            data = dict(data, key=key, version=self.version)
+            item = {"key": key, "version": self.version, "library": {"type": "user", "id": 1},
+                    "links": {}, "meta": {}, "data": data}
+            self._index(item)
+            parent = data.get("parentItem")
+            if parent in self.items and data.get("itemType") == "attachment":
+                self.items[parent]["links"]["attachment"] = {"href": key, "attachmentType": "application/pdf"}
+        return item
+
+    def delete(self, key):
+        with self.lock:
+            self.version += 1
+            self.items.pop(key)
+            self.deleted[key] = self.version
+
+
+class StubServices:
+    """
+    All stub services, started together.
+
+    Parameters:
+    - library_size (int): Number of top-level items in the synthetic Zotero library.
+    - latency (float): Seconds every stub waits before answering.
+    - jitter (float): Extra random latency, up to this many seconds.
+    - failure_rate (float): Share of requests answered with 503.
+    - results_per_term (int): Google Scholar results available per search term.
+    - pdf_rate (float): Share of papers for which a PDF source has the full text.
+    - seed (int): Seed for latency jitter, failures and the synthetic library.
+    """
+    def __init__(self, library_size=1000, latency=0.0, jitter=0.0, failure_rate=0.0,
+                 results_per_term=40, pdf_rate=0.5, seed=0):
+        common  = dict(latency=latency, jitter=jitter, failure_rate=failure_rate,
+                       results_per_term=results_per_term, pdf_rate=pdf_rate)
+        handlers = {
+            "serpapi":  SerpApiHandler,
+            "crossref": CrossrefHandler,
+            "doi":      DoiHandler,
+            "arxiv":    ArxivHandler,
+            "biorxiv":  PreprintHandler,
+            "medrxiv":  PreprintHandler,
+            "scihub":   SciHubHandler,
+            "zotero":   ZoteroHandler,
+        }
+        self.servers = {name: StubServer(handler, seed=seed + n, **common)
+                        for n, (name, handler) in enumerate(handlers.items())}
+        self.servers["zotero"].store = LibraryStore(synthetic_library(library_size, seed=seed))
+        self.threads = []
+
+    def start(self):
+        for name, server in self.servers.items():
+            # A short poll interval so stop() doesn't wait half a second per service
+            thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05},
+                                      name=f"stub-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def endpoints(self):
+        """
+        The ENDPOINTS config entry routing every real service to its stub.
+        """
+        url = {name: server.url for name, server in self.servers.items()}
+        return {
+            "serpapi.com":       url["serpapi"],
+            "api.crossref.org":  url["crossref"],
+            "doi.org":           url["doi"],
+            "dx.doi.org":        url["doi"],
+            "export.arxiv.org":  url["arxiv"],
+            "arxiv.org":         url["arxiv"],
+            "www.biorxiv.org":   url["biorxiv"],
+            "biorxiv.org":       url["biorxiv"],
+            "www.medrxiv.org":   url["medrxiv"],
+            "sci-hub.se":        url["scihub"],
+            "sci-hub.ru":        url["scihub"],
+            "api.zotero.org":    url["zotero"],
+        }
+
+    def request_counts(self):
+        return {name: server.requests for name, server in self.servers.items()}
@@ -0,0 +1,82 @@
+# benchmarks/synthetic.py
+"""
+Deterministic synthetic papers and Zotero libraries for the benchmarks.
+"""
+import hashlib
+import random
+
+WORDS = (
+    "adaptive analysis approach attention bayesian benchmark biological cancer causal cell "
+    "classification clinical cohort computational contrastive convolutional data deep detection "
+    "diffusion disease distributed dynamics efficient embedding estimation evaluation evidence "
+    "federated framework gene genomic graph heterogeneous hierarchical humanoid image inference "
+    "large learning linear longitudinal machine markov medical method model molecular multimodal "
+    "network neural nonlinear optimal optimization patient prediction probabilistic protein quantum "
+    "random reinforcement representation retrieval risk robot robust sampling scalable segmentation "
+    "sequence signal sparse spatial statistical stochastic structure study supervised survival "
+    "system temporal theory transfer transformer treatment uncertainty unsupervised variational"
+).split()
+
+SURNAMES = ("Smith Johnson Garcia Chen Kim Nguyen Müller Rossi Tanaka Silva Ivanova Okafor "
+            "Patel Cohen Dubois Novak Larsen Haddad Costa Schmidt").split()
+
+# A small but valid PDF, padded so downloads move a realistic number of bytes
+PDF_BYTES = (b"%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+             b"2 0 obj << /Type /Pages /Kids [] /Count 0 >> endobj\n"
+             + b"%" + b"x" * 64 * 1024 + b"\n"
+             b"trailer << /Root 1 0 R >>\n%%EOF\n")
+
+
+def rng_for(key):
+    return random.Random(int(hashlib.sha1(str(key).encode()).hexdigest()[:16], 16))
+
+
+def synthetic_title(key):
+    """
+    A plausible paper title that is always the same for the same key.
+    """
+    rng   = rng_for(key)
+    words = rng.sample(WORDS, rng.randint(6, 11))
+    return " ".join(words).capitalize()
+
+
+def synthetic_library(size, seed=0, attachment_rate=0.6):
+    """
+    Zotero items for a library of size journal articles, about attachment_rate of
+    them with a stored PDF attachment as a child item.
+
+    Parameters:
+    - size (int): Number of top-level items.
+    - seed (int): Seed, so the same arguments always give the same library.
+    - attachment_rate (float): Share of items with a PDF attached.
+
+    Returns:
+    - list: Items in the Zotero Web API JSON format, attachments included.
+    """
+    rng   = random.Random(seed)
+    items = []
+    for n in range(size):
+        key     = f"L{n:07d}"
+        authors = rng.sample(SURNAMES, rng.randint(1, 4))
+        data    = {
+            "key": key, "version": 1, "itemType": "journalArticle",
+            "title": synthetic_title(f"library:{seed}:{n}"),
+            "creators": [{"creatorType": "author", "firstName": "A.", "lastName": name} for name in authors],
+            "abstractNote": "", "publicationTitle": "Journal of Synthetic Results",
+            "volume": str(rng.randint(1, 60)), "issue": str(rng.randint(1, 12)), "pages": "",
+            "date": str(rng.randint(1990, 2024)), "DOI": f"10.5555/library.{seed}.{n}",
+            "url": "", "accessDate": "", "extra": "", "tags": [], "collections": [], "relations": {},
+        }
+        item = {"key": key, "version": 1, "library": {"type": "user", "id": 1},
+                "links": {}, "meta": {}, "data": data}
+        items.append(item)
+        if rng.random() < attachment_rate:
+            child = f"A{n:07d}"
+            item["links"]["attachment"] = {"href": child, "attachmentType": "application/pdf"}
+            items.append({"key": child, "version": 1, "library": {"type": "user", "id": 1},
+                          "links": {}, "meta": {},
+                          "data": {"key": child, "version": 1, "itemType": "attachment",
+                                   "parentItem": key, "linkMode": "imported_file",
+                                   "title": "Full Text PDF", "contentType": "application/pdf",
+                                   "md5": hashlib.md5(key.encode()).hexdigest(), "filename": f"{key}.pdf"}})
+    return items
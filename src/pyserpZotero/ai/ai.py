@@ -1,31 +1,63 @@
-from langchain_community.chat_message_histories import SQLChatMessageHistory
-from langchain_community.tools.google_scholar import GoogleScholarQueryRun
-from langchain_community.utilities.google_scholar import GoogleScholarAPIWrapper
-from langchain_community.vectorstores import faiss as f
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
-from langchain_core.prompts import MessagesPlaceholder
-from langchain_core.prompts.chat import (ChatPromptTemplate)
-from langchain_core.runnables import RunnableLambda, RunnablePassthrough,RunnableParallel
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from openai import OpenAI
-from pyserpZotero.pyserpZotero import SerpZot as zot
-from pyzotero import zotero
-from sentence_transformers import SentenceTransformer
-import faiss
-import fitz
+# Heavy dependencies (langchain, sentence_transformers, faiss, fitz, openai) are imported
+# where they are used, so importing this module stays cheap
+import hashlib
 import json
-import numpy as np
 import os
 import pickle
-import pyzotero
 import uuid
+import warnings
 
-client = OpenAI()
+try:
+    from .vector_index import VectorIndex, get_embedder
+except ImportError:
+    from vector_index import VectorIndex, get_embedder
+
+_client = None
+
+
+def get_openai_client():
+    """
+    The shared OpenAI client, created on first use.
+    """
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI()
+    return _client
 
 
 class LangChainAssistant:
-    def __init__(self, serp_api_key, zot_id, zot_key, pkl_path="", pdf_paths=""):
+    """
+    Chat assistant that answers from the user's Zotero library (RAG) and Google Scholar.
+
+    The library is embedded into a FAISS index kept on disk under cache_dir, keyed by
+    Zotero item key and version. Before each question the library version is checked and,
+    if it changed, only new and changed items are embedded; otherwise a question costs one
+    query embedding.
+
+    Parameters:
+    - serp_api_key (str): API key for SerpAPI, for the Google Scholar tool.
+    - zot_id (str): Zotero user/library ID.
+    - zot_key (str): API key for the Zotero library.
+    - pkl_path (str): Optional pickle of extra documents to index: Zotero items or plain strings.
+    - pdf_paths (list): PDFs whose text can be extracted for the prompt.
+    - cache_dir (str): Directory for the vector index and the library snapshot, shared with SerpZot's CACHE_DIR.
+    - embedding_backend (str): "local" (SentenceTransformer, the default) or "openai".
+    - embedding_model (str): The model of the backend; its default if None.
+    - embedding_batch_size (int): Texts embedded per batch; the backend's default if None.
+    - rag_k (int): Library items retrieved per question.
+    """
+    def __init__(self, serp_api_key, zot_id, zot_key, pkl_path="", pdf_paths="", cache_dir=".pyserpZotero_cache",
+                 embedding_backend="local", embedding_model=None, embedding_batch_size=None, rag_k=4):
+        from langchain_community.chat_message_histories import SQLChatMessageHistory
+        from langchain_community.tools.google_scholar import GoogleScholarQueryRun
+        from langchain_community.utilities.google_scholar import GoogleScholarAPIWrapper
+        from langchain_core.prompts import MessagesPlaceholder
+        from langchain_core.prompts.chat import ChatPromptTemplate
+        from langchain_core.runnables import RunnableLambda
+        from langchain_openai import ChatOpenAI
+        from pyzotero import zotero
+
         self.pkl_path = pkl_path
         self.session_id = str(uuid.uuid4())
         os.environ["SERP_API_KEY"] = serp_api_key
@@ -52,10 +84,14 @@ class LangChainAssistant:
         self.google_scholar_runnable = RunnableLambda(func=self.run_google_scholar_query)
         self.zot_id  = zot_id
         self.zot_key = zot_key
-        self.zot = pyzotero.zotero.Zotero(zot_id, 'user', zot_key)
+        self.zot = zotero.Zotero(zot_id, 'user', zot_key)
         self.pdf_paths = pdf_paths or []
-        #self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.faiss_index     = None
+        self.cache_dir       = cache_dir
+        self.rag_k           = rag_k
+        self.embedder        = get_embedder(embedding_backend, embedding_model, embedding_batch_size)
+        self.vector_index    = None
+        self.snapshot        = None
+        self.indexed_version = None   # Library version the vector index was last updated to
         self.documents       = []
         self.chain = (self.prompt
                       | self.google_scholar_runnable
@@ -69,34 +105,77 @@ class LangChainAssistant:
 
         self.load_documents_from_pkl = load_documents_from_pkl
 
-        def embed_documents_with_openai(self, documents):
-            embeddings = []
-            documents = documents[-10:]  # TEMP for testing only
-            for document in documents:
-                response = client.embeddings.create(input=document, model="text-embedding-3-large")
-                embeddings.append(response.data[0].embedding)
-            return np.vstack(embeddings)
-        self.embed_documents_with_openai = embed_documents_with_openai
+        def embed_documents(self, documents):
+            # With the configured backend: local SentenceTransformer by default, or OpenAI
+            return self.embedder.embed(documents)
+        self.embed_documents = embed_documents
+        # The old name, from when documents were always embedded with OpenAI
+        self.embed_documents_with_openai = embed_documents
 
         def jason_style(self, documents):
-            embeddings = OpenAIEmbeddings()
-            docs       = documents[-10:]
-            from langchain_text_splitters import CharacterTextSplitter
-            text_splitter = (CharacterTextSplitter(chunk_size=1000,
-                                                   chunk_overlap=0))
-            txt = text_splitter.split_text(str(docs))
-            db = f.FAISS.from_texts(txt, embeddings)
-            return db
+            warnings.warn("jason_style is deprecated; the library is indexed by refresh_index() "
+                          "and searched with retrieve(query)", DeprecationWarning, stacklevel=2)
+            return self.refresh_index()
         self.jason_style = jason_style
 
         def create_faiss_index(self, embeddings):
-            dimension = embeddings.shape[1]
-            faiss_index = faiss.IndexFlatL2(dimension)
-            faiss_index.add(embeddings)
-            return faiss_index
+            warnings.warn("create_faiss_index is deprecated; refresh_index() keeps the FAISS index "
+                          "up to date and retrieve(query) searches it", DeprecationWarning, stacklevel=2)
+            return self.refresh_index().index
         self.create_faiss_index = create_faiss_index
 
+    def refresh_index(self):
+        """
+        Bring the vector index up to date with the Zotero library and the documents in
+        pkl_path. The library is synced through the same incremental snapshot the search
+        pipeline keeps, and only items that are new or changed since the last refresh are
+        embedded; items that were deleted are dropped from the index. An unchanged library
+        version costs one request and no embeddings.
+
+        Returns:
+        - (VectorIndex): The up to date index.
+        """
+        try:
+            from ..utils.library_snapshot import LibrarySnapshot
+        except ImportError:
+            from utils.library_snapshot import LibrarySnapshot
+
+        if self.vector_index is None:
+            self.vector_index = VectorIndex(os.path.join(self.cache_dir, f"vector_index_{self.zot_id}"), self.embedder)
+        if self.snapshot is None:
+            self.snapshot = LibrarySnapshot(os.path.join(self.cache_dir, f"library_{self.zot_id}.json"))
+
+        self.snapshot.sync(self.zot)
+        if self.snapshot.version == self.indexed_version:
+            return self.vector_index
+        items = self.snapshot.all_items()
+
+        if self.pkl_path:
+            self.documents = self.load_documents_from_pkl(self)
+            for document in self.documents:
+                if isinstance(document, dict):
+                    items.append(document)
+                else:
+                    # Plain text has no Zotero key or version; its hash is both
+                    text   = str(document)
+                    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+                    items.append({'key': f"doc:{digest}", 'version': digest, 'data': {'abstractNote': text}})
+
+        self.vector_index.update(items, prune=True)
+        self.indexed_version = self.snapshot.version
+        return self.vector_index
+
+    def retrieve(self, query, k=None):
+        """
+        The library items closest to a query, formatted for the prompt. The index is
+        refreshed first, which embeds nothing unless the library changed.
+        """
+        self.refresh_index()
+        hits = self.vector_index.search(query, k or self.rag_k)
+        return "\n\n".join(f"[{key}] {text}" for key, score, text in hits)
+
     def extract_text_from_pdfs(self):
+        import fitz
         text_content = ""
         for pdf_path in self.pdf_paths:
             with fitz.open(pdf_path) as doc:
@@ -119,6 +198,9 @@ class LangChainAssistant:
     def run_google_scholar_query(self, input_data):
         query = input_data.messages[-1].content if input_data.messages else None
         if query:
+            from langchain_community.tools.google_scholar import GoogleScholarQueryRun
+            from langchain_community.utilities.google_scholar import GoogleScholarAPIWrapper
+            from langchain_core.messages import HumanMessage, SystemMessage
             tool     = GoogleScholarQueryRun(api_wrapper=GoogleScholarAPIWrapper())
             result   = tool.run({"query": query})
 
@@ -135,12 +217,14 @@ class LangChainAssistant:
             return {"output": "No query provided."}
 
     def invoke(self, input_query):
+        from langchain_community.chat_message_histories import SQLChatMessageHistory
+        from langchain_core.runnables import RunnablePassthrough
+        from langchain_core.runnables.history import RunnableWithMessageHistory
+        from langchain_openai import ChatOpenAI
+
         #extracted_text = self.extract_text_from_pdfs()
-        citations = self.load_documents_from_pkl(self)
-        #formatted_citations = self.format_citations_for_prompt(citations)
-        db = self.jason_style(documents=citations[-3:], self=self)
         print("Starting retrieval...")
-        rag_output = db.as_retriever().invoke(input_query)
+        rag_output = self.retrieve(input_query)
 
         print("Starting chain...")
         chain_with_history = RunnableWithMessageHistory(
@@ -170,7 +254,3 @@ class LangChainAssistant:
         )
         final_answer = final_chain.invoke(final_prompt)
         return final_answer.content
-
-
-# Example usage
-if __name__ == "__main__":
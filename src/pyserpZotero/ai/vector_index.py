@@ -0,0 +1,235 @@
+# ai/vector_index.py
+# numpy, faiss, sentence_transformers and openai are imported where they are used,
+# so importing this module stays cheap
+import json
+import os
+import tempfile
+
+
+class SentenceTransformerEmbedder:
+    """
+    Local embeddings with a SentenceTransformer model, computed in batches.
+
+    Parameters:
+    - model_name (str): The SentenceTransformer model to load on first use.
+    - batch_size (int): Texts embedded per forward pass.
+    """
+    def __init__(self, model_name="all-MiniLM-L6-v2", batch_size=64):
+        self.name       = f"sentence-transformers/{model_name}"
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model     = None
+
+    def embed(self, texts):
+        """
+        Returns:
+        - numpy.ndarray: One L2-normalized float32 row per text.
+        """
+        import numpy as np
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        vectors = self._model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                     normalize_embeddings=True, show_progress_bar=len(texts) > 10 * self.batch_size)
+        return np.asarray(vectors, dtype="float32")
+
+
+class OpenAIEmbedder:
+    """
+    OpenAI embeddings, many texts per API request.
+
+    Parameters:
+    - model (str): The OpenAI embedding model.
+    - batch_size (int): Texts sent per request; the API takes up to 2048.
+    """
+    def __init__(self, model="text-embedding-3-large", batch_size=256):
+        self.name       = f"openai/{model}"
+        self.model      = model
+        self.batch_size = batch_size
+
+    def embed(self, texts):
+        """
+        Returns:
+        - numpy.ndarray: One L2-normalized float32 row per text.
+        """
+        import numpy as np
+        try:
+            from .ai import get_openai_client
+        except ImportError:
+            from ai import get_openai_client
+        client, texts, rows = get_openai_client(), list(texts), []
+        for first in range(0, len(texts), self.batch_size):
+            # Empty strings are rejected by the API
+            batch    = [text or " " for text in texts[first:first + self.batch_size]]
+            response = client.embeddings.create(input=batch, model=self.model)
+            rows.extend(entry.embedding for entry in sorted(response.data, key=lambda entry: entry.index))
+        vectors = np.asarray(rows, dtype="float32")
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def get_embedder(backend="local", model=None, batch_size=None):
+    """
+    The embedder for a backend name: "local" (SentenceTransformer) or "openai".
+    """
+    if backend == "local":
+        return SentenceTransformerEmbedder(model or "all-MiniLM-L6-v2", batch_size or 64)
+    if backend == "openai":
+        return OpenAIEmbedder(model or "text-embedding-3-large", batch_size or 256)
+    raise ValueError(f"Unknown embedding backend {backend!r}, expected 'local' or 'openai'")
+
+
+def item_text(item, max_chars=4000):
+    """
+    The text a Zotero item is embedded as: title, authors, date, venue, DOI, tags and abstract.
+
+    Parameters:
+    - item (dict): A Zotero item as the API returns it, or just its data.
+    - max_chars (int): Where to cut the text off; the models only read the start anyway.
+
+    Returns:
+    - str: The text, empty if the item has no title and no abstract.
+    """
+    data = item.get('data', item)
+    if not (data.get('title') or data.get('abstractNote')):
+        return ""
+    authors = ", ".join(" ".join(filter(None, (c.get('firstName'), c.get('lastName')))) or c.get('name', "")
+                        for c in data.get('creators', []))
+    parts = [data.get('title'), authors, data.get('date'), data.get('publicationTitle'),
+             data.get('DOI') or data.get('doi'), ", ".join(t.get('tag', "") for t in data.get('tags', [])),
+             data.get('abstractNote')]
+    return "\n".join(str(part) for part in parts if part)[:max_chars]
+
+
+class VectorIndex:
+    """
+    A FAISS index of Zotero items that lives on disk and is updated incrementally.
+
+    Next to the index, a doc-id map records for each item key the FAISS id of its
+    vector, the item version it was embedded at and the embedded text. An update
+    only embeds items that are new or whose version changed, and drops the vectors
+    of items that changed or are gone, so an unchanged library costs no embeddings.
+    Searching embeds the query only.
+
+    Vectors are L2-normalized and compared by inner product, i.e. cosine similarity.
+
+    Parameters:
+    - path (str): Directory for index.faiss and docmap.json. None keeps the index in memory.
+    - embedder: Anything with a name and embed(texts) -> normalized float32 matrix.
+    """
+    def __init__(self, path, embedder):
+        self.path     = path
+        self.embedder = embedder
+        self.index    = None
+        self.docs     = dict()   # item key -> {"id", "version", "text"}
+        self.next_id  = 0
+        if path and os.path.isfile(os.path.join(path, "docmap.json")):
+            self.load()
+
+    def load(self):
+        """
+        Read the index and doc-id map from disk. Starts over if they were built with another
+        embedding model or don't match each other, e.g. after a crash between the two writes.
+        """
+        import faiss
+        try:
+            with open(os.path.join(self.path, "docmap.json")) as f:
+                docmap = json.load(f)
+            index = faiss.read_index(os.path.join(self.path, "index.faiss"))
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Could not read the vector index in {self.path}, rebuilding it: {e}")
+            return
+        if docmap.get('model') != self.embedder.name:
+            print(f"Vector index was built with {docmap.get('model')}, rebuilding it with {self.embedder.name}")
+            return
+        if index.ntotal != len(docmap.get('docs', {})):
+            print(f"Vector index and its doc-id map in {self.path} disagree, rebuilding it")
+            return
+        self.index   = index
+        self.docs    = docmap['docs']
+        self.next_id = docmap['next_id']
+
+    def save(self):
+        """
+        Write the index and then the doc-id map, each atomically.
+        """
+        if not self.path or self.index is None:
+            return
+        import faiss
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        os.close(fd)
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, "index.faiss"))
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({'model': self.embedder.name, 'next_id': self.next_id, 'docs': self.docs}, f)
+        os.replace(tmp_path, os.path.join(self.path, "docmap.json"))
+
+    def update(self, items, prune=True):
+        """
+        Bring the index up to date with a collection of Zotero items.
+
+        Parameters:
+        - items (list): Zotero items with key, version and data. Attachments, notes and
+          items without a title or abstract are left out.
+        - prune (bool): Drop items that are indexed but not in items, i.e. items is the whole library.
+
+        Returns:
+        - tuple: (embedded, removed) item counts.
+        """
+        import numpy as np
+        current = dict()
+        for item in items:
+            data = item.get('data', {})
+            if item.get('key') is None or data.get('itemType') in ("attachment", "note", "annotation"):
+                continue
+            text = item_text(item)
+            if text:
+                current[item['key']] = (item.get('version', data.get('version', 0)), text)
+
+        changed = [key for key, (version, _) in current.items()
+                   if key not in self.docs or self.docs[key]['version'] != version]
+        gone    = [key for key in self.docs if key not in current] if prune else []
+        stale   = [key for key in changed if key in self.docs] + gone
+        if not stale and not changed:
+            return 0, 0
+
+        if stale and self.index is not None:
+            self.index.remove_ids(np.array([self.docs[key]['id'] for key in stale], dtype="int64"))
+        for key in stale:
+            del self.docs[key]
+
+        if changed:
+            print(f"Embedding {len(changed)} new or changed items with {self.embedder.name}...")
+            vectors = self.embedder.embed([current[key][1] for key in changed])
+            ids     = np.arange(self.next_id, self.next_id + len(changed), dtype="int64")
+            if self.index is None:
+                import faiss
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+            self.index.add_with_ids(vectors, ids)
+            for key, doc_id in zip(changed, ids.tolist()):
+                version, text  = current[key]
+                self.docs[key] = {'id': doc_id, 'version': version, 'text': text}
+            self.next_id += len(changed)
+
+        self.save()
+        print(f"Vector index updated: {len(changed)} embedded, {len(gone)} removed, {len(self.docs)} items in total.")
+        return len(changed), len(gone)
+
+    def search(self, query, k=4):
+        """
+        Find the items closest to a query, embedding only the query.
+
+        Returns:
+        - list: (item key, similarity, text) tuples, best first.
+        """
+        if self.index is None or not self.docs:
+            return []
+        by_id = {doc['id']: key for key, doc in self.docs.items()}
+        scores, ids = self.index.search(self.embedder.embed([query]), min(k, len(self.docs)))
+        return [(by_id[doc_id], float(score), self.docs[by_id[doc_id]]['text'])
+                for score, doc_id in zip(scores[0].tolist(), ids[0].tolist()) if doc_id in by_id]
+
+    def __len__(self):
+        return len(self.docs)
@@ -0,0 +1,224 @@
+# batch.py
+"""
+Headless batch mode: search terms from a file or stdin, add what they find to Zotero
+and stream one JSON record per term, DOI, upload and download to stdout.
+
+Examples:
+    psz batch terms.txt --budget 2000 --download-workers 8 > run.jsonl
+    psz batch terms.txt --processes 4 --quiet > run.jsonl
+    cat terms.txt | psz batch --sources serp,arxiv --no-pdf --quiet
+    psz batch --resume >> run.jsonl
+"""
+from contextlib import redirect_stdout
+
+import argparse
+import os
+import sys
+import time
+
+SOURCES = ("serp", "arxiv", "medArxiv", "bioArxiv")
+
+
+def read_terms(paths, terms=()):
+    """
+    Collect search terms, one per line, skipping blank lines, comments and repeats.
+
+    Parameters:
+    - paths (list): Files to read terms from; "-" reads stdin.
+    - terms (list): Terms given directly on the command line.
+
+    Returns:
+    - list: The terms in the order they were first seen.
+    """
+    seen, ordered = set(), []
+
+    def add(term):
+        term = term.strip()
+        if term and not term.startswith("#") and term not in seen:
+            seen.add(term)
+            ordered.append(term)
+
+    for term in terms:
+        add(term)
+    for path in paths:
+        if path == "-":
+            for line in sys.stdin:
+                add(line)
+        else:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    add(line)
+    return ordered
+
+
+def source_list(value):
+    sources = [source.strip() for source in value.split(",") if source.strip()]
+    unknown = [source for source in sources if source not in SOURCES]
+    if unknown or not sources:
+        raise argparse.ArgumentTypeError(f"sources must be a comma-separated list of {', '.join(SOURCES)}")
+    return sources
+
+
+def year(value):
+    if not (value.isdigit() and len(value) == 4):
+        raise argparse.ArgumentTypeError("expected a 4-digit year")
+    return value
+
+
+def run_id(value):
+    if value != "last" and not value.isdigit():
+        raise argparse.ArgumentTypeError("expected a run id or 'last'")
+    return value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="psz batch", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("terms_files", nargs="*", metavar="TERMS_FILE",
+                        help="Files with one search term per line; '-' or nothing reads stdin")
+    parser.add_argument("-t", "--term", action="append", default=[], help="A search term (repeatable)")
+    parser.add_argument("--config", default="config.yaml", help="YAML configuration file (default: config.yaml)")
+    parser.add_argument("-o", "--output", help="Append the JSON records to this file instead of stdout")
+    parser.add_argument("--quiet", action="store_true", help="Discard the progress log instead of writing it to stderr")
+    parser.add_argument("--resume", nargs="?", const="last", type=run_id, metavar="RUN_ID",
+                        help="Resume a run from the job journal (default: the last unfinished one) with its own "
+                             "terms and search options, skipping what it already did")
+    parser.add_argument("--no-journal", action="store_true", help="Don't record the run in the job journal")
+
+    search = parser.add_argument_group("search")
+    search.add_argument("--sources", type=source_list, default=list(SOURCES),
+                        help=f"Comma-separated sources to search (default: {','.join(SOURCES)})")
+    search.add_argument("--min-year", type=year, help="Oldest publication year to search from")
+    search.add_argument("--max-searches", type=int, default=50, help="Google Scholar results per term (default: 50)")
+    search.add_argument("--budget", type=int, help="Stop querying SerpApi after this many requests (credits)")
+    search.add_argument("--chunk-size", type=int, default=50,
+                        help="Terms searched before their results are uploaded (default: 50)")
+
+    concurrency = parser.add_argument_group("concurrency")
+    concurrency.add_argument("--resolve-workers", type=int, help="Scholar results resolved to DOIs at the same time")
+    concurrency.add_argument("--download-workers", type=int, help="PDFs downloaded at the same time")
+    concurrency.add_argument("--sequential", action="store_true", help="Query the sources of a term one after another")
+    concurrency.add_argument("--source-timeout", type=float, help="Seconds to wait for each source of a term")
+    concurrency.add_argument("--processes", type=int,
+                             help="Worker processes to spread searching, citation building and PDF downloads over")
+
+    zotero = parser.add_argument_group("zotero")
+    zotero.add_argument("--download-dest", help="Directory for downloaded PDFs")
+    zotero.add_argument("--no-pdf", action="store_true", help="Only create citations, don't download PDFs")
+    zotero.add_argument("--no-lib", action="store_true",
+                        help="Don't load the Zotero library first (faster, but duplicates are only caught by DOI within the run)")
+    return parser
+
+
+def run_batch(args, sink):
+    """
+    Search every term and upload the results chunk by chunk, so records keep streaming
+    during long runs and an interrupted run has already uploaded its earlier chunks.
+
+    Returns:
+    - int: Exit status, 0 if every chunk completed.
+    """
+    try:
+        from .pyserpZotero import SerpZot
+    except ImportError:
+        from pyserpZotero import SerpZot
+
+    serp_zot = SerpZot(config_path=args.config)
+    serp_zot.event_sink = sink
+    if args.no_journal:
+        serp_zot.journal = None
+    journal = serp_zot.journal
+
+    if args.resume is not None:
+        run = journal.get_run(None if args.resume == "last" else int(args.resume)) if journal is not None else None
+        if run is None:
+            print("There is no run to resume: the job journal is disabled" if journal is None
+                  else f"There is no {'unfinished run' if args.resume == 'last' else f'run {args.resume}'} in the job journal")
+            serp_zot.emit("error", error="nothing to resume")
+            return 1
+        run_id, terms, params = run["id"], run["terms"], run["params"]
+        print(f"Resuming run {run_id}: {journal.stage_counts(run_id)}")
+    else:
+        terms  = read_terms(args.terms_files or (["-"] if not args.term else []), args.term)
+        for term in [term for term in terms if len(term) < 3]:
+            serp_zot.emit("term", term=term, status="skipped", reason="shorter than 3 characters")
+        terms  = [term for term in terms if len(term) >= 3]
+        params = dict(min_year=args.min_year or "", download_sources={source: 1 for source in args.sources},
+                      max_searches=args.max_searches, download_lib=not args.no_lib,
+                      concurrent=not args.sequential, source_timeout=args.source_timeout)
+        run_id = journal.start_run(terms, params) if journal is not None else None
+        if run_id is not None:
+            print(f"Started run {run_id}; resume it with psz batch --resume {run_id}")
+
+    if args.budget is not None:
+        serp_zot.SERP_BUDGET = args.budget
+    if args.resolve_workers:
+        serp_zot.RESOLVE_WORKERS = args.resolve_workers
+    if args.download_workers:
+        serp_zot.DOWNLOAD_WORKERS = args.download_workers
+    if args.download_dest:
+        serp_zot.DOWNLOAD_DEST = args.download_dest
+    if args.no_pdf:
+        serp_zot.enable_pdf_download = False
+    if args.processes:
+        serp_zot.WORKER_PROCESSES = args.processes
+
+    chunk_size = max(1, args.chunk_size)
+    status     = 0
+    start      = time.time()
+    print(f"Batch of {len(terms)} terms in chunks of {chunk_size}")
+    budget_spent = False
+    try:
+        for first in range(0, len(terms), chunk_size):
+            chunk = terms[first:first + chunk_size]
+            try:
+                serp_zot.batch_search2zotero(chunk, run_id=run_id, **params)
+            except Exception as e:
+                print(f"Chunk starting at term {first + 1} failed: {e}")
+                serp_zot.emit("error", terms=chunk, error=str(e))
+                status = 1
+            # Later chunks would only find the budget used up too
+            budget_spent = serp_zot.serp_budget_spent()
+            if budget_spent:
+                rest = terms[first + chunk_size:]
+                print(f"The SerpApi budget of {serp_zot.SERP_BUDGET} requests is used up, {len(rest)} terms left unsearched")
+                for term in rest:
+                    serp_zot.emit("term", term=term, status="budget_exhausted", reason="not searched")
+                break
+    finally:
+        serp_zot.close_workers()
+    # A run with a failed chunk, or cut short by the SerpApi budget, stays unfinished so --resume picks it up
+    if run_id is not None and status == 0 and not budget_spent:
+        journal.finish_run(run_id)
+
+    counts = {f"{event}.{record_status}" if record_status else event: count
+              for (event, record_status), count in sorted(sink.counts.items(), key=str)}
+    serp_zot.emit("summary", run_id=run_id, terms=len(terms), serp_requests=serp_zot.serp_requests,
+                  budget_exhausted=budget_spent, seconds=round(time.time() - start, 3), counts=counts)
+    return status
+
+
+def batch_main(argv=None):
+    """
+    Entry point of `psz batch`. The JSON records go to stdout (or --output) and
+    everything the pipeline prints goes to stderr, so stdout can be piped as is.
+    """
+    try:
+        from .utils.events import JsonlSink
+    except ImportError:
+        from utils.events import JsonlSink
+
+    args   = build_parser().parse_args(argv)
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    log    = open(os.devnull, "w") if args.quiet else sys.stderr
+    try:
+        with redirect_stdout(log):
+            return run_batch(args, JsonlSink(output))
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        return 130
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if log is not sys.stderr:
+            log.close()
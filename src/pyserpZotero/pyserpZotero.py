@@ -2,19 +2,42 @@
 
 # Libraries
 try:
-    from .utils.arxiv_helpers import arxiv_download
+    from .utils.arxiv_helpers import arxiv_download, set_partial_dir
+    from .utils.helpers import cleanZot
     from .ui.colors import *
     from .utils.pdf_downloader import *
     from .utils.process_and_upload import *
     from .utils.search_scholar import *
     from .utils.search2zotero import *
+    from .utils.cache import SqliteCache
+    from .utils.search_scholar import SERP_CACHE_MODES
+    from .utils.library_snapshot import LibrarySnapshot
+    from .utils.pdf_store import PdfStore
+    from .utils.rate_limit import get_scheduler
+    from .utils import endpoints
+    from .utils.metrics import export_metrics, serve_metrics
+    from .utils.events import emit
+    from .utils.journal import JobJournal
+    from .utils.workers import start_workers, close_workers
 except ImportError:
-    from utils.arxiv_helpers import arxiv_download
+    from utils.arxiv_helpers import arxiv_download, set_partial_dir
+    from utils.helpers import cleanZot
     from ui.colors import *
     from utils.pdf_downloader import *
     from utils.process_and_upload import *
     from utils.search_scholar import *
     from utils.search2zotero import *
+    from utils.cache import SqliteCache
+    from utils.search_scholar import SERP_CACHE_MODES
+    from utils.library_snapshot import LibrarySnapshot
+    from utils.pdf_store import PdfStore
+    from utils.rate_limit import get_scheduler
+    from utils import endpoints
+    from utils.metrics import export_metrics, serve_metrics
+    from utils.events import emit
+    from utils.journal import JobJournal
+    from utils.workers import start_workers, close_workers
+import os
 import threading
 from box import Box
 
@@ -29,8 +52,19 @@ class SerpZot:
     - zot_key (str): API key for accessing Zotero services.
     - download_dest (str): Default directory for downloading PDFs.
     - enable_pdf_download (bool): Flag to enable or disable automatic PDF downloads.
+    - resolve_workers (int): Number of Google Scholar results resolved to DOIs at the same time.
+    - cache_dir (str): Directory for on-disk caches such as the DOI to BibTeX cache.
+    - download_workers (int): Number of PDFs downloaded at the same time.
+    - pdf_hedge_delay (float): Seconds to wait on a PDF source before also trying the next one;
+      0 tries all sources at once and None tries them strictly one after another.
+    - pdf_download_timeout (float): Seconds all PDF sources of a paper get in all; None waits for the slowest.
+    - config_path (str): The YAML configuration file to read.
+    - worker (bool): Set up only what a worker process needs to search, build citations and download
+      PDFs: no metrics server, library snapshot or job journal.
     """
-    def __init__(self, serp_api_key="", zot_id="", zot_key="", download_dest=".", enable_pdf_download=True, enable_lib_download=True):
+    def __init__(self, serp_api_key="", zot_id="", zot_key="", download_dest=".", enable_pdf_download=True, enable_lib_download=True,
+                 resolve_workers=8, cache_dir=".pyserpZotero_cache", download_workers=4, pdf_hedge_delay=2.0,
+                 pdf_download_timeout=120.0, config_path="config.yaml", worker=False):
         """
         Instantiate a SerpZot object for API management.
 
@@ -38,7 +72,7 @@ class SerpZot:
             so code doesn't look like PEP dog poo.
         """
         # Member attributes
-        self.df           = pd.DataFrame()
+        self.df           = None
         self.FIELD        = "title"
         self.DOI_HOLDER   = set()
         self.SERP_API_KEY = ""
@@ -51,25 +85,78 @@ class SerpZot:
         self.downloadAttachment = dict()
         self.lock = threading.Lock()
         self.SAVE_BIB = False
+        self.RESOLVE_WORKERS = 0
+        self.ZOTERO_BATCH_SIZE = 50
+        self.DOWNLOAD_WORKERS = 0
+        self.DOWNLOAD_QUEUE_SIZE = 100
+        self.download_queue = None
+        self.PDF_HEDGE_DELAY = None
+        self.PDF_DOWNLOAD_TIMEOUT = None
+        self.CACHE_DIR = ""
+        self.doi_cache = None
+        self.serp_cache = None
+        self.SERP_CACHE_MODE = "off"
+        self.library_snapshot = None
+        self.library = None
+        self.pdf_store = None
+        self.title_index = None
+        self.FUZZY_DEDUPE_THRESHOLD = 0.8
+        self.METRICS_PATH = None
+        self.SERP_BUDGET  = None
+        self.serp_requests = 0
+        self.event_sink   = None
+        self.journal      = None
+        self.run_id       = None
+        self.resumed_uploads = dict()
+        self.WORKER_PROCESSES = 1
+        self.workers      = None
+        self.config_path  = config_path
 
         # Member functions
         SerpZot.processBibsAndUpload = processBibsAndUpload
+        SerpZot.build_citation = build_citation
+        SerpZot.built_citations = built_citations
+        SerpZot.admit_citation = admit_citation
+        SerpZot.fetch_bib = fetch_bib
+        SerpZot.upload_citations = upload_citations
+        SerpZot.recover_citations = recover_citations
+        SerpZot.record_citation = record_citation
+        SerpZot.fail_citations = fail_citations
         SerpZot.search_scholar = search_scholar
         SerpZot.search2zotero = search2zotero
+        SerpZot.load_library = load_library
+        SerpZot.batch_search2zotero = batch_search2zotero
+        SerpZot.search_term = search_term
+        SerpZot.start_workers = start_workers
+        SerpZot.close_workers = close_workers
+        SerpZot.resume_search2zotero = resume_search2zotero
         SerpZot.serpSearch = serpSearch
+        SerpZot.iter_scholar_pages = iter_scholar_pages
+        SerpZot.resolveResultId = resolveResultId
+        SerpZot.serp_request = serp_request
+        SerpZot.serp_budget_spent = serp_budget_spent
         SerpZot.searchArxiv = searchArxiv
         SerpZot.boiArxivSearch = boiArxivSearch
         SerpZot.searchMedArxiv = searchMedArxiv
         SerpZot.search_scholar = search_scholar
         SerpZot.search_scholar = search_scholar
         SerpZot.attempt_pdf_download = attempt_pdf_download
+        SerpZot.download_worker = download_worker
+        SerpZot.fetch_pdf = fetch_pdf
+        SerpZot.attach_pdf = attach_pdf
+        SerpZot.download_worker_count = download_worker_count
+        SerpZot.queue_download = queue_download
+        SerpZot.finish_downloads = finish_downloads
         SerpZot.arxiv_download = arxiv_download
+        SerpZot.cleanZot = cleanZot
+        SerpZot.export_metrics = export_metrics
+        SerpZot.emit = emit
 
         # Override default values with values from config.yaml
-        config = Box.from_yaml(filename="config.yaml")
+        config = Box.from_yaml(filename=config_path)
 
         if not self.SERP_API_KEY:
-            config            = Box.from_yaml(filename="config.yaml")
+            config            = Box.from_yaml(filename=config_path)
             self.SERP_API_KEY = config.get('SERP_API_KEY', serp_api_key)
         if not self.ZOT_ID:
             self.ZOT_ID  = config.get('ZOT_ID', zot_id)
@@ -79,11 +166,79 @@ class SerpZot:
             self.DOWNLOAD_DEST = config.get('DOWNLOAD_DEST', download_dest)
         if not self.enable_pdf_download:
             self.enable_pdf_download = config.get('ENABLE_PDF_DOWNLOAD', enable_pdf_download)
+        if not self.RESOLVE_WORKERS:
+            self.RESOLVE_WORKERS = config.get('RESOLVE_WORKERS', resolve_workers)
+        if not self.DOWNLOAD_WORKERS:
+            self.DOWNLOAD_WORKERS = config.get('DOWNLOAD_WORKERS', download_workers)
+        self.PDF_HEDGE_DELAY = config.get('PDF_HEDGE_DELAY', pdf_hedge_delay)
+        self.PDF_DOWNLOAD_TIMEOUT = config.get('PDF_DOWNLOAD_TIMEOUT', pdf_download_timeout)
+        self.FUZZY_DEDUPE_THRESHOLD = config.get('FUZZY_DEDUPE_THRESHOLD', self.FUZZY_DEDUPE_THRESHOLD)
+        if not self.CACHE_DIR:
+            self.CACHE_DIR = config.get('CACHE_DIR', cache_dir)
+        # Cap on SerpApi requests (credits) per SerpZot; None means no cap
+        self.SERP_BUDGET = config.get('SERP_BUDGET', None)
+        # Local processes that batch runs spread searching, citation building and PDF downloads over
+        self.WORKER_PROCESSES = int(config.get('WORKER_PROCESSES', self.WORKER_PROCESSES) or 1)
 
-        print("\nFriendly reminder: Make sure your Zotero key has write permissions. I'm not saying it doesn't, but I can't check it for you.\n")
+        # Per-host request pacing shared by every thread; RATE_LIMITS overrides the defaults
+        get_scheduler().configure(config.get('RATE_LIMITS', None) or {})
+        # Services can be pointed at mirrors, proxies or local stubs with ENDPOINTS
+        endpoints.configure(config.get('ENDPOINTS', None) or {})
 
+        # Per-stage timings and PDF source hit rates: JSON at the end of a run, Prometheus while running
+        self.METRICS_PATH = config.get('METRICS_PATH', None)
+        if config.get('METRICS_PORT') and not worker:
+            serve_metrics(int(config.get('METRICS_PORT')))
+
+        # DOI -> BibTeX cache, so repeat runs skip the network for DOIs seen before
+        if config.get('ENABLE_DOI_CACHE', True):
+            ttl_days = config.get('DOI_CACHE_TTL_DAYS', 90)
+            self.doi_cache = SqliteCache(os.path.join(self.CACHE_DIR, "doi_cache.sqlite3"),
+                                         ttl=ttl_days * 86400 if ttl_days else None,
+                                         max_entries=config.get('DOI_CACHE_MAX_ENTRIES', 100000))
+
+        # SerpApi responses keyed by query, so repeated or overlapping searches cost no credits
+        self.SERP_CACHE_MODE = str(config.get('SERP_CACHE_MODE', "on")).lower()
+        if self.SERP_CACHE_MODE not in SERP_CACHE_MODES:
+            print(f"Unknown SERP_CACHE_MODE {self.SERP_CACHE_MODE!r}, expected one of {', '.join(SERP_CACHE_MODES)}; using 'on'")
+            self.SERP_CACHE_MODE = "on"
+        if self.SERP_CACHE_MODE != "off":
+            ttl_days = config.get('SERP_CACHE_TTL_DAYS', 7)
+            # Replayed responses are fixtures and never expire
+            self.serp_cache = SqliteCache(config.get('SERP_CACHE_PATH', os.path.join(self.CACHE_DIR, "serp_cache.sqlite3")),
+                                          ttl=ttl_days * 86400 if ttl_days and self.SERP_CACHE_MODE != "replay" else None,
+                                          max_entries=config.get('SERP_CACHE_MAX_ENTRIES', 20000))
+
+        # Local copy of the Zotero library, synced incrementally via its library version
+        if config.get('ENABLE_LIBRARY_SNAPSHOT', True) and not worker:
+            self.library_snapshot = LibrarySnapshot(os.path.join(self.CACHE_DIR, f"library_{self.ZOT_ID}.json"))
+
+        # Every batch run and how far each of its DOIs got, so an interrupted run can be resumed
+        if config.get('ENABLE_JOURNAL', True) and not worker:
+            self.journal = JobJournal(config.get('JOURNAL_PATH', os.path.join(self.CACHE_DIR, "journal.sqlite3")))
+
+        # Interrupted PDF downloads are kept here, whatever directory they were downloading into, and resumed
+        set_partial_dir(config.get('PARTIAL_PDF_DIR', os.path.join(self.CACHE_DIR, "partial_pdfs")))
+
+        # Downloaded PDFs are kept by content hash so they are never fetched or uploaded twice
+        if config.get('ENABLE_PDF_STORE', True):
+            self.pdf_store = PdfStore(config.get('PDF_STORE_DIR', os.path.join(self.DOWNLOAD_DEST or ".", ".pdf_store")))
+
+        if not worker:
+            print("\nFriendly reminder: Make sure your Zotero key has write permissions. I'm not saying it doesn't, but I can't check it for you.\n")
+
+
+def main(argv=None):
+    import sys
+    argv = sys.argv[1:] if argv is None else argv
+    # `psz batch ...` runs headless; plain `psz` stays interactive
+    if argv and argv[0] == "batch":
+        try:
+            from .batch import batch_main
+        except ImportError:
+            from batch import batch_main
+        return batch_main(argv[1:])
 
-def main():
     import yaml
     from pathlib import Path
 
@@ -179,6 +334,9 @@ def main():
     if config.get("NO_MEDARXIV"):
         del downloadSources["medArxiv"]
 
+    concurrent_search = config.get("CONCURRENT_SEARCH", True)
+    source_timeout    = config.get("SOURCE_TIMEOUT", None)
+
     while True:
         min_year = input("Enter the oldest year to search from (leave empty if none): ")
         if min_year == "":
@@ -221,20 +379,15 @@ def main():
         
     terms = terms_copy
     
-    for term in terms:
-        
-        # Proceed with using 'term' for Google Scholar search
-        print(f"Searching Scholar for: {term}")
-
-        serp_zot = SerpZot(serp_api_key, zot_id, zot_key, download_dest, download_pdfs, enable_lib_download=download_lib)
-        serp_zot.search_scholar(term=term, min_year=min_year, download_sources = downloadSources, max_searches = max_searches)
-        serp_zot.search2zotero(query=term,
-                               download_lib=download_lib)
-
-        if download_pdfs:
-            print("Attempting to download PDFs...")
-        print("Done.")
+    # One SerpZot for all terms, so the library is synced once and each DOI is resolved once
+    serp_zot = SerpZot(serp_api_key, zot_id, zot_key, download_dest, download_pdfs, enable_lib_download=download_lib)
+    try:
+        serp_zot.batch_search2zotero(terms, min_year=min_year, download_sources=downloadSources, max_searches=max_searches,
+                                     download_lib=download_lib, concurrent=concurrent_search, source_timeout=source_timeout)
+    finally:
+        serp_zot.close_workers()
+    print("Done.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    raise SystemExit(main())
\ No newline at end of file
@@ -1,14 +1,230 @@
 # utils/arxiv_helpers.py
-from .helpers import get_cosine, text_to_vector
-import arxiv
+from .endpoints import arxiv_client, zotero_client
+from .helpers import TitleMatcher
+from .http_session import get_session
+from .metrics import get_metrics
+from contextlib import contextmanager
+import hashlib
 import os
 import re
 import requests
+import shutil
 import tempfile
-from pyzotero import zotero
+import threading
+import time
 import string
 
-# Assuming your download function looks something like this
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# DOIs arXiv registers for its own papers, e.g. 10.48550/arXiv.2101.00001
+ARXIV_DOI = re.compile(r'^10\.48550/arxiv\.(.+)$', re.IGNORECASE)
+
+# Every PDF starts with these bytes; anything else is an error or landing page
+PDF_MAGIC  = b"%PDF"
+CHUNK_SIZE = 64 * 1024
+
+# Seconds the PDF sources of a paper get in all before the ones still running are cancelled
+PDF_DOWNLOAD_TIMEOUT = 120
+
+
+# Where interrupted downloads are kept until they are resumed; set_partial_dir sets it
+PARTIAL_DIR = None
+
+# Partial downloads not resumed for this long are deleted
+PARTIAL_MAX_AGE = 7 * 86400
+
+
+def set_partial_dir(directory, max_age=PARTIAL_MAX_AGE):
+    """
+    Keep partial downloads in directory, and delete the ones older than max_age seconds.
+    """
+    global PARTIAL_DIR
+    try:
+        os.makedirs(directory, exist_ok=True)
+        for entry in os.scandir(directory):
+            if entry.name.endswith((".part", ".lock")) and time.time() - entry.stat().st_mtime > max_age:
+                os.remove(entry.path)
+    except OSError as e:
+        print(f"Could not use {directory} for partial downloads: {e}")
+        return
+    PARTIAL_DIR = directory
+
+
+def partial_path(path, url):
+    """
+    The file a download of url into path is staged in. It is keyed by URL so a
+    transfer is only ever resumed from the server it started on. With a PARTIAL_DIR
+    it lives there rather than next to path, so a later attempt resumes it even if it
+    downloads into another (e.g. temporary or staging) directory.
+    """
+    key = hashlib.sha1(url.encode()).hexdigest()
+    if PARTIAL_DIR:
+        return os.path.join(PARTIAL_DIR, f"{key}.part")
+    return f"{path}.{key[:12]}.part"
+
+
+def lock_partial(part):
+    """
+    Take the lock next to a partial file without waiting, so no other thread or process
+    appends to it at the same time.
+
+    Returns:
+    - file or None: The open lock file to pass to unlock_partial, or None if it is taken.
+    """
+    lock_path = part + ".lock"
+    while True:
+        lock = open(lock_path, "a")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock.close()
+            return None
+        try:
+            # The holder before us may have removed the lock file between our open and flock
+            if os.path.samestat(os.fstat(lock.fileno()), os.stat(lock_path)):
+                return lock
+        except FileNotFoundError:
+            pass
+        lock.close()
+
+
+def unlock_partial(lock):
+    # Remove the lock file while still holding it, so nobody locks a file that is about to go
+    try:
+        os.remove(lock.name)
+    except OSError:
+        pass
+    lock.close()
+
+
+@contextmanager
+def claimed_partial(path, url):
+    """
+    The partial file to download url into path through, locked for this download.
+    While another download of the same URL holds it, a private partial file is used
+    instead and removed afterwards.
+    """
+    part = partial_path(path, url)
+    lock = lock_partial(part)
+    if lock is None:
+        print(f"{url} is already being downloaded, not resuming it")
+        part = f"{part[:-len('.part')]}.{os.getpid()}-{threading.get_ident()}.part"
+        if os.path.isfile(part):
+            os.remove(part)
+        try:
+            yield part
+        finally:
+            if os.path.isfile(part):
+                os.remove(part)
+        return
+    try:
+        yield part
+    finally:
+        unlock_partial(lock)
+
+
+def save_pdf_response(response, path, offset=0, part=None, cancel=None):
+    """
+    Stream a PDF response to disk in chunks and move it into place once complete.
+
+    The data goes to a ".part" file first, so an interrupted transfer can be resumed
+    later. The first chunk of a new download must start with the PDF magic bytes,
+    so HTML error pages are rejected before anything is written.
+
+    Parameters:
+    - response: A streaming requests response for the PDF (or the rest of it).
+    - path (str): The file path where the PDF should be saved.
+    - offset (int): Bytes already in the .part file that this response continues from.
+    - part (str, optional): The .part file to write to, by default the one for the response URL;
+      see claimed_partial for one no other download writes to.
+    - cancel (threading.Event, optional): Stop and drop the download as soon as it is set.
+
+    Returns:
+    - bool: True if a complete PDF was saved at path, False otherwise.
+    """
+    part   = part or partial_path(path, response.url)
+    chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+    first  = next(chunks, b"")
+    if offset == 0 and not first.lstrip()[:len(PDF_MAGIC)] == PDF_MAGIC:
+        print(f"Not a PDF: {response.url}")
+        return False
+
+    with open(part, "ab" if offset else "wb") as f:
+        f.write(first)
+        for chunk in chunks:
+            if cancel is not None and cancel.is_set():
+                # Another source already won; close the connection instead of reading the rest
+                break
+            f.write(chunk)
+    if cancel is not None and cancel.is_set():
+        response.close()
+        if os.path.isfile(part):
+            os.remove(part)
+        return False
+
+    # The partial directory may be on another file system than path
+    shutil.move(part, path)
+    return True
+
+
+def stream_pdf(url, path, cancel=None):
+    """
+    Download a PDF to path without holding it in memory, resuming a previous partial
+    download with an HTTP Range request when the server supports it.
+
+    Parameters:
+    - url (str): The URL of the PDF.
+    - path (str): The file path where the PDF should be saved.
+    - cancel (threading.Event, optional): Give up as soon as it is set.
+
+    Returns:
+    - bool: True if the PDF was successfully downloaded and saved, False otherwise.
+    """
+    if cancel is not None and cancel.is_set():
+        return False
+    try:
+        with claimed_partial(path, url) as part:
+            return resume_pdf(url, path, part, cancel)
+    except OSError as e:
+        print(f"Failed to download PDF from {url}: {e}")
+        return False
+
+
+def resume_pdf(url, path, part, cancel=None):
+    """
+    Download url into path through the partial file part, continuing from what it already holds.
+    """
+    offset  = os.path.getsize(part) if os.path.isfile(part) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    try:
+        with get_session().get(url, headers=headers, stream=True) as response:
+            if response.status_code == 206:
+                # Only append if the server continues exactly where the partial file ends
+                content_range = response.headers.get("Content-Range", "")
+                if not content_range.startswith(f"bytes {offset}-"):
+                    os.remove(part)
+                    return resume_pdf(url, path, part, cancel)
+                return save_pdf_response(response, path, offset, part, cancel)
+            if response.status_code == 416 and offset:
+                # Nothing left to fetch or a stale partial file; start over
+                os.remove(part)
+                return resume_pdf(url, path, part, cancel)
+            if response.status_code != 200:
+                return False
+            # A plain 200 means the server ignored the Range header and sent everything
+            return save_pdf_response(response, path, part=part, cancel=cancel)
+    except (requests.RequestException, OSError) as e:
+        print(f"Failed to download PDF from {url}: {e}")
+        return False
+
+
 def download_pdf(url):
     """
     Download a PDF from a given URL.
@@ -19,38 +235,39 @@ def download_pdf(url):
     Returns:
     - str or None: The file path to the downloaded PDF if successful, None otherwise.
     """
-    response = requests.get(url)
-    if response.status_code == 200 and 'application/pdf' in response.headers.get('Content-Type', ''):
-        # Use NamedTemporaryFile to automatically handle the file creation
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_file.write(response.content)
-        temp_file.close()
+    # Use NamedTemporaryFile to automatically handle the file creation
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+    temp_file.close()
+    if stream_pdf(url, temp_file.name):
         return temp_file.name
+    os.remove(temp_file.name)
     return None
 
 
-def download_response(response, path, server="se"):
+def download_response(response, path, server="se", cancel=None):
     """
     Handle the response from a PDF download attempt, saving the file if successful.
 
     Parameters:
-    - response: The response object from the download attempt.
+    - response: The streaming response object from the download attempt.
     - path (str): The file path where the PDF should be saved.
     - server (str): Identifier for the PDF source server, default is "se" for Sci-Hub.se.
+    - cancel (threading.Event, optional): Give up as soon as it is set.
 
     Returns:
     - bool: True if the PDF was successfully downloaded and saved, False otherwise.
     """
     try:
-        if response.headers.get('content-type') == "application/pdf":
-            with open(path, "wb") as f:
-                f.write(response.content)
-            return True
-        elif "application/pdf" in response.text:
-            location = re.findall('src=".*\.pdf.*"', response.text)[0].split('"')[1].split('#')[0]
+        with response:
+            if "application/pdf" in response.headers.get('content-type', ''):
+                with claimed_partial(path, response.url) as part:
+                    return save_pdf_response(response, path, part=part, cancel=cancel)
+            page = response.text
+        if "application/pdf" in page:
+            location = re.findall('src=".*\.pdf.*"', page)[0].split('"')[1].split('#')[0]
             
             # It also could be the absolute link present in sci-hub.
-            pdf_link = "https:" + re.findall('src=".*\.pdf.*"', response.text)[0].split('"')[1].split('#')[0]
+            pdf_link = "https:" + re.findall('src=".*\.pdf.*"', page)[0].split('"')[1].split('#')[0]
             
             if "sci-hub" not in location:
                 if server == "se":
@@ -58,11 +275,7 @@ def download_response(response, path, server="se"):
                 else:
                     pdf_link = "https://sci-hub.ru" + location
 
-            pdf_response = requests.get(pdf_link)
-            if pdf_response.headers.get('content-type') == "application/pdf":
-                with open(path, "wb") as pf:
-                    pf.write(pdf_response.content)
-                return True
+            return stream_pdf(pdf_link, path, cancel)
 
     except Exception as e:
         print(f"Failed to download PDF: {e}")
@@ -93,57 +306,58 @@ def ensure_download_dest_is_valid(download_dest):
     return download_dest
 
 
-def scihub_download(download_dest, doi):
+def scihub_download(download_dest, doi, cancel=None):
     """
     Attempt to download a PDF from Sci-Hub using a DOI.
 
     Parameters:
     - download_dest (str): The directory to save the downloaded PDF.
     - doi (str): The DOI of the document to download.
+    - cancel (threading.Event, optional): Give up as soon as it is set.
 
     Returns:
     - tuple: (bool, str) indicating success status and the file path to the downloaded PDF.
     """
     try:
         sci_hub_url = "https://sci-hub.se/" + doi
-        response    = requests.get(sci_hub_url)
+        response    = get_session().get(sci_hub_url, stream=True)
         name = doi.replace("/", "_") + ".pdf"
         path = os.path.join(download_dest, name)
-        return download_response(response, path, "se"), path
+        return download_response(response, path, "se", cancel), path
 
     except:
         try:
             sci_hub_url = "https://sci-hub.ru/"
             sci_hub_url += doi
 
-            response = requests.get(sci_hub_url)
+            response = get_session().get(sci_hub_url, stream=True)
 
             name = doi.replace("/", "_") + ".pdf"
             path = os.path.join(download_dest, name)
-            return download_response(response, path, "ru"), path
+            return download_response(response, path, "ru", cancel), path
 
         except:
             print("Article not on Sci-hub, moving on")
             return False, None
 
-def bioArxiv_download(download_dest, DOI):
+def bioArxiv_download(download_dest, DOI, cancel=None):
     # https://www.biorxiv.org/content/10.1101/2024.03.17.583882v1.full.pdf
     url = 'http://biorxiv.org/content/' + DOI + "v1.full.pdf"
-    response = requests.get(url, stream=True)
 
     name = DOI.replace("/", "_") + ".pdf"
     path = os.path.join(download_dest, name)
 
     # Write the PDF to the file
-    return download_response(response, path), path
+    return stream_pdf(url, path, cancel), path
 
-def medrxiv_download(download_dest, DOI):
+def medrxiv_download(download_dest, DOI, cancel=None):
     """
     Attempt to download a PDF from medRxiv using a DOI.
 
     Parameters:
     - download_dest (str): The directory to save the downloaded PDF.
     - DOI (str): The DOI of the document to download.
+    - cancel (threading.Event, optional): Give up as soon as it is set.
 
     Returns:
     - tuple: (bool, str) indicating success status and the file path to the downloaded PDF.
@@ -156,26 +370,240 @@ def medrxiv_download(download_dest, DOI):
         f"https://www.medrxiv.org/content/medrxiv/early/{DOI}v1.full.pdf"
     ]
     for url in urls_to_try:
+        name = DOI.replace("/", "_") + ".pdf"
+        path = os.path.join(download_dest, name)
+
+        # Write the PDF to the file
+        if stream_pdf(url, path, cancel):
+            print(f"Downloaded from medRxiv: {DOI}")
+            return True, path
+        if cancel is not None and cancel.is_set():
+            break
+
+        print(f"Attempt with URL {url} failed. Trying next URL if available.")
+
+    return False, ""
+
+def arxiv_title_download(download_dest, title, client=None, cancel=None):
+    """
+    Attempt to download a PDF from arXiv by searching for a closely matching title.
+
+    Parameters:
+    - download_dest (str): The directory to save the downloaded PDF.
+    - title (str): The title of the paper.
+    - client (arxiv.Client, optional): The arXiv client to search with.
+    - cancel (threading.Event, optional): Give up as soon as it is set.
+
+    Returns:
+    - tuple: (bool, str) indicating success status and the file path to the downloaded PDF.
+    """
+    import arxiv
+    client  = client or arxiv_client()
+    title   = string.capwords(title)
+    search  = arxiv.Search(query=f'ti:"{title}"', max_results=10, sort_by=arxiv.SortCriterion.Relevance)
+    results = list(client.results(search))
+    match, _ = TitleMatcher([result.title for result in results]).best_match(title)
+    if match is not None:
+        print(f"ArXiv match found for {title}: {results[match].entry_id}")
+        return download_arxiv_result(download_dest, results[match], cancel)
+    return False, None
+
+
+def download_arxiv_result(download_dest, result, cancel=None):
+    """
+    Download the PDF of an arXiv search result.
+
+    Parameters:
+    - download_dest (str): The directory to save the downloaded PDF.
+    - result (arxiv.Result): The paper to download.
+    - cancel (threading.Event, optional): Give up as soon as it is set.
+
+    Returns:
+    - tuple: (bool, str) indicating success status and the file path to the downloaded PDF.
+    """
+    pdf_path = os.path.join(download_dest, result.get_short_id().replace("/", "_") + ".pdf")
+    if stream_pdf(result.pdf_url, pdf_path, cancel):
+        return True, pdf_path
+    return False, None
+
+
+def arxiv_bulk_match(items, client=None, batch_size=20, threshold=.85):
+    """
+    Find arXiv papers for many Zotero items with as few arXiv API calls as possible.
+
+    Items with an arXiv DOI (10.48550/arXiv.<id>) are looked up by id, up to 100 per
+    request. The other titles are grouped batch_size at a time into one OR'ed title
+    query, and every result is matched back to the items with TitleMatcher.
+
+    Parameters:
+    - items (list): Zotero items to find arXiv papers for.
+    - client (arxiv.Client, optional): The arXiv client to search with.
+    - batch_size (int): Number of titles combined into one query.
+    - threshold (float): Minimum title similarity for a match.
+
+    Returns:
+    - dict: Zotero item key mapped to its matching arxiv.Result.
+    """
+    import arxiv
+    client  = client or arxiv_client()
+    matches = dict()
+
+    by_id, by_title = dict(), []
+    for item in items:
+        data  = item.get('data', {})
+        doi   = data.get('DOI', '') or ''
+        found = ARXIV_DOI.match(doi.strip())
+        if found:
+            by_id[found.group(1).lower()] = item['key']
+        elif data.get('title'):
+            by_title.append(item)
+
+    ids = list(by_id)
+    for start in range(0, len(ids), 100):
+        chunk = ids[start:start + 100]
+        try:
+            for result in client.results(arxiv.Search(id_list=chunk, max_results=len(chunk))):
+                short_id = re.sub(r'v\d+$', '', result.get_short_id()).lower()
+                if short_id in by_id:
+                    matches[by_id[short_id]] = result
+        except Exception as e:
+            print(f"arXiv id lookup failed: {e}")
+
+    for start in range(0, len(by_title), batch_size):
+        batch  = by_title[start:start + batch_size]
+        titles = [string.capwords(item['data']['title']) for item in batch]
+        query  = " OR ".join('ti:"' + title.replace('"', '') + '"' for title in titles)
         try:
-            response = requests.get(url, stream=True)
+            results = list(client.results(arxiv.Search(query=query, max_results=5 * len(batch),
+                                                       sort_by=arxiv.SortCriterion.Relevance)))
+        except Exception as e:
+            print(f"arXiv title lookup failed: {e}")
+            continue
+        matcher = TitleMatcher([result.title for result in results])
+        for item, title in zip(batch, titles):
+            match, _ = matcher.best_match(title, threshold)
+            if match is not None:
+                matches[item['key']] = results[match]
+
+    print(f"Matched {len(matches)} of {len(items)} library items on arXiv.")
+    return matches
+
+
+def try_pdf_source(name, download, *args):
+    """
+    Call one PDF source and record whether it had the paper.
+
+    Parameters:
+    - name (str): The source, as reported in the metrics.
+    - download (function): The source's download function, e.g. scihub_download.
+    - args: Passed on to download.
+
+    Returns:
+    - tuple: (bool, str) as returned by download.
+    """
+    start = time.perf_counter()
+    try:
+        downloaded, path = download(*args)
+    except Exception:
+        get_metrics().pdf_attempt(name, "error", time.perf_counter() - start)
+        raise
+    get_metrics().pdf_attempt(name, "hit" if downloaded else "miss", time.perf_counter() - start)
+    return downloaded, path
 
-            # Check if the response is successful and content type is PDF
-            if response.status_code == 200 and 'application/pdf' in response.headers.get('Content-Type', ''):
-                name = DOI.replace("/", "_") + ".pdf"
-                path = os.path.join(download_dest, name)
 
-                # Write the PDF to the file
-                with open(path, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+def race_pdf_sources(sources, download_dest, hedge_delay=None, timeout=PDF_DOWNLOAD_TIMEOUT):
+    """
+    Try several PDF sources and keep the first PDF that arrives.
+
+    With hedge_delay=None the sources are tried one after another. Otherwise the next
+    source is started as soon as every running one has missed, or once hedge_delay
+    seconds have passed without a PDF, so 0 starts them all at once. Each source downloads
+    into its own staging directory; the winner is moved into download_dest, and the other
+    sources are cancelled so they close their connections instead of finishing their PDF.
+    When no PDF has arrived timeout seconds after the race started, every source still
+    running is cancelled and the race is lost.
 
-                print(f"Downloaded from medRxiv: {DOI}")
-                return True, path
+    Parameters:
+    - sources (list): (name, function) pairs; function(dest, cancel) returns (bool, path) like
+      scihub_download, and gives up once the threading.Event cancel is set.
+    - download_dest (str): The directory to save the winning PDF in.
+    - hedge_delay (float, optional): Seconds to wait on running sources before starting the next.
+    - timeout (float, optional): Seconds to wait for a PDF in all; None waits for the slowest source.
 
+    Returns:
+    - tuple: (bool, str) indicating success status and the file path to the downloaded PDF.
+    """
+    if not sources:
+        return False, None
+
+    staging = tempfile.mkdtemp(prefix=".pdf-race-", dir=download_dest)
+    cond    = threading.Condition()
+    cancel  = threading.Event()
+    state   = {"running": 0, "winner": None}
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def remaining(wait=None):
+        # Seconds to wait for, the sooner of wait and the deadline
+        if deadline is None:
+            return wait
+        left = max(0.0, deadline - time.monotonic())
+        return left if wait is None else min(wait, left)
+
+    def settled():
+        return state["winner"] is not None or state["running"] == 0
+
+    def attempt(name, download, source_dir):
+        start  = time.perf_counter()
+        failed = False
+        try:
+            downloaded, path = download(source_dir, cancel)
         except Exception as e:
-            print(f"Attempt with URL {url} failed with error: {e}. Trying next URL if available.")
+            if not cancel.is_set():  # Losers fail once their staging directory is gone
+                print(f"{name} download failed: {e}")
+            downloaded, path, failed = False, None, True
+        with cond:
+            if cancel.is_set():
+                # Another source won or the race timed out
+                outcome = "late" if downloaded else "cancelled"
+            elif downloaded and path and os.path.isfile(path):
+                final_path = os.path.join(download_dest, os.path.basename(path))
+                os.replace(path, final_path)
+                state["winner"] = final_path
+                cancel.set()
+                outcome = "hit"
+                print(f"Downloaded from {name}")
+            else:
+                outcome = "error" if failed else "miss"
+            state["running"] -= 1
+            cond.notify_all()
+        get_metrics().pdf_attempt(name, outcome, time.perf_counter() - start)
+
+    try:
+        for n, (name, download) in enumerate(sources):
+            with cond:
+                if n:
+                    cond.wait_for(settled, timeout=remaining(hedge_delay))
+                if state["winner"] is not None or remaining() == 0:
+                    break
+                state["running"] += 1
+            print(f"Trying {name}...")
+            source_dir = os.path.join(staging, str(n))
+            os.makedirs(source_dir)
+            threading.Thread(target=attempt, args=(name, download, source_dir), daemon=True).start()
+
+        with cond:
+            cond.wait_for(settled, timeout=remaining())
+            winner = state["winner"]
+            if winner is None and state["running"]:
+                print(f"No PDF after {timeout} seconds, giving up on the sources still running")
+    finally:
+        # Sources still running stop at their next chunk and lose their staging directory
+        with cond:
+            cancel.set()
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return winner is not None, winner
 
-    return False, ""
 
 def arxiv_download(self, doi=None, items=None, download_dest=".", full_lib=False, title=None):
     """
@@ -194,80 +622,64 @@ def arxiv_download(self, doi=None, items=None, download_dest=".", full_lib=False
     print("Trying to download via arXiv...")
     downloaded = False
     download_dest = ensure_download_dest_is_valid(download_dest)
-    client = arxiv.Client()  # Instantiate the arXiv client
+    client = arxiv_client()  # Instantiate the arXiv client
 
     try:
         if not full_lib:
+            sources = []
             if title:
-                title = string.capwords(title)
-                vector1 = text_to_vector(title)
-                search = arxiv.Search(query=f'ti:"{title}"', max_results=10, sort_by=arxiv.SortCriterion.Relevance)
-                for result in client.results(search):
-                    vector2 = text_to_vector(result.title)
-                    cosine = get_cosine(vector1, vector2)
-                    if cosine > .85:
-                        print(f"ArXiv match found for {title}: {result.entry_id}")
-                        pdf_name = result.download_pdf(dirpath=download_dest)
-                        pdf_path = os.path.join(download_dest, pdf_name)
-                        downloaded = True
-                        return downloaded, pdf_path
-                # Attempt alternative downloads if no arXiv match is found
-                if not downloaded:
-                    print("Trying Sci-hub...")
-                    downloaded, pdf_path = scihub_download(download_dest, doi)
-                    if downloaded:
-                        return downloaded, pdf_path
-                if not downloaded:
-                    print("Trying medArxiv...")
-                    downloaded, pdf_path = medrxiv_download(download_dest, doi)
-                    if downloaded:
-                        return downloaded, pdf_path
-                if not downloaded:
-                    print("Trying bioArxiv...")
-                    downloaded, pdf_path = bioArxiv_download(download_dest, doi)
-                    if downloaded:
-                        return downloaded, pdf_path
+                sources.append(("arXiv", lambda dest, cancel: arxiv_title_download(dest, title, client, cancel)))
+            if doi:
+                sources.append(("Sci-hub", lambda dest, cancel: scihub_download(dest, doi, cancel)))
+                sources.append(("medArxiv", lambda dest, cancel: medrxiv_download(dest, doi, cancel)))
+                sources.append(("bioArxiv", lambda dest, cancel: bioArxiv_download(dest, doi, cancel)))
+            hedge_delay = getattr(self, 'PDF_HEDGE_DELAY', None)
+            timeout     = getattr(self, 'PDF_DOWNLOAD_TIMEOUT', PDF_DOWNLOAD_TIMEOUT)
+            downloaded, pdf_path = race_pdf_sources(sources, download_dest, hedge_delay=hedge_delay, timeout=timeout)
+            if downloaded:
+                return downloaded, pdf_path
         else:
-            # Full library scan and match logic
+            # Full library scan and match logic. Look up every item still missing a PDF
+            # on arXiv in bulk first, rather than one search per item.
+            candidates = [item for item in items
+                          if item.get('data', {}).get('itemType') == 'journalArticle'
+                          and item.get('links', {}).get('attachment', {}).get('attachmentType') == None
+                          and not (self.pdf_store is not None and self.pdf_store.lookup(item['data'].get('DOI', '')))]
+            arxiv_matches = arxiv_bulk_match(candidates, client)
             for item in items:
                 try:
                     if item['data']['itemType'] == 'journalArticle':
                         pdf_path = ""
                         downloaded = False
-                        text1 = item['data'].get('title', '')
-                        text1 = string.capwords(text1)
-                        vector1 = text_to_vector(text1)
-                        search = arxiv.Search(query='ti:"' + text1 + '"', max_results=10, sort_by=arxiv.SortCriterion.Relevance)
-                        for result in search.results(): # To do: replace with Client.results
-                            vector2 = text_to_vector(result.title)
-                            cosine = get_cosine(vector1, vector2)
-                            if cosine > .85:
-                                downloaded = True
-                                print(f"ArXiv match found for {text1}: {result.entry_id}")
-                                pdf_name = result.download_pdf(dirpath=download_dest)
-                                pdf_path = os.path.join(download_dest, pdf_name)
-                                break
+                        doi = item['data'].get('DOI', '')
+                        if item.get('links', {}).get('attachment', {}).get('attachmentType') != None:
+                            print("Pdf Already present: ", doi)
+                            continue
+                        entry = self.pdf_store.lookup(doi) if self.pdf_store is not None else None
+                        if entry is not None:
+                            name = doi.replace("/", "_") + ".pdf"
+                            pdf_path = self.pdf_store.checkout(entry, os.path.join(download_dest, name))
+                            downloaded = True
+                        if not downloaded and item['key'] in arxiv_matches:
+                            result = arxiv_matches[item['key']]
+                            print(f"ArXiv match found for {item['data'].get('title', '')}: {result.entry_id}")
+                            downloaded, pdf_path = try_pdf_source("arXiv", download_arxiv_result, download_dest, result)
                         doi = item['data'].get('DOI', '')
                         if not downloaded:
-                            downloaded, pdf_path = scihub_download(download_dest, item['data'].get('DOI', ''))
+                            downloaded, pdf_path = try_pdf_source("Sci-hub", scihub_download, download_dest, doi)
                         if not downloaded:
-                            downloaded, pdf_path = medrxiv_download(download_dest, item['data'].get('DOI', ''))
+                            downloaded, pdf_path = try_pdf_source("medArxiv", medrxiv_download, download_dest, doi)
                         if not downloaded:
-                            downloaded, pdf_path = bioArxiv_download(download_dest, item['data'].get('DOI', '') )
+                            downloaded, pdf_path = try_pdf_source("bioArxiv", bioArxiv_download, download_dest, doi)
                         if downloaded:
-                            doi = item['data'].get('DOI', '')
                             print("Downloaded pdf path: ", pdf_path)
+                            md5 = entry['md5'] if entry is not None else None
+                            if entry is None and self.pdf_store is not None and doi:
+                                md5 = self.pdf_store.add(doi, pdf_path)['md5']
                             zotero_item_keys = [item['key']]
-                            if item.get('links', {}).get('attachment', {}).get('attachmentType') != None:
-                                print("Pdf Already present: ", doi)
-                                continue
                             for zotero_item_key in zotero_item_keys:
-                                zot = zotero.Zotero(self.ZOT_ID, 'user', self.ZOT_KEY)
-                                if os.path.isfile(pdf_path):
-                                    zot.attachment_simple([pdf_path], zotero_item_key)
-                                else:
-                                    pdf_path = pdf_path.removeprefix("./")
-                                    zot.attachment_simple([pdf_path], zotero_item_key)
+                                zot = zotero_client(self.ZOT_ID, self.ZOT_KEY)
+                                self.attach_pdf(zot, pdf_path, zotero_item_key, md5=md5)
                             print(f"PDF for {doi} attached successfully.")
                             # return downloaded, pdf_path
                         else:
@@ -0,0 +1,123 @@
+# utils/cache.py
+from contextlib import closing
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+def normalize_doi(doi):
+    """
+    Normalize a DOI so that the same paper always maps to the same cache key.
+
+    Parameters:
+    - doi (str): A DOI, optionally with a doi.org / dx.doi.org prefix or "doi:" scheme.
+
+    Returns:
+    - str: The bare, lower-cased DOI.
+    """
+    doi = str(doi).strip()
+    doi = re.sub(r'^(https?://)?(dx\.)?doi\.org/', '', doi, flags=re.IGNORECASE)
+    doi = re.sub(r'^doi:\s*', '', doi, flags=re.IGNORECASE)
+    return doi.lower()
+
+
+def serp_cache_key(params):
+    """
+    Cache key for a SerpApi query: its parameters in canonical form, without the API key.
+
+    Parameters:
+    - params (dict): The SerpApi query parameters.
+
+    Returns:
+    - str: A key that is the same for the same query regardless of parameter order,
+      value types ("0" vs 0) or whose key ran it.
+    """
+    canonical = {str(name): str(value) for name, value in params.items()
+                 if name != "api_key" and value is not None and value != ""}
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+class SqliteCache:
+    """
+    A small persistent key/value cache backed by SQLite.
+
+    Values are stored as JSON. Entries older than ``ttl`` seconds are treated as missing,
+    and once the cache holds more than ``max_entries`` the least recently used ones are
+    evicted. A new connection is opened per call, so one instance can be shared between
+    threads.
+
+    Parameters:
+    - path (str): The SQLite database file. Its directory is created if needed.
+    - ttl (float): Seconds an entry stays valid, None to keep entries forever.
+    - max_entries (int): Maximum number of entries to keep, None for no limit.
+    """
+    def __init__(self, path, ttl=None, max_entries=None):
+        self.path        = path
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self._lock       = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS cache (
+                                key      TEXT PRIMARY KEY,
+                                value    TEXT NOT NULL,
+                                created  REAL NOT NULL,
+                                accessed REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None if it is missing or expired.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self._expired(created, now):
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value):
+        """
+        Store a JSON-serializable value under key, evicting old entries if the cache is full.
+        """
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                         (key, json.dumps(value), now, now))
+            self._evict(conn, now)
+
+    def delete(self, key):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def __len__(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _evict(self, conn, now):
+        if self.ttl is not None:
+            conn.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl,))
+        if self.max_entries is not None:
+            count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute("""DELETE FROM cache WHERE key IN (
+                                    SELECT key FROM cache ORDER BY accessed ASC LIMIT ?)""",
+                             (count - self.max_entries,))
@@ -0,0 +1,78 @@
+# utils/endpoints.py
+from urllib.parse import urlsplit, urlunsplit
+
+import threading
+
+# Host name mapped to the base URL that should serve it instead, e.g.
+# {"api.crossref.org": "http://127.0.0.1:8001"} to point Crossref lookups at a mirror,
+# a caching proxy or the stub services in benchmarks/
+ENDPOINTS = dict()
+_lock     = threading.Lock()
+
+
+def configure(overrides):
+    """
+    Replace the endpoint overrides, e.g. from the ENDPOINTS config entry.
+
+    Parameters:
+    - overrides (dict): Host name mapped to the base URL to use for it.
+    """
+    with _lock:
+        ENDPOINTS.clear()
+        ENDPOINTS.update({host.lower(): base.rstrip("/") for host, base in (overrides or {}).items()})
+
+
+def resolve(url):
+    """
+    The URL to actually request for url, after applying the endpoint overrides.
+
+    Parameters:
+    - url (str): An absolute URL.
+
+    Returns:
+    - str: url with its scheme and host swapped for the override's, or url unchanged.
+    """
+    if not ENDPOINTS:
+        return url
+    parts = urlsplit(url)
+    base  = ENDPOINTS.get((parts.hostname or "").lower())
+    if base is None:
+        return url
+    base = urlsplit(base)
+    return urlunsplit((base.scheme, base.netloc, base.path + parts.path, parts.query, parts.fragment))
+
+
+def zotero_client(library_id, api_key, library_type='user'):
+    """
+    A pyzotero client for the library, talking to the overridden Zotero endpoint if any.
+    """
+    from pyzotero import zotero
+    zot = zotero.Zotero(library_id, library_type, api_key)
+    zot.endpoint = resolve(zot.endpoint)
+    return zot
+
+
+_arxiv_client = None
+
+
+def arxiv_client():
+    """
+    The process-wide arxiv.Client. Its queries go through the pooled session, so they are
+    paced and backed off as export.arxiv.org by the request scheduler, and sent to the
+    overridden arXiv API endpoint if any.
+    """
+    global _arxiv_client
+    if _arxiv_client is None:
+        import arxiv
+        try:
+            from .http_session import get_session
+        except ImportError:
+            from http_session import get_session
+        with _lock:
+            if _arxiv_client is None:
+                # The scheduler keeps to arXiv's one request every three seconds across all threads;
+                # the client's own delay only spaces out the requests of one client
+                client          = arxiv.Client(delay_seconds=0)
+                client._session = get_session()
+                _arxiv_client   = client
+    return _arxiv_client
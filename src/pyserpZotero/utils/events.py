@@ -0,0 +1,46 @@
+# utils/events.py
+import json
+import threading
+import time
+
+
+class JsonlSink:
+    """
+    Writes one JSON record per line to a stream, flushing after each so a consumer
+    reading the other end of a pipe sees every record as soon as it happens.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.counts = dict()
+        self._lock  = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, default=str, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+            key = (record.get("event"), record.get("status"))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+
+def emit(self, event, **fields):
+    """
+    Send one record about the run to the event sink, if one is attached, and move its
+    DOI along in the job journal of the current run.
+
+    Parameters:
+    - event (str): What the record is about: term, doi, upload, download or summary.
+    - fields: The rest of the record, e.g. doi, status and key.
+    """
+    journal = getattr(self, 'journal', None)
+    run_id  = getattr(self, 'run_id', None)
+    if journal is not None and run_id is not None and fields.get("doi"):
+        try:
+            journal.record(run_id, event, fields)
+        except Exception as e:
+            print(f"Could not record {event} for {fields['doi']} in the job journal: {e}")
+
+    sink = getattr(self, 'event_sink', None)
+    if sink is None:
+        return
+    sink.write({"event": event, "time": round(time.time(), 3), **fields})
@@ -1,92 +1,184 @@
 # utils/helpers.py
 from collections import Counter
-from pyzotero import zotero
-from wordcloud import STOPWORDS
+from functools import lru_cache
 
+import importlib.util
 import math
+import os
 import re
 
+try:
+    from .endpoints import zotero_client
+    from .metrics import span
+    from .rate_limit import zotero_call
+except ImportError:
+    from endpoints import zotero_client
+    from metrics import span
+    from rate_limit import zotero_call
 
-def cleanZot(self, search_term="", field="title"):
+WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=None)
+def stopwords():
+    '''
+    wordcloud's English stopwords, lower-cased
+
+    They are read from the list wordcloud ships rather than by importing wordcloud,
+    which would pull in matplotlib just for a set of words.
+    '''
+    spec = importlib.util.find_spec("wordcloud")
+    path = os.path.join(spec.submodule_search_locations[0], "stopwords") if spec and spec.submodule_search_locations else None
+    if path and os.path.isfile(path):
+        with open(path) as f:
+            return frozenset(line.strip().lower() for line in f if line.strip())
+    from wordcloud import STOPWORDS
+    return frozenset(word.lower() for word in STOPWORDS)
+
+
+def __getattr__(name):
+    # STOPWORDS used to be a module constant; keep it importable without loading it up front
+    if name == "STOPWORDS":
+        return stopwords()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Replacements for broken LaTeX and similar garbage in citation fields. Each pattern is
+# replaced in one pass over the text; where patterns overlap the longest one wins, so
+# specific rules such as "$\sim$" take precedence over the generic "$" and "{" ones.
+LATEX_CLEANUP_RULES = (
+    ("{", ""),
+    ("}", ""),
+    ("$\\less", ""),
+    # Small caps tags: the chained replaces only reached "$scp" after "$\less" was gone
+    ("$\\less$scp$\\greater$", ""),
+    ("$\\less$/scp$\\greater$", ""),
+    ("{$\\less$}scp{$\\greater$}", ""),
+    ("{$\\less$}/scp{$\\greater$}", ""),
+    ("$scp", ""),
+    ("$\\greater", ""),
+    ("/scp", ""),
+    ("$$", ""),
+    ("$", ""),
+    ("\\upkappa", "k"),
+    ("\\upalpha", "α"),
+    ("\\textdollar", "$"),
+    ("\\mathplus", "+"),
+    ("\\textquotedblleft", '"'),
+    ("\\textquotedblright", '"'),
+    ("{\\textquotesingle}", "'"),
+    ("{\\\\textquotesingle}", "'"),
+    ("\\textendash", "-"),
+    ("$\\textbackslashsqrt", ""),
+    ("\\textbackslashsqrt", ""),
+    ("\\textbackslash", ""),
+    ("\\textemdash", "-"),
+    ("\\lbraces", ""),
+    ("\\lbrace=", ""),
+    ("\\rbrace=", ""),
+    ("\\rbrace", ""),
+    ("$\\sim$", "~"),
+    ("\\&amp", "&"),
+    ("\\mathsemicolon", ";"),
+    ("\\mathcolon", ":"),
+    ("\\#", ":"),
+    ("\\textregistered", "®"),
+    ("\\\\textregistered", "®"),
+    ("#1I/`", "'"),
+    ("1I/", "'"),
+    ("\\1I/", "'"),
+    ("{\\’{\\a}}", "a"),
+    ("{\\’{\\e}}", "e"),
+    ("{\\’{\\i}}", "i"),
+    ("{\\’{\\o}}", "o"),
+    ("{\\’{a}}", "a"),
+    ("{\\’{e}}", "e"),
+    ("{\\’{i}}", "i"),
+    ("{\\’{o}}", "o"),
+)
+
+
+class LatexCleaner:
+    '''
+    Applies a table of literal replacements to text in a single pass
+
+    The patterns are compiled once into one regex alternation, longest first, so
+    the cost per text doesn't grow with the number of rules.
+
+    :param rules: (pattern, replacement) pairs
+    :type rules: iterable
+    '''
+    def __init__(self, rules=LATEX_CLEANUP_RULES):
+        self.replacements = dict(rules)
+        patterns          = sorted(self.replacements, key=len, reverse=True)
+        self.pattern      = re.compile("|".join(re.escape(p) for p in patterns))
+
+    def clean(self, text):
+        return self.pattern.sub(lambda match: self.replacements[match.group(0)], text)
+
+
+def cleanZot(self, search_term="", field="title", batch_size=50):
+    '''
+    Clean broken LaTeX out of a field of every item in the library and upload the
+    items that changed.
+
+    :param search_term: only clean items matching this quick search
+    :type search_term: str
+    :param field: the item field to clean
+    :type field: str
+    :param batch_size: items per update request, at most 50
+    :type batch_size: int
+    '''
     # Get keys / id from Self
     # Ignore any errors about it not being used
     id = self.ZOT_ID
     key = self.ZOT_KEY
 
     # Connect to Zotero
-    zot = zotero.Zotero(id, 'user', key)
+    zot = zotero_client(id, key)
 
-    zot.add_parameters(q=search_term)
-    items = zot.everything("*")
+    if search_term:
+        items = zot.everything(zot.items(q=search_term))
+    else:
+        items = zot.everything(zot.items())
 
     message = "Number of items retreived from your library:" + str(len(items))
     print(message)
 
-    n = 0
+    # Clean LaTex and similar garbage, keeping only the items that actually changed
+    cleaner = LatexCleaner()
+    changed = []
     for item in items:
-        n = n + 1
-        message2 = "Processing number: " + str(n)
-        try:
-            # Clean LaTex and similar garbage
-            item['data'][field] = item['data'][field].replace("{", "")
-            item['data'][field] = item['data'][field].replace("}", "")
-            item['data'][field] = item['data'][field].replace("$\less", "")
-            item['data'][field] = item['data'][field].replace("$scp", "")
-            item['data'][field] = item['data'][field].replace("$\greater", "")
-            item['data'][field] = item['data'][field].replace("/scp", "")
-            item['data'][field] = item['data'][field].replace("$$", "")
-            item['data'][field] = item['data'][field].replace("$", "")
-            item['data'][field] = item['data'][field].replace("\\upkappa", "k")
-            item['data'][field] = item['data'][field].replace("\\upalpha", "α")
-            item['data'][field] = item['data'][field].replace("\\textdollar",
-                                                              "$")  # must come after replacement of $
-            item['data'][field] = item['data'][field].replace("\\mathplus", "+")
-            item['data'][field] = item['data'][field].replace('\\textquotedblleft', '"')
-            item['data'][field] = item['data'][field].replace('\\textquotedblright', '"')
-            item['data'][field] = item['data'][field].replace('{\\textquotesingle}', "'")
-            item['data'][field] = item['data'][field].replace('{\\\textquotesingle}', "'")
-            item['data'][field] = item['data'][field].replace('{\\\\textquotesingle}', "'")
-            item['data'][field] = item['data'][field].replace("\\textendash", "-")
-            item['data'][field] = item['data'][field].replace("$\textbackslashsqrt", "")
-            item['data'][field] = item['data'][field].replace("\\textbackslashsqrt", "")
-            item['data'][field] = item['data'][field].replace("\\textbackslash", "")
-            item['data'][field] = item['data'][field].replace("\textemdash", "-")
-            item['data'][field] = item['data'][field].replace("\\lbraces", "")
-            item['data'][field] = item['data'][field].replace("\\lbrace=", "")
-            item['data'][field] = item['data'][field].replace("\\rbrace=", "")
-            item['data'][field] = item['data'][field].replace("\\rbrace", "")
-            item['data'][field] = item['data'][field].replace("\\rbrace", "")
-            item['data'][field] = item['data'][field].replace("$\sim$", "~")
-            item['data'][field] = item['data'][field].replace("$\\sim$", "~")
-            item['data'][field] = item['data'][field].replace("\\&amp", "&")
-            item['data'][field] = item['data'][field].replace("\&amp", "&")
-            item['data'][field] = item['data'][field].replace("\\mathsemicolon", ";")
-            item['data'][field] = item['data'][field].replace("\\mathcolon", ":")
-            item['data'][field] = item['data'][field].replace("\mathsemicolon", ";")
-            item['data'][field] = item['data'][field].replace("\mathcolon", ":")
-            item['data'][field] = item['data'][field].replace("\\#", ":")
-            item['data'][field] = item['data'][field].replace("\\textregistered", "®")
-            item['data'][field] = item['data'][field].replace("\textregistered", "®")
-            item['data'][field] = item['data'][field].replace("\\\textregistered", "®")
-            item['data'][field] = item['data'][field].replace("#1I/`", "'")
-            item['data'][field] = item['data'][field].replace("1I/", "'")
-            item['data'][field] = item['data'][field].replace("\1I/", "'")  # {\’{\i}}   {\’{\a}}   {\’{o}}
-            item['data'][field] = item['data'][field].replace("{\’{\a}}", "a")
-            item['data'][field] = item['data'][field].replace("{\’{\e}}", "e")
-            item['data'][field] = item['data'][field].replace("{\’{\i}}", "i")
-            item['data'][field] = item['data'][field].replace("{\’{\o}}", "o")
-            item['data'][field] = item['data'][field].replace("{\’{a}}", "a")
-            item['data'][field] = item['data'][field].replace("{\’{e}}", "e")
-            item['data'][field] = item['data'][field].replace("{\’{i}}", "i")
-            item['data'][field] = item['data'][field].replace("{\’{o}}", "o")
-        except:
-            pass
-
-    # Update the cloud with the improvements
+        value = item.get('data', {}).get(field)
+        if not isinstance(value, str):
+            continue
+        cleaned = cleaner.clean(value)
+        if cleaned != value:
+            item['data'][field] = cleaned
+            changed.append(item)
+
+    print(f"{len(changed)} items need cleaning.")
+
+    # Update the cloud with the improvements. Every item carries the version it was read
+    # at, so Zotero refuses the write for any item that was modified in the meantime.
     print("Updating your cloud library...")
-    zot.update_items(items)
+    batch_size = max(1, min(batch_size, 50))
+    failed     = 0
+    for start in range(0, len(changed), batch_size):
+        batch = changed[start:start + batch_size]
+        try:
+            with span("zotero_write", op="update"), zotero_call(zot):
+                zot.update_items(batch)
+            result = zot.request.json() if zot.request is not None else {}
+        except Exception as e:
+            print(f"An error occurred while updating items: {e}")
+            failed += len(batch)
+            continue
+        for index, error in (result.get('failed') or {}).items():
+            failed += 1
+            print(f"Could not update {batch[int(index)]['key']}: {error.get('message')}")
 
-    print("Done! I hope this made things more readable.")
+    print(f"Done! Cleaned {len(changed) - failed} items. I hope this made things more readable.")
     # Return 0
     return 0
 
@@ -105,6 +197,7 @@ def get_cosine(vec1, vec2):
     vec2_updated = []
     # pdb.set_trace()
 
+    STOPWORDS = stopwords()
     for word in vec1_keys:
         if word.lower() in STOPWORDS:
             continue
@@ -138,6 +231,74 @@ def text_to_vector(text):
     :param text: search term (title, etc)
     :type text: str
     '''
-    WORD = re.compile(r"\w+")
     words = WORD.findall(text)
-    return Counter(words)
\ No newline at end of file
+    return Counter(words)
+
+
+def title_tokens(text):
+    '''
+    Distinct lower-cased words of a title, without stopwords
+
+    :param text: title or other short text
+    :type text: str
+    '''
+    STOPWORDS = stopwords()
+    return {word for word in WORD.findall(text.lower()) if word not in STOPWORDS}
+
+
+class TitleMatcher:
+    '''
+    Scores titles against a fixed set of candidate titles, many at a time
+
+    Uses the same measure as get_cosine (cosine of the distinct non-stopword words),
+    ignoring case. Each candidate is tokenized once and stored in an inverted index,
+    so scoring one title against all candidates is a single bincount over the
+    candidates that share a word with it.
+
+    :param titles: candidate titles
+    :type titles: list
+    '''
+    def __init__(self, titles):
+        import numpy as np
+        self.titles = list(titles)
+        postings = {}
+        sizes    = np.zeros(len(self.titles))
+        for n, title in enumerate(self.titles):
+            tokens   = title_tokens(title or "")
+            sizes[n] = len(tokens)
+            for token in tokens:
+                postings.setdefault(token, []).append(n)
+        self.postings = {token: np.asarray(ids, dtype=np.intp) for token, ids in postings.items()}
+        self.norms    = np.sqrt(sizes)
+
+    def scores(self, title):
+        '''
+        Cosine similarity of title to every candidate, as an array in candidate order
+        '''
+        import numpy as np
+        tokens = title_tokens(title or "")
+        hits   = [self.postings[token] for token in tokens if token in self.postings]
+        if not hits:
+            return np.zeros(len(self.titles))
+        overlap     = np.bincount(np.concatenate(hits), minlength=len(self.titles))
+        denominator = self.norms * math.sqrt(len(tokens))
+        return np.divide(overlap, denominator, out=np.zeros(len(self.titles)), where=denominator > 0)
+
+    def score_matrix(self, titles):
+        '''
+        Similarity of each of titles (rows) to every candidate (columns)
+        '''
+        import numpy as np
+        return np.vstack([self.scores(title) for title in titles]) if titles else np.zeros((0, len(self.titles)))
+
+    def best_match(self, title, threshold=0.85):
+        '''
+        Index and score of the most similar candidate, or (None, score) if it is below threshold
+        '''
+        if not self.titles:
+            return None, 0.0
+        scores = self.scores(title)
+        best   = int(scores.argmax())
+        if scores[best] > threshold:
+            return best, float(scores[best])
+        return None, float(scores[best])
\ No newline at end of file
@@ -0,0 +1,65 @@
+# utils/http_session.py
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import requests
+import threading
+
+try:
+    from .endpoints import resolve
+    from .rate_limit import THROTTLED, get_scheduler
+except ImportError:
+    from endpoints import resolve
+    from rate_limit import THROTTLED, get_scheduler
+
+# (connect, read) timeout in seconds applied when a caller doesn't pass one
+DEFAULT_TIMEOUT = (10, 60)
+
+_session      = None
+_session_lock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """
+    A requests Session with keep-alive connection pools, retries on transient
+    gateway errors, and a default timeout so a stalled server can't hang a worker.
+
+    Requests go to the configured endpoint override for their host, if any, and
+    every request is paced by the process-wide RequestScheduler, and a request the
+    host throttles (429/503) is retried once the scheduler's backoff has passed.
+    """
+    def __init__(self, pool_maxsize=32, timeout=DEFAULT_TIMEOUT, throttle_retries=3):
+        super().__init__()
+        self.timeout          = timeout
+        self.throttle_retries = throttle_retries
+        retries = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 504),
+                        allowed_methods=frozenset(["GET", "HEAD"]))
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_maxsize, max_retries=retries)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        scheduler = get_scheduler()
+        for attempt in range(self.throttle_retries + 1):
+            with scheduler.slot(url):
+                response = super().request(method, resolve(url), **kwargs)
+            scheduler.observe(url, response)
+            if response.status_code not in THROTTLED or attempt == self.throttle_retries:
+                return response
+            response.close()
+
+
+def get_session():
+    """
+    Return the process-wide pooled session, creating it on first use.
+
+    Returns:
+    - PooledSession: A session shared by all fetchers in this process.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = PooledSession()
+    return _session
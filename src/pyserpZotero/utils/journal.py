@@ -0,0 +1,174 @@
+# utils/journal.py
+from contextlib import closing
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from .cache import normalize_doi
+except ImportError:
+    from cache import normalize_doi
+
+# How far along a DOI is; a DOI only ever moves forward. The last three are final:
+# a resumed run leaves those DOIs alone.
+STAGE_RANK = {"found": 0, "resolved": 1, "uploaded": 2, "pdf_attached": 3, "pdf_failed": 3, "skipped": 3}
+FINAL_STAGES = frozenset(stage for stage, rank in STAGE_RANK.items() if rank == 3)
+
+# (event, status) of a pipeline event -> the stage it moves its DOI to
+TRANSITIONS = {
+    ("doi", "resolved"):       "resolved",
+    ("upload", "created"):     "uploaded",
+    ("upload", "exists"):      "uploaded",
+    ("upload", "skipped"):     "skipped",
+    ("download", "attached"):  "pdf_attached",
+    ("download", "unchanged"): "pdf_attached",
+    ("download", "not_found"): "pdf_failed",
+}
+
+
+class JobJournal:
+    """
+    Crash-safe record of batch runs in SQLite: the terms of each run, the DOIs each
+    term found, and how far every DOI got (found, resolved, uploaded, PDF attached or
+    failed, or skipped). Every change is committed as it happens, so after a crash,
+    a Ctrl-C or a Zotero outage the run can be resumed without searching the same
+    terms or uploading the same citations again.
+
+    A new connection is opened per call, so one instance can be shared between threads.
+
+    Parameters:
+    - path (str): The SQLite database file. Its directory is created if needed.
+    """
+    def __init__(self, path):
+        self.path  = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS runs (
+                                id       INTEGER PRIMARY KEY AUTOINCREMENT,
+                                started  REAL NOT NULL,
+                                finished REAL,
+                                terms    TEXT NOT NULL,
+                                params   TEXT NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS terms (
+                                run_id   INTEGER NOT NULL,
+                                term     TEXT NOT NULL,
+                                dois     TEXT NOT NULL,
+                                searched REAL NOT NULL,
+                                PRIMARY KEY (run_id, term))""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS dois (
+                                run_id    INTEGER NOT NULL,
+                                doi_key   TEXT NOT NULL,
+                                doi       TEXT NOT NULL,
+                                stage     TEXT NOT NULL,
+                                item_keys TEXT,
+                                reason    TEXT,
+                                error     TEXT,
+                                updated   REAL NOT NULL,
+                                PRIMARY KEY (run_id, doi_key))""")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def start_run(self, terms, params):
+        """
+        Record a new run.
+
+        Parameters:
+        - terms (list): Every search term of the run.
+        - params (dict): The JSON-serializable search options, so the run can be resumed as it was started.
+
+        Returns:
+        - int: The run id.
+        """
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute("INSERT INTO runs (started, terms, params) VALUES (?, ?, ?)",
+                                  (time.time(), json.dumps(list(terms)), json.dumps(params)))
+            return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), run_id))
+
+    def get_run(self, run_id=None):
+        """
+        Return a run as a dict with its id, terms and params. Without run_id, return the
+        most recent run that never finished. None if there is no such run.
+        """
+        with closing(self._connect()) as conn:
+            if run_id is None:
+                row = conn.execute("SELECT id, started, finished, terms, params FROM runs "
+                                   "WHERE finished IS NULL ORDER BY id DESC LIMIT 1").fetchone()
+            else:
+                row = conn.execute("SELECT id, started, finished, terms, params FROM runs WHERE id = ?",
+                                   (run_id,)).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "started": row[1], "finished": row[2],
+                "terms": json.loads(row[3]), "params": json.loads(row[4])}
+
+    def record_term(self, run_id, term, dois):
+        """
+        Record that a term has been searched, with the (doi, abstract) pairs it found.
+        """
+        dois = sorted(dois, key=lambda pair: str(pair[0]))
+        now  = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO terms (run_id, term, dois, searched) VALUES (?, ?, ?, ?)",
+                         (run_id, term, json.dumps(dois), now))
+            conn.executemany("INSERT OR IGNORE INTO dois (run_id, doi_key, doi, stage, updated) VALUES (?, ?, ?, 'found', ?)",
+                             [(run_id, normalize_doi(doi), doi, now) for doi, _ in dois])
+
+    def searched_terms(self, run_id):
+        """
+        Return the terms of a run that were already searched, mapped to the set of
+        (doi, abstract) pairs each one found.
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT term, dois FROM terms WHERE run_id = ?", (run_id,)).fetchall()
+        return {term: {tuple(pair) for pair in json.loads(dois)} for term, dois in rows}
+
+    def record(self, run_id, event, fields):
+        """
+        Move a DOI along according to a pipeline event (see TRANSITIONS). Events that
+        report an error keep the DOI where it is, so a resumed run tries it again.
+        """
+        doi   = fields["doi"]
+        key   = normalize_doi(doi)
+        stage = TRANSITIONS.get((event, fields.get("status")), "found")
+        keys  = fields.get("keys")
+        now   = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT stage FROM dois WHERE run_id = ? AND doi_key = ?", (run_id, key)).fetchone()
+            if row is None:
+                conn.execute("INSERT INTO dois (run_id, doi_key, doi, stage, item_keys, reason, error, updated) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (run_id, key, doi, stage, json.dumps(keys) if keys else None,
+                              fields.get("reason"), fields.get("error"), now))
+            elif STAGE_RANK[stage] > STAGE_RANK[row[0]]:
+                conn.execute("UPDATE dois SET stage = ?, item_keys = COALESCE(?, item_keys), reason = ?, "
+                             "error = ?, updated = ? WHERE run_id = ? AND doi_key = ?",
+                             (stage, json.dumps(keys) if keys else None, fields.get("reason"),
+                              fields.get("error"), now, run_id, key))
+            elif fields.get("error"):
+                conn.execute("UPDATE dois SET error = ?, updated = ? WHERE run_id = ? AND doi_key = ?",
+                             (fields["error"], now, run_id, key))
+
+    def doi_states(self, run_id):
+        """
+        Return normalized DOI -> (stage, Zotero item keys) for every DOI of a run.
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT doi_key, stage, item_keys FROM dois WHERE run_id = ?", (run_id,)).fetchall()
+        return {key: (stage, json.loads(keys) if keys else []) for key, stage, keys in rows}
+
+    def stage_counts(self, run_id):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT stage, COUNT(*) FROM dois WHERE run_id = ? GROUP BY stage", (run_id,)).fetchall()
+        return dict(rows)
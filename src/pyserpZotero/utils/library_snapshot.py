@@ -0,0 +1,169 @@
+# utils/library_snapshot.py
+import json
+import os
+import tempfile
+
+
+class LibrarySnapshot:
+    """
+    A local copy of a Zotero library that is kept up to date incrementally.
+
+    The snapshot remembers the library version it was last synced at, so a later
+    sync only asks Zotero for items changed since then plus deletions. The DOI/URL
+    index used for duplicate detection is updated item by item as changes arrive.
+
+    Parameters:
+    - path (str): JSON file the snapshot is persisted to. None keeps it in memory only.
+    """
+    def __init__(self, path=None):
+        self.path      = path
+        self.version   = 0
+        self.items     = dict()   # item key -> Zotero item
+        self.doi_index = dict()   # DOI or URL -> set of item keys
+        self.children  = dict()   # parent key -> set of attachment keys
+        self.synced    = False    # Synced with Zotero by this process, not just loaded from disk
+        if path and os.path.isfile(path):
+            self.load()
+
+    def load(self):
+        """
+        Read the snapshot from disk and rebuild the indexes from it.
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read library snapshot {self.path}, starting over: {e}")
+            return
+        self.version = int(data.get('version', 0))
+        for item in data.get('items', []):
+            self.add(item)
+
+    def save(self):
+        """
+        Write the snapshot to disk atomically.
+        """
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({'version': self.version, 'items': list(self.items.values())}, f)
+        os.replace(tmp_path, self.path)
+
+    def sync(self, zot):
+        """
+        Bring the snapshot up to date with the remote library.
+
+        Parameters:
+        - zot (Zotero Object): The library to sync from.
+
+        Returns:
+        - (int): The number of changed or deleted items applied.
+        """
+        # Read the version first: anything modified while we fetch is picked up next time
+        version = zot.last_modified_version()
+        if self.version and version == self.version:
+            print(f"Local library snapshot is up to date (version {version}).")
+            self.synced = True
+            return 0
+
+        if self.version:
+            print(f"Fetching library changes since version {self.version}...")
+            changed = zot.everything(zot.items(since=self.version))
+            deleted = zot.deleted(since=self.version).get('items', [])
+        else:
+            print("No local library snapshot yet, downloading the whole library...")
+            changed = zot.everything(zot.items())
+            deleted = []
+
+        for key in deleted:
+            self.remove(key)
+        for item in changed:
+            self.add(item)
+
+        self.version = version
+        self.synced  = True
+        self.save()
+        print(f"Library snapshot synced to version {version}: {len(changed)} changed, {len(deleted)} deleted.")
+        return len(changed) + len(deleted)
+
+    def add(self, item):
+        """
+        Add or replace an item and update the indexes for it.
+        """
+        key = item.get('key')
+        if key is None:
+            return
+        if key in self.items:
+            self.remove(key)
+        self.items[key] = item
+
+        data   = item.get('data', {})
+        parent = data.get('parentItem')
+        if parent and data.get('itemType') == 'attachment':
+            self.children.setdefault(parent, set()).add(key)
+        for identifier in self.identifiers(item):
+            self.doi_index.setdefault(identifier, set()).add(key)
+
+    def remove(self, key):
+        """
+        Drop an item and its index entries.
+        """
+        item = self.items.pop(key, None)
+        if item is None:
+            return
+        parent = item.get('data', {}).get('parentItem')
+        if parent in self.children:
+            self.children[parent].discard(key)
+            if not self.children[parent]:
+                del self.children[parent]
+        for identifier in self.identifiers(item):
+            keys = self.doi_index.get(identifier)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.doi_index[identifier]
+
+    @staticmethod
+    def identifiers(item):
+        """
+        The DOI of an item, or its URL when it has no DOI.
+        """
+        data = item.get('data')
+        if not data:
+            return []
+        doi = data.get("doi") or data.get("DOI")
+        if doi:
+            return [doi]
+        if data.get('url'):
+            return [data['url']]
+        return []
+
+    def has_attachment(self, key):
+        item = self.items.get(key, {})
+        return item.get('links', {}).get('attachment') is not None or key in self.children
+
+    def attachment_md5s(self, key):
+        """
+        The md5s of the files attached to an item.
+        """
+        return {self.items[child]['data'].get('md5') for child in self.children.get(key, ())}
+
+    def missing_attachments(self):
+        """
+        Map each DOI of a top-level item without an attachment to its item key.
+        """
+        missing = dict()
+        for identifier, keys in self.doi_index.items():
+            for key in keys:
+                data = self.items[key]['data']
+                if not (data.get("doi") or data.get("DOI")) or data.get('parentItem') is not None:
+                    continue
+                if not self.has_attachment(key):
+                    missing[identifier] = key
+        return missing
+
+    def all_items(self):
+        return list(self.items.values())
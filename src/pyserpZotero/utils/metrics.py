@@ -0,0 +1,278 @@
+# utils/metrics.py
+from contextlib import contextmanager
+
+import json
+import math
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds, from a cache hit to a slow PDF download
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+HELP = {
+    "pyserpzotero_stage_seconds":              "Time spent per call in each pipeline stage",
+    "pyserpzotero_stage_errors_total":         "Calls of a pipeline stage that raised an error",
+    "pyserpzotero_pdf_source_attempts_total":  "PDF download attempts per source and outcome",
+    "pyserpzotero_pdf_source_seconds":         "Time spent per PDF download attempt, per source",
+    "pyserpzotero_cache_requests_total":       "Cache lookups per cache and result",
+    "pyserpzotero_zotero_items_total":         "Zotero items written per operation and result",
+    "pyserpzotero_attachments_total":          "PDF attachments per result",
+}
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram of observed values, as in Prometheus.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts  = [0] * len(self.buckets)
+        self.count   = 0
+        self.sum     = 0.0
+        self.min     = math.inf
+        self.max     = 0.0
+
+    def observe(self, value):
+        for n, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[n] += 1
+                break
+        self.count += 1
+        self.sum   += value
+        self.min    = min(self.min, value)
+        self.max    = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimate the q-th quantile by interpolating within its bucket, like Prometheus'
+        histogram_quantile, but clamped to the smallest and largest values seen.
+        """
+        if not self.count:
+            return 0.0
+        rank, seen, lower = q * self.count, 0, 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                upper    = min(bound, self.max)
+                estimate = lower + (upper - lower) * (rank - seen) / count
+                return min(max(estimate, self.min), self.max)
+            seen += count
+            lower = bound
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "min": self.min if self.count else 0.0, "max": self.max,
+                "p50": self.quantile(.5), "p90": self.quantile(.9), "p99": self.quantile(.99)}
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and histograms for one process.
+
+    Stages are timed with span(), which feeds pyserpzotero_stage_seconds{stage=...}
+    and counts errors. The registry can be exported as JSON at the end of a run or
+    scraped in the Prometheus text format by long-running processes.
+    """
+    def __init__(self):
+        self.counters   = dict()   # (name, labels) -> value
+        self.histograms = dict()   # (name, labels) -> Histogram
+        self.started    = time.time()
+        self._lock      = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """
+        Time a block as one call of a pipeline stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("pyserpzotero_stage_errors_total", stage=stage, **labels)
+            raise
+        finally:
+            self.observe("pyserpzotero_stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def pdf_attempt(self, source, outcome, seconds):
+        """
+        Record one PDF source attempt: hit, miss, error, or late/cancelled when another source won first.
+        """
+        self.inc("pyserpzotero_pdf_source_attempts_total", source=source, outcome=outcome)
+        self.observe("pyserpzotero_pdf_source_seconds", seconds, source=source)
+
+    def cache_lookup(self, cache, hit):
+        self.inc("pyserpzotero_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def to_dict(self):
+        """
+        All metrics as plain data, for the JSON export.
+        """
+        with self._lock:
+            counters   = [{"name": name, "labels": dict(labels), "value": value}
+                          for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{"name": name, "labels": dict(labels), **histogram.to_dict()}
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+        return {"started": self.started, "exported": time.time(), "counters": counters, "histograms": histograms}
+
+    def write_json(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def to_prometheus(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines, typed = [], set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                header(name, "counter")
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                header(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(float(bound))
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def stage_summary(self):
+        """
+        One line per stage with its call count, total time and latency percentiles.
+        """
+        with self._lock:
+            stages = [(dict(labels), histogram.to_dict()) for (name, labels), histogram in sorted(self.histograms.items())
+                      if name == "pyserpzotero_stage_seconds"]
+        lines = []
+        for labels, stats in sorted(stages, key=lambda stage: (stage[0]["stage"], sorted(stage[0].items()))):
+            stage = labels.pop("stage")
+            if labels:
+                stage += "[" + ",".join(f"{k}={v}" for k, v in labels.items()) + "]"
+            lines.append(f"{stage:<24} {stats['count']:>6} calls {stats['sum']:>9.2f}s total  "
+                         f"p50 {stats['p50'] * 1000:>8.1f}ms  p90 {stats['p90'] * 1000:>8.1f}ms  "
+                         f"p99 {stats['p99'] * 1000:>8.1f}ms")
+        return lines
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve the Prometheus text format on http://host:port/metrics from a daemon thread.
+
+        Returns:
+        - ThreadingHTTPServer: The running server.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+
+_metrics      = Metrics()
+_server       = None
+_server_lock  = threading.Lock()
+
+
+def get_metrics():
+    """
+    Return the process-wide metrics registry.
+    """
+    return _metrics
+
+
+def span(stage, **labels):
+    """
+    Time a block as one call of a pipeline stage in the process-wide registry.
+    """
+    return _metrics.span(stage, **labels)
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """
+    Start the Prometheus endpoint once per process, however many SerpZot objects ask for it.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = _metrics.serve(port, host)
+            except OSError as e:
+                # e.g. the port is taken by another psz process
+                print(f"Could not serve metrics on {host}:{port}: {e}")
+    return _server
+
+
+def export_metrics(self):
+    """
+    Print per-stage timings for the run and write all metrics to METRICS_PATH as JSON, if set.
+    """
+    summary = _metrics.stage_summary()
+    if summary:
+        print("Stage timings:")
+        for line in summary:
+            print("  " + line)
+    if getattr(self, 'METRICS_PATH', None):
+        try:
+            _metrics.write_json(self.METRICS_PATH)
+            print(f"Metrics written to {self.METRICS_PATH}")
+        except OSError as e:
+            print(f"Could not write metrics to {self.METRICS_PATH}: {e}")
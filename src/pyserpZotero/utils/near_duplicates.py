@@ -0,0 +1,158 @@
+# utils/near_duplicates.py
+import re
+import threading
+import unicodedata
+import zlib
+
+# Mersenne prime for the universal hash family used by MinHash
+PRIME = (1 << 31) - 1
+
+
+def normalize_title(title):
+    """
+    Reduce a title to lower-case ASCII words separated by single spaces.
+
+    Parameters:
+    - title (str): The title to normalize.
+
+    Returns:
+    - str: The normalized title.
+    """
+    title = unicodedata.normalize("NFKD", title or "").encode("ascii", "ignore").decode()
+    return " ".join(re.findall(r"[a-z0-9]+", title.lower()))
+
+
+def item_year(date):
+    found = re.search(r"\b(1[5-9]|20)\d\d\b", str(date or ""))
+    return int(found.group(0)) if found else None
+
+
+class TitleLSH:
+    """
+    Locality-sensitive hashing index for finding near-duplicate titles.
+
+    Titles are normalized, cut into character shingles and summarized by a MinHash
+    signature. The signature is split into bands and each band is hashed into a
+    bucket, so a lookup only compares against the few titles sharing a bucket
+    instead of the whole library. Candidates are confirmed by their estimated
+    Jaccard similarity, and optionally by year and author surnames.
+
+    Parameters:
+    - threshold (float): Minimum estimated Jaccard similarity of two titles' shingles.
+    - num_perm (int): Length of the MinHash signatures.
+    - bands (int): Number of LSH bands; num_perm must be divisible by it.
+    - shingle_size (int): Characters per shingle.
+    - seed (int): Seed for the hash functions.
+    """
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=4, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold    = threshold
+        self.num_perm     = num_perm
+        self.bands        = bands
+        self.rows         = num_perm // bands
+        self.shingle_size = shingle_size
+        import numpy as np
+        rng         = np.random.RandomState(seed)
+        self.a      = rng.randint(1, PRIME, size=num_perm).astype(np.uint64)
+        self.b      = rng.randint(0, PRIME, size=num_perm).astype(np.uint64)
+        self.buckets    = [dict() for _ in range(bands)]
+        self.signatures = dict()   # key -> MinHash signature
+        self.metadata   = dict()   # key -> (year, set of author surnames)
+        self._lock      = threading.Lock()
+
+    @classmethod
+    def from_items(cls, items, **kwargs):
+        """
+        Build an index over the titles of Zotero items.
+
+        Parameters:
+        - items (list): Zotero items, as in the library snapshot.
+
+        Returns:
+        - TitleLSH: The index, keyed by Zotero item key.
+        """
+        index = cls(**kwargs)
+        for item in items:
+            data = item.get('data', {})
+            if not data.get('title') or data.get('itemType') in ('attachment', 'note'):
+                continue
+            authors = [creator.get('lastName') or creator.get('name') for creator in data.get('creators', [])]
+            index.add(item['key'], data['title'], year=item_year(data.get('date')), authors=authors)
+        return index
+
+    def shingles(self, title):
+        text = normalize_title(title)
+        if len(text) <= self.shingle_size:
+            return {zlib.crc32(text.encode()) % PRIME} if text else set()
+        return {zlib.crc32(text[n:n + self.shingle_size].encode()) % PRIME
+                for n in range(len(text) - self.shingle_size + 1)}
+
+    def signature(self, title):
+        """
+        MinHash signature of a title, or None if it has no words.
+        """
+        import numpy as np
+        shingles = self.shingles(title)
+        if not shingles:
+            return None
+        hashes = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[n * self.rows:(n + 1) * self.rows].tobytes() for n in range(self.bands)]
+
+    def add(self, key, title, year=None, authors=None):
+        """
+        Index a title under key.
+        """
+        signature = self.signature(title)
+        if signature is None:
+            return
+        surnames = {normalize_title(a) for a in (authors or []) if a}
+        with self._lock:
+            self.signatures[key] = signature
+            self.metadata[key]   = (year, surnames)
+            for bucket, band in zip(self.buckets, self._band_keys(signature)):
+                bucket.setdefault(band, set()).add(key)
+
+    def query(self, title, year=None, authors=None):
+        """
+        Find indexed titles that are near-duplicates of title.
+
+        Year and authors are only compared when both sides have them: years may
+        differ by one (preprint vs. published), and at least one surname must match.
+
+        Returns:
+        - list: (key, estimated similarity) pairs, most similar first.
+        """
+        signature = self.signature(title)
+        if signature is None:
+            return []
+        surnames = {normalize_title(a) for a in (authors or []) if a}
+        with self._lock:
+            candidates = set()
+            for bucket, band in zip(self.buckets, self._band_keys(signature)):
+                candidates |= bucket.get(band, set())
+            matches = []
+            for key in candidates:
+                similarity = float((self.signatures[key] == signature).mean())
+                if similarity < self.threshold:
+                    continue
+                other_year, other_surnames = self.metadata[key]
+                if year and other_year and abs(year - other_year) > 1:
+                    continue
+                if surnames and other_surnames and not surnames & other_surnames:
+                    continue
+                matches.append((key, similarity))
+        return sorted(matches, key=lambda match: -match[1])
+
+    def find_duplicate(self, title, year=None, authors=None):
+        """
+        Key of the closest near-duplicate of title, or None.
+        """
+        matches = self.query(title, year=year, authors=authors)
+        return matches[0][0] if matches else None
+
+    def __len__(self):
+        return len(self.signatures)
@@ -1,15 +1,58 @@
 # .utils.pdf_downloader.py
 try:
     from .arxiv_helpers import *
+    from .endpoints import zotero_client
+    from .metrics import get_metrics, span
+    from .pdf_store import file_digests
+    from .rate_limit import zotero_call
 except:
     from arxiv_helpers import *
-from pyzotero import zotero
+    from endpoints import zotero_client
+    from metrics import get_metrics, span
+    from pdf_store import file_digests
+    from rate_limit import zotero_call
 import os
-import time
+import threading
+
+# Put on the download queue once per worker to tell it there is nothing left to download
+DOWNLOADS_DONE = object()
+
+
+def download_worker_count(self):
+    count = max(1, int(getattr(self, 'DOWNLOAD_WORKERS', 1) or 1))
+    # With worker processes, every one of them downloads that many PDFs at a time
+    workers = getattr(self, 'workers', None)
+    return count * workers.processes if workers is not None else count
+
+
+def queue_download(self, doi, zotero_item_keys, bib_dict):
+    """
+    Hand a cited DOI over to the download workers.
+
+    Blocks while the queue is full, so the citation stage can't run arbitrarily far
+    ahead of the downloads. Does nothing when PDF downloads are disabled.
+
+    Parameters:
+    - doi (str): The DOI to find a PDF for.
+    - zotero_item_keys (list): Keys of the Zotero items to attach the PDF to.
+    - bib_dict (dict): The parsed BibTeX entry of the paper.
+    """
+    if self.download_queue is not None:
+        self.download_queue.put((doi, zotero_item_keys, bib_dict))
+
+
+def finish_downloads(self):
+    """
+    Tell every download worker to stop once the queue has been drained.
+    """
+    if self.download_queue is not None:
+        for _ in range(self.download_worker_count()):
+            self.download_queue.put(DOWNLOADS_DONE)
+
 
 def attempt_pdf_download(self, items, full_lib=False):
     """
-    Attempt to download a PDF for a specified DOI and attach it to a Zotero item.
+    Run the download workers until the citation stage signals that it is done.
 
     Parameters:
     - items: Collection of Zotero items to consider for download.
@@ -18,67 +61,141 @@ def attempt_pdf_download(self, items, full_lib=False):
     Returns:
     - (bool): 0 after all downloads are done
     """
-    # Try to download PDF from various sources
-    download_dest = self.DOWNLOAD_DEST
+    workers = [threading.Thread(target=self.download_worker, args=(items, full_lib), name=f"download-{n}")
+               for n in range(self.download_worker_count())]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    print("DONE WITH ALL DOWNLOADS. ENDING.")
+    return 0
 
-    # Running infinite loop
-    while (True):
-        doi = None
-        zotero_item_keys, bib_dict = None, None
 
-        try:
+def fetch_pdf(self, doi, title=None, items=None, download_dest=".", full_lib=False):
+    """
+    Get the PDF for a DOI, from the local PDF store when it was downloaded before.
+
+    Parameters:
+    - doi (str): The DOI of the paper.
+    - title (str, optional): The title of the paper, used to match it on arXiv.
+    - items: Collection of Zotero items to consider for download.
+    - download_dest (str): The directory to save the downloaded PDF.
+    - full_lib (bool): Flag to indicate whether to search the entire library.
 
-            print("Entered while loop...")
-            with self.lock:
-                if len(self.CITATION_DICT) == 0:
-                    print("Empty List... Waiting ", len(self.CITATION_DICT), "\n\n", self.CITATION_DICT)
-                    time.sleep(1)
-                    continue
+    Returns:
+    - tuple: (bool, str, str) success status, the file path to the PDF and its md5 if known.
+    """
+    store = self.pdf_store
+    entry = store.lookup(doi) if store is not None else None
+    if store is not None:
+        get_metrics().cache_lookup("pdf_store", entry is not None)
+    if entry is not None:
+        print(f"PDF for {doi} is already in the local store, not downloading it again.")
+        download_dest = ensure_download_dest_is_valid(download_dest)
+        pdf_path = store.checkout(entry, os.path.join(download_dest, doi.replace("/", "_") + ".pdf"))
+        return True, pdf_path, entry['md5']
+
+    with span("pdf_download"):
+        downloaded, pdf_path = self.arxiv_download(items=items, download_dest=download_dest, doi=doi,
+                                                   full_lib=full_lib, title=title)
+    if downloaded and store is not None and doi:
+        return downloaded, pdf_path, store.add(doi, pdf_path)['md5']
+    return downloaded, pdf_path, None
+
+
+def attach_pdf(self, zot, pdf_path, zotero_item_key, md5=None):
+    """
+    Attach a PDF to a Zotero item unless the item already has an attachment with the same content.
 
-            with self.lock:
-                print("Starting download ----")
-                doi = list(self.CITATION_DICT.keys())[0]
+    Parameters:
+    - zot (Zotero Object): The library the item is in.
+    - pdf_path (str): The PDF to upload.
+    - zotero_item_key (str): The key of the parent item.
+    - md5 (str, optional): The md5 of the PDF if already known.
+
+    Returns:
+    - (bool): True if the PDF was uploaded, False if an identical attachment was already there.
+    """
+    if not os.path.isfile(pdf_path):
+        pdf_path = pdf_path.removeprefix("./")
+    md5 = md5 or file_digests(pdf_path)[1]
+
+    # Zotero reports the md5 of every stored file, so identical bytes needn't be sent again. The synced
+    # snapshot knows the attachments of the library's items and items created this run have none yet,
+    # so Zotero is only asked about items neither of them knows.
+    snapshot = self.library_snapshot
+    if snapshot is not None and snapshot.synced and zotero_item_key in snapshot.items:
+        md5s = snapshot.attachment_md5s(zotero_item_key)
+    elif zotero_item_key in {key for keys, _ in tuple(self.CITATION_DICT.values()) for key in keys}:  # Uploads add to it meanwhile
+        md5s = set()
+    else:
+        try:
+            with zotero_call(zot):
+                children = zot.children(zotero_item_key)
+        except Exception as e:
+            print(f"Could not list attachments of {zotero_item_key}: {e}")
+            children = []
+        md5s = {child['data'].get('md5') for child in children
+                if child.get('data', {}).get('itemType') == 'attachment'}
+    if md5 in md5s:
+        print(f"Identical PDF is already attached to {zotero_item_key}, not uploading it again.")
+        get_metrics().inc("pyserpzotero_attachments_total", result="unchanged")
+        return False
+
+    with span("attach_upload"), zotero_call(zot):
+        zot.attachment_simple([pdf_path], zotero_item_key)
+    get_metrics().inc("pyserpzotero_attachments_total", result="uploaded")
+    return True
+
+
+def download_worker(self, items, full_lib=False):
+    """
+    Take DOIs off the download queue, download a PDF for each and attach it to its Zotero items.
 
-                # Last key is 'END'
-                if type(doi) == str and doi == "END":
-                    print("DONE WITH ALL DOWNLOADS. ENDING.")
-                    break
+    Parameters:
+    - items: Collection of Zotero items to consider for download.
+    - full_lib (bool): Flag to indicate whether to search the entire library.
+    """
+    # Try to download PDF from various sources
+    download_dest = self.DOWNLOAD_DEST
+    zot = zotero_client(self.ZOT_ID, self.ZOT_KEY)
 
-                zotero_item_keys, bib_dict = self.CITATION_DICT[doi]
+    while True:
+        job = self.download_queue.get()
+        try:
+            if job is DOWNLOADS_DONE:
+                break
 
+            doi, zotero_item_keys, bib_dict = job
             title = bib_dict.get('title')
 
             print(
                 f"\n\nStarting download for doi: {doi}\nZotero Item Keys: {zotero_item_keys}\nBib Dict: {bib_dict}\n\n")
 
-            downloaded, pdf_path = self.arxiv_download(items=items, download_dest=download_dest, doi=doi, full_lib=full_lib,
-                                                  title=title)
+            # Worker processes only download; attaching stays here so Zotero has a single writer
+            if self.workers is not None:
+                downloaded, pdf_path, md5 = self.workers.fetch_pdf(doi, title=title)
+            else:
+                downloaded, pdf_path, md5 = self.fetch_pdf(doi, title=title, items=items, download_dest=download_dest,
+                                                           full_lib=full_lib)
 
             if not downloaded:
                 print(f"No PDF available for doi: {doi}, moving on.")
+                self.emit("download", doi=doi, status="not_found", keys=zotero_item_keys)
 
             # If a PDF was downloaded, attach it to the Zotero item
             if downloaded:
-                for zotero_item_key in zotero_item_keys:
-
-                    zot = zotero.Zotero(self.ZOT_ID, 'user', self.ZOT_KEY)
-                    if os.path.isfile(pdf_path):
-                        zot.attachment_simple([pdf_path], zotero_item_key)
-                    else:
-                        pdf_path = pdf_path.removeprefix("./")
-                        zot.attachment_simple([pdf_path], zotero_item_key)
+                uploaded = [self.attach_pdf(zot, pdf_path, zotero_item_key, md5=md5) for zotero_item_key in zotero_item_keys]
                 print(f"PDF for {doi} attached successfully.")
-
-            if doi != None:
-                with self.lock:
-                    del self.CITATION_DICT[doi]
+                self.emit("download", doi=doi, status="attached" if any(uploaded) else "unchanged",
+                          keys=zotero_item_keys, path=pdf_path, md5=md5)
 
         except Exception as e:
             print("Exception occurred:\n", e)
             print("Continuing")
+            if job is not DOWNLOADS_DONE:
+                self.emit("download", doi=job[0], status="failed", keys=job[1], error=str(e))
 
-            if doi != None:
-                with self.lock:
-                    del self.CITATION_DICT[doi]
-
-    return 0
+        finally:
+            self.download_queue.task_done()
@@ -0,0 +1,108 @@
+# utils/pdf_store.py
+import hashlib
+import os
+import shutil
+
+try:
+    from .cache import SqliteCache, normalize_doi
+except ImportError:
+    from cache import SqliteCache, normalize_doi
+
+
+def file_digests(path):
+    """
+    Hash a file in one pass.
+
+    Parameters:
+    - path (str): The file to hash.
+
+    Returns:
+    - tuple: (sha256, md5) hex digests of the file contents.
+    """
+    sha256 = hashlib.sha256()
+    md5    = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+            md5.update(chunk)
+    return sha256.hexdigest(), md5.hexdigest()
+
+
+def link_or_copy(source, destination):
+    """
+    Hard link source to destination, copying when the file system can't link.
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class PdfStore:
+    """
+    A content-addressed store of downloaded PDFs.
+
+    Each PDF is kept once under its SHA-256, and an index maps DOIs to hashes,
+    so a paper that was downloaded before is never fetched again. The MD5 is
+    kept alongside because that is what Zotero reports for stored attachments.
+
+    Parameters:
+    - root (str): The directory holding the blobs and the DOI index.
+    """
+    def __init__(self, root):
+        self.root  = root
+        os.makedirs(root, exist_ok=True)
+        self.index = SqliteCache(os.path.join(root, "index.sqlite3"))
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256 + ".pdf")
+
+    def lookup(self, doi):
+        """
+        Return the index entry for a DOI if its PDF is in the store, otherwise None.
+        """
+        if not doi:
+            return None
+        entry = self.index.get(normalize_doi(doi))
+        if entry is None or not os.path.isfile(self.blob_path(entry['sha256'])):
+            return None
+        return entry
+
+    def add(self, doi, path):
+        """
+        Put a downloaded PDF into the store and record it under its DOI.
+
+        Parameters:
+        - doi (str): The DOI the PDF belongs to.
+        - path (str): The downloaded PDF, which is left in place.
+
+        Returns:
+        - dict: The index entry with the sha256, md5 and size of the PDF.
+        """
+        sha256, md5 = file_digests(path)
+        blob = self.blob_path(sha256)
+        if not os.path.isfile(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            link_or_copy(path, blob)
+        entry = {'sha256': sha256, 'md5': md5, 'size': os.path.getsize(blob)}
+        if doi:
+            self.index.set(normalize_doi(doi), entry)
+        return entry
+
+    def checkout(self, entry, path):
+        """
+        Make the stored PDF available at path, e.g. under a readable name for upload.
+        A file already at path is reused only if it holds the stored PDF; a stale or
+        truncated one is replaced, so the entry's md5 always describes path.
+
+        Returns:
+        - str: path
+        """
+        blob = self.blob_path(entry['sha256'])
+        if os.path.isfile(path):
+            if os.path.getsize(path) == entry.get('size') and file_digests(path)[0] == entry['sha256']:
+                return path
+            print(f"{path} doesn't match the stored PDF, replacing it")
+            os.remove(path)
+        link_or_copy(blob, path)
+        return path
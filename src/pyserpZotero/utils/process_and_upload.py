@@ -1,8 +1,385 @@
-from bibtexparser.bparser import BibTexParser
 from datetime import date, datetime
 
-import bibtexparser
-import os
+try:
+    from .cache import normalize_doi
+    from .library_snapshot import LibrarySnapshot
+    from .http_session import get_session
+    from .metrics import get_metrics, span
+    from .near_duplicates import item_year
+    from .rate_limit import zotero_call
+except ImportError:
+    from cache import normalize_doi
+    from library_snapshot import LibrarySnapshot
+    from http_session import get_session
+    from metrics import get_metrics, span
+    from near_duplicates import item_year
+    from rate_limit import zotero_call
+
+def fetch_bib(self, doi):
+    """
+    Fetch and parse the BibTeX for a DOI, using the on-disk DOI cache when one is configured.
+
+    Parameters:
+    - doi (str): The DOI to look up.
+
+    Returns:
+    - tuple: (bibtex (str), bib_dict (dict), comments (list)) for the first BibTeX entry.
+    """
+    cache = getattr(self, 'doi_cache', None)
+    key   = normalize_doi(doi)
+    if cache is not None:
+        cached = cache.get(key)
+        get_metrics().cache_lookup("doi", cached is not None)
+        if cached is not None:
+            print(f"Using cached BibTeX for {doi}")
+            return cached['bibtex'], cached['bib_dict'], cached['comments']
+
+    # Ask the DOI resolver for BibTeX via content negotiation, parsing it straight from memory
+    session = get_session()
+    result  = ""
+    # medArxiv, bioarxiv and arxiv use the doi.org link to get the citation details
+    with span("bibtex"):
+        for url in ('http://dx.doi.org/' + doi, 'https://doi.org/' + doi):
+            try:
+                response = session.get(url, headers={"Accept": "application/x-bibtex"})
+            except Exception as e:
+                print(f"BibTeX request to {url} failed: {str(e)}")
+                continue
+            if response.ok:
+                result = response.content.decode("utf-8", errors="replace")
+            if result.strip():
+                break
+
+    # Parse bibtext
+    import bibtexparser
+    from bibtexparser.bparser import BibTexParser
+    parser = BibTexParser()
+    parser.customization = bibtexparser.customization.author
+    bib_database = bibtexparser.loads(result, parser=parser)
+    bib_dict = bib_database.entries[0]  # IndexError when nothing was found; not cached
+    comments = list(bib_database.comments)
+
+    if cache is not None:
+        cache.set(key, {'bibtex': result, 'bib_dict': bib_dict, 'comments': comments})
+    return result, dict(bib_dict), comments
+
+
+def upload_citations(self, zot, pending, retry=True):
+    """
+    Create a batch of Zotero items in a single write request and hand the created
+    items over to the PDF download stage.
+
+    pyzotero sends every write with a new write token, so a write is only sent again
+    when Zotero's reply shows it wasn't applied (429 or 5xx). When no reply came back
+    the items may have been created anyway, so the library is checked for them first.
+    A batch Zotero refused is split in halves that are written separately, so one
+    bad item doesn't cost the rest of the batch.
+
+    Parameters:
+    - zot (Zotero Object): The library to upload to.
+    - pending (list): Up to 50 (doi, template, bib_dict) tuples.
+    - retry (bool): Try a failed write again before splitting the batch.
+
+    Returns:
+    - (int): The number of items Zotero created.
+    """
+    if not pending:
+        return 0
+
+    print(f"Uploading {len(pending)} citations to Zotero")
+    previous = getattr(zot, "request", None)
+    try:
+        with span("zotero_write", op="create"), zotero_call(zot):
+            cite_upload_response = zot.create_items([template for _, template, _ in pending])
+    except Exception as e:
+        print(f"An error occurred while uploading {len(pending)} citations: {e}")
+        response = getattr(e, "response", None)
+        if response is None and getattr(zot, "request", None) is not previous:
+            response = zot.request
+        status = getattr(response, "status_code", None)
+        if status is None or status < 400:
+            return self.recover_citations(zot, pending, e, retry)
+        if retry and (status == 429 or status >= 500):
+            print("Zotero did not apply the write, trying once more")
+            return self.upload_citations(zot, pending, retry=False)
+        if len(pending) > 1:
+            half = len(pending) // 2
+            print(f"Uploading the {len(pending)} citations in two halves instead")
+            return (self.upload_citations(zot, pending[:half], retry=False)
+                    + self.upload_citations(zot, pending[half:], retry=False))
+        self.fail_citations(pending, e)
+        return 0
+
+    # Zotero reports results keyed by the position of each item in the request
+    successful = cite_upload_response.get('successful', {})
+    failed     = cite_upload_response.get('failed', {})
+    created    = 0
+    for index, (doi, template, bib_dict) in enumerate(pending):
+        if str(index) in successful:
+            self.record_citation(doi, [successful[str(index)]['key']], bib_dict)
+            created += 1
+        elif str(index) in failed:
+            print(f"Zotero rejected the citation for {doi}: {failed[str(index)].get('message')}")
+            self.emit("upload", doi=doi, status="rejected", error=failed[str(index)].get('message'))
+        else:
+            print(f"Zotero did not create an item for {doi}")
+            self.emit("upload", doi=doi, status="failed", error="no result from Zotero")
+
+    metrics = get_metrics()
+    metrics.inc("pyserpzotero_zotero_items_total", created, op="create", result="created")
+    metrics.inc("pyserpzotero_zotero_items_total", len(pending) - created, op="create", result="failed")
+    print(f"\n\n\nCITATION DICT: \n{self.CITATION_DICT}")
+    return created
+
+
+def recover_citations(self, zot, pending, error, retry=True):
+    """
+    Find out which items of a write that got no reply were created anyway, by looking
+    their DOIs up among the items changed since the library was loaded, and write only
+    the others again.
+
+    Parameters:
+    - zot (Zotero Object): The library that was written to.
+    - pending (list): The (doi, template, bib_dict) tuples of the write.
+    - error (Exception): What the write raised.
+    - retry (bool): Write the items that weren't created once more.
+
+    Returns:
+    - (int): The number of items Zotero created.
+    """
+    since = getattr(self.library, 'version', 0) if self.library is not None else 0
+    try:
+        with span("zotero_read", op="recover"), zotero_call(zot):
+            changed = zot.everything(zot.items(since=since)) if since else zot.everything(zot.items())
+    except Exception as e:
+        # Writing blind could create every item twice
+        print(f"Could not check whether the citations were created, not writing them again: {e}")
+        self.fail_citations(pending, error)
+        return 0
+
+    keys = dict()
+    for item in changed:
+        for identifier in LibrarySnapshot.identifiers(item):
+            keys.setdefault(normalize_doi(identifier), item['key'])
+
+    created = 0
+    missing = []
+    for doi, template, bib_dict in pending:
+        key = keys.get(normalize_doi(doi))
+        if key is None:
+            missing.append((doi, template, bib_dict))
+            continue
+        print(f"Zotero created the item for {doi} although the reply was lost")
+        self.record_citation(doi, [key], bib_dict)
+        created += 1
+    get_metrics().inc("pyserpzotero_zotero_items_total", created, op="create", result="created")
+
+    if missing and retry:
+        print(f"Uploading the {len(missing)} citations Zotero did not create once more")
+        return created + self.upload_citations(zot, missing, retry=False)
+    self.fail_citations(missing, error)
+    return created
+
+
+def record_citation(self, doi, zotero_item_key, bib_dict):
+    """
+    Remember an item Zotero created for a DOI and queue its PDF for download.
+    """
+    print("ZOTERO ITEM KEYS: ", zotero_item_key)
+    with self.lock:
+        self.DOI_HOLDER.add(doi)
+        self.CITATION_DICT[doi] = (zotero_item_key, bib_dict)
+    self.emit("upload", doi=doi, status="created", keys=zotero_item_key, title=bib_dict.get('title'))
+    self.queue_download(doi, zotero_item_key, bib_dict)
+
+
+def fail_citations(self, pending, error):
+    """
+    Report the citations of a write that failed.
+    """
+    if not pending:
+        return
+    get_metrics().inc("pyserpzotero_zotero_items_total", len(pending), op="create", result="failed")
+    for doi, _, _ in pending:
+        self.emit("upload", doi=doi, status="failed", error=str(error))
+
+
+def build_citation(self, doi, abstract, template, FIELD):
+    """
+    Fetch the BibTeX for a DOI and fill a Zotero item template with it.
+
+    Parameters:
+    - doi (str): The DOI to cite.
+    - abstract (str): The abstract found with the search result, if any.
+    - template (dict): An empty Zotero journalArticle template.
+    - FIELD (str): The field of the search result to use, default is 'title'.
+
+    Returns:
+    - tuple: (template, bib_dict, problem). problem is None, or why the citation can't be
+      uploaded as it is: no_date, no_author or parse_error. Raises if the BibTeX can't be fetched.
+    """
+    import bibtexparser.customization
+
+    result, bib_dict, comments = self.fetch_bib(doi)
+
+    if self.SAVE_BIB:
+        # If the user wants we can save a copy of the BIB
+        # that won't be overwritten later
+        dt = datetime.now()
+        ts = datetime.timestamp(dt)
+        fn = "my_bib_" + str(ts) + ".bib"
+        text_file = open(fn, "w")
+        n = text_file.write(result)
+        text_file.close()
+
+    # # Parse Names into Template/Data
+    if 'author' not in bib_dict:
+        bib_dict['author'] = ["Unknown, Unknown"]
+
+    # Populate Zotero Template with Data
+    try:
+        template['publicationTitle'] = bib_dict['journal']
+    except:
+        pass
+    try:
+        template['title'] = bib_dict['title']
+    except:
+        pass
+    try:
+        template[FIELD] = bib_dict[FIELD]
+    except:
+        pass
+    try:
+        template['doi'] = str(doi)
+    except:
+        pass
+    try:
+        template['accessDate'] = str(date.today())
+    except:
+        pass
+    try:
+        template['extra'] = str(comments)
+    except:
+        pass
+    try:
+        template['url'] = bib_dict['url']
+    except:
+        pass
+    try:
+        template['volume'] = bib_dict['volume']
+    except:
+        pass
+    try:
+        template['issue'] = bib_dict['number']
+    except:
+        pass
+    try:
+        template['abstractNote'] = abstract
+    except:
+        pass
+    # Fix Date
+    try:
+        mydate = bib_dict['month'] + ' ' + bib_dict['year']
+        template['date'] = str(datetime.strptime(mydate, '%b %Y').date())
+    except:
+        try:
+            mydate = bib_dict['year']
+            template['date'] = str(bib_dict['year'])
+        except:
+            return template, bib_dict, "no_date"
+
+    # Parse Names into Template/Data
+    try:
+        no_author_found = False
+        try:
+            num_authors = len(bib_dict['author'])
+        except:
+            num_authors = 1
+            bib_dict['author'] = ['Unknown Unknown']
+            no_author_found = True
+        template['creators'] = []
+
+        for a in bib_dict['author']:
+            split = bibtexparser.customization.splitname(a, strict_mode=False)
+            template['creators'].append(
+                {'creatorType': 'author', 'firstName': split['first'][0], 'lastName': split['last'][0]})
+        print(template)
+    except Exception as e:
+        print(f"An error occurred while parsing: {e}")
+        return template, bib_dict, "parse_error"
+    return template, bib_dict, "no_author" if no_author_found else None
+
+
+def built_citations(self, doiSet, zot, FIELD):
+    """
+    Build the citation for every DOI, in the worker processes when there are any.
+
+    Yields:
+    - tuple: (doi, template, bib_dict, problem, error), where error is set when the BibTeX couldn't be fetched.
+    """
+    workers = getattr(self, 'workers', None)
+    if workers is not None:
+        yield from workers.citations(doiSet, FIELD)
+        return
+    for doi, abstract in doiSet:
+        template = zot.item_template('journalArticle')  # Set Template
+        try:
+            template, bib_dict, problem = self.build_citation(doi, abstract, template, FIELD)
+        except Exception as e:
+            yield doi, None, None, None, str(e)
+            continue
+        yield doi, template, bib_dict, problem, None
+
+
+def admit_citation(self, doi, template, bib_dict, problem, batched):
+    """
+    Decide whether a built citation should be uploaded, checking it against the library,
+    the near-duplicate index and the citations already queued in this run. PDFs of items
+    that are already in the library but lack one are queued for download instead.
+
+    Parameters:
+    - doi (str): The DOI of the citation.
+    - template (dict): The filled Zotero item template.
+    - bib_dict (dict): The parsed BibTeX entry.
+    - problem (str): What build_citation found wrong with it, if anything.
+    - batched (set): DOIs already queued for upload; doi is added if it is admitted.
+
+    Returns:
+    - (bool): True if the citation should be uploaded.
+    """
+    if template["doi"] in self.DOI_HOLDER:
+        print("Not citation uploading since it's already present in Zotero")
+        if template["doi"] in self.downloadAttachment and self.download_queue is not None:
+            print("Still attempting download since attachment is not present")
+            self.emit("upload", doi=doi, status="exists", keys=[self.downloadAttachment[doi]])
+            self.queue_download(doi, [self.downloadAttachment[doi]], bib_dict)
+        else:
+            self.emit("upload", doi=doi, status="skipped", reason="in_library")
+        return False
+    if problem == "no_author":
+        print("No authors found for this paper, skipping upload to zotero")
+        self.emit("upload", doi=doi, status="skipped", reason="no_author")
+        return False
+    if template.get("title", None) == None:
+        print("Paper does not have a title. Skipping upload to Zotero")
+        self.emit("upload", doi=doi, status="skipped", reason="no_title")
+        return False
+    if self.title_index is not None:
+        year     = item_year(template.get('date'))
+        surnames = [c['lastName'] for c in template['creators']]
+        duplicate = self.title_index.find_duplicate(template['title'], year=year, authors=surnames)
+        if duplicate is not None:
+            print(f"Not uploading {doi}: it looks like {duplicate}, which is already in Zotero")
+            self.emit("upload", doi=doi, status="skipped", reason="near_duplicate", duplicate_of=duplicate)
+            return False
+        # So a preprint and its published version found in the same run aren't both added
+        self.title_index.add(doi, template['title'], year=year, authors=surnames)
+    if doi in batched:
+        print("Citation is already queued for upload")
+        return False
+    batched.add(doi)
+    return True
+
 
 def processBibsAndUpload(self, doiSet, zot, items, FIELD, citation):
     """
@@ -21,146 +398,40 @@ def processBibsAndUpload(self, doiSet, zot, items, FIELD, citation):
 
     if citation:
         print("Starting citation thread")
-        for doi, abstract in doiSet:
-            template = zot.item_template('journalArticle')  # Set Template
-            curl_str = 'curl -LH "Accept: application/x-bibtex" http://dx.doi.org/' + doi
-            result = os.popen(curl_str).read()
-            if not result:
-                # medArxiv, bioarxiv and arxiv use this link to get the citation details
-                curl_str = 'curl -LH "Accept: application/x-bibtex" https://doi.org/' + doi
-                result = os.popen(curl_str).read()
-
-            # Write bibtext file
-            text_file = open("auto_cite.bib", "w")
-            n = text_file.write(result)
-            text_file.close()
-
-            if self.SAVE_BIB:
-                # If the user wants we can save a copy of the BIB
-                # that won't be overwritten later
-                dt = datetime.now()
-                ts = datetime.timestamp(dt)
-                fn = "my_bib_" + str(ts) + ".bib"
-                text_file = open(fn, "w")
-                n = text_file.write(result)
-                text_file.close()
-
-            # Parse bibtext
-            with open('auto_cite.bib') as bibtex_file:
-                parser = BibTexParser()
-                parser.customization = bibtexparser.customization.author
-                bib_database = bibtexparser.load(bibtex_file, parser=parser)
-            try:
-                bib_dict = bib_database.entries[0]
-            except Exception as e:
-                print(f"An error occurred: {str(e)}")
-                continue
-
-            # # Parse Names into Template/Data
-            # try:
-            try:
-                if 'author' not in bib_dict:
-                    bib_dict['author'] = ["Unknown, Unknown"]
-            except Exception as e:
-                print(f"An error occurred: {str(e)}")
-                continue
-
-            # Populate Zotero Template with Data
-            try:
-                template['publicationTitle'] = bib_dict['journal']
-            except:
-                pass
-            try:
-                template['title'] = bib_dict['title']
-            except:
-                pass
-            try:
-                template[FIELD] = bib_dict[FIELD]
-            except:
-                pass
-            try:
-                template['doi'] = str(doi)
-            except:
-                pass
-            try:
-                template['accessDate'] = str(date.today())
-            except:
-                pass
-            try:
-                template['extra'] = str(bib_database.comments)
-            except:
-                pass
-            try:
-                template['url'] = bib_dict['url']
-            except:
-                pass
-            try:
-                template['volume'] = bib_dict['volume']
-            except:
-                pass
-            try:
-                template['issue'] = bib_dict['number']
-            except:
-                pass
-            try:
-                template['abstractNote'] = abstract
-            except:
-                pass
-            # Fix Date
-            try:
-                mydate = bib_dict['month'] + ' ' + bib_dict['year']
-                template['date'] = str(datetime.strptime(mydate, '%b %Y').date())
-            except:
-                try:
-                    mydate = bib_dict['year']
-                    template['date'] = str(bib_dict['year'])
-                except:
+        # The Zotero Web API accepts up to 50 items per write request
+        batch_size = max(1, min(int(getattr(self, 'ZOTERO_BATCH_SIZE', 50) or 50), 50))
+        pending    = []
+        batched    = set()
+        try:
+            # Citations are built here or in the worker processes, but only this thread
+            # writes to Zotero, so each one is uploaded exactly once
+            for doi, template, bib_dict, problem, error in self.built_citations(doiSet, zot, FIELD):
+                if error is not None:
+                    print(f"An error occurred: {error}")
+                    self.emit("upload", doi=doi, status="skipped", reason="no_bibtex", error=error)
+                    continue
+                self.emit("doi", doi=doi, status="resolved")
+                if problem in ("no_date", "parse_error"):
+                    self.emit("upload", doi=doi, status="skipped", reason=problem)
                     continue
 
-            # Parse Names into Template/Data
-            try:
-                no_author_found = False
                 try:
-                    num_authors = len(bib_dict['author'])
-                except:
-                    num_authors = 1
-                    bib_dict['author'] = ['Unknown Unknown']
-                    no_author_found = True
-                template['creators'] = []
-
-                for a in bib_dict['author']:
-                    split = bibtexparser.customization.splitname(a, strict_mode=False)
-                    template['creators'].append(
-                        {'creatorType': 'author', 'firstName': split['first'][0], 'lastName': split['last'][0]})
-                print(template)
-                if template["doi"] in self.DOI_HOLDER:
-                    print("Not citation uploading since it's already present in Zotero")
-                    if template["doi"] in self.downloadAttachment:
-                        print("Still attempting download since attachment is not present")
-                        self.CITATION_DICT[doi] = ([self.downloadAttachment[doi]], bib_dict)
-                    continue
-                if no_author_found:
-                    print("No authors found for this paper, skipping upload to zotero")
-                    continue
-                if template.get("title", None) == None:
-                    print("Paper does not have a title. Skipping upload to Zotero")
-                    continue
-                cite_upload_response = zot.create_items([template])
-                zotero_item_key = []
-                if 'successful' in cite_upload_response:
-                    for key in cite_upload_response['successful']:
-                        zotero_item_key.append(cite_upload_response['successful'][key]['key'])
+                    if not self.admit_citation(doi, template, bib_dict, problem, batched):
+                        continue
 
-                print("ZOTERO ITEM KEYS: ", zotero_item_key)
-                with self.lock:
-                    self.CITATION_DICT[doi] = (zotero_item_key, bib_dict)
-                    print(f"\n\n\nCITATION DICT: \n{self.CITATION_DICT}")
+                    # Queue the citation and write a full batch to Zotero in one request
+                    pending.append((doi, template, bib_dict))
+                    if len(pending) >= batch_size:
+                        self.upload_citations(zot, pending)
+                        pending = []
 
-            except Exception as e:
-                print(f"An error occurred while parsing: {e}")
+                except Exception as e:
+                    print(f"An error occurred while parsing: {e}")
 
-        with self.lock:
-            self.CITATION_DICT["END"] = None
+            self.upload_citations(zot, pending)
+        finally:
+            # Always release the download workers, even if the citation stage fails
+            self.finish_downloads()
     else:
         print("Starting downloading thread")
         full_lib = False
@@ -0,0 +1,261 @@
+# utils/rate_limit.py
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import threading
+import time
+
+# Requests per second, burst size and max concurrent requests for the services we talk to.
+# arXiv asks for one request every three seconds; Crossref's polite pool and the others
+# are kept comfortably under their published limits.
+DEFAULT_LIMITS = {
+    "serpapi.com":      {"rate": 5,     "burst": 5,  "concurrency": 4},
+    "api.crossref.org": {"rate": 10,    "burst": 10, "concurrency": 5},
+    "doi.org":          {"rate": 10,    "burst": 10, "concurrency": 8},
+    "dx.doi.org":       {"rate": 10,    "burst": 10, "concurrency": 8},
+    "export.arxiv.org": {"rate": 1 / 3, "burst": 1,  "concurrency": 1},
+    "arxiv.org":        {"rate": 1,     "burst": 2,  "concurrency": 2},
+    "api.zotero.org":   {"rate": 5,     "burst": 5,  "concurrency": 4},
+}
+DEFAULT_LIMIT = {"rate": 10, "burst": 10, "concurrency": 8}
+
+# Status codes that mean "slow down"
+THROTTLED = (429, 503)
+MAX_BACKOFF = 300
+
+
+def host_of(url):
+    """
+    The host name of a URL, or the argument itself if it is already a bare host.
+    """
+    return (urlsplit(url).hostname or url).lower() if "://" in url else url.lower()
+
+
+def retry_after_seconds(response):
+    """
+    Seconds a response asks us to wait, from its Retry-After or Backoff header.
+    """
+    for header in ("Retry-After", "Backoff"):
+        value = response.headers.get(header)
+        if not value:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class HostState:
+    """
+    Token bucket, concurrency cap and backoff state for one host.
+
+    The refill rate adapts: it is halved whenever the host throttles us and
+    recovers gradually towards the configured rate on successful responses.
+    """
+    def __init__(self, rate, burst, concurrency):
+        self.max_rate      = float(rate)
+        self.rate          = float(rate)
+        self.burst         = float(burst)
+        self.tokens        = float(burst)
+        self.updated       = time.monotonic()
+        self.slots         = threading.BoundedSemaphore(max(1, int(concurrency)))
+        self.backoff_until = 0.0
+        self.strikes       = 0
+        self.lock          = threading.Lock()
+
+    def wait_for_token(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.backoff_until:
+                    delay = self.backoff_until - now
+                else:
+                    self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def throttled(self, delay=None):
+        with self.lock:
+            self.strikes += 1
+            self.rate     = max(self.max_rate / 64, self.rate / 2)
+            if delay is None:
+                delay = min(MAX_BACKOFF, 2 ** self.strikes)
+            self.backoff_until = max(self.backoff_until, time.monotonic() + min(delay, MAX_BACKOFF))
+            self.tokens = 0
+
+    def succeeded(self):
+        with self.lock:
+            self.strikes = 0
+            self.rate    = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+def _shared(index):
+    return property(lambda self: self.values[index], lambda self, value: self.values.__setitem__(index, value))
+
+
+class SharedHostState(HostState):
+    """
+    A HostState kept in shared memory, so the processes of a multi-process run draw
+    from one token bucket, one set of concurrency slots and one backoff per host.
+
+    It has to be created before the worker processes are started and handed to them.
+
+    Parameters:
+    - context: The multiprocessing context the worker processes are started with.
+    """
+    rate          = _shared(0)
+    tokens        = _shared(1)
+    updated       = _shared(2)
+    backoff_until = _shared(3)
+    strikes       = _shared(4)
+
+    def __init__(self, context, rate, burst, concurrency):
+        self.values = context.RawArray('d', 5)   # Guarded by self.lock
+        super().__init__(rate, burst, concurrency)
+        self.slots  = context.BoundedSemaphore(max(1, int(concurrency)))
+        self.lock   = context.Lock()
+
+
+class RequestScheduler:
+    """
+    Paces requests per host with token buckets and concurrency caps, and backs
+    off when a host answers 429/503 or sends Retry-After/Backoff headers.
+
+    Parameters:
+    - limits (dict): Host mapped to {"rate", "burst", "concurrency"} overrides.
+    """
+    def __init__(self, limits=None):
+        self.limits = {host: dict(limit) for host, limit in DEFAULT_LIMITS.items()}
+        self.hosts  = dict()
+        self.share  = 1.0
+        self._lock  = threading.Lock()
+        self.configure(limits or {})
+
+    def configure(self, limits):
+        """
+        Override the limits of some hosts, e.g. from the RATE_LIMITS config entry.
+        """
+        with self._lock:
+            for host, limit in limits.items():
+                self.limits[host.lower()] = {**self.limits.get(host.lower(), DEFAULT_LIMIT), **limit}
+                self.hosts.pop(host.lower(), None)
+
+    def scale(self, share):
+        """
+        Keep to a share of every host's limits, e.g. 1/N in each of N worker processes,
+        so that together they stay within what one process would send. Hosts adopted
+        from share_hosts keep their shared limits.
+        """
+        with self._lock:
+            self.share = share
+            self.hosts = {host: state for host, state in self.hosts.items() if isinstance(state, SharedHostState)}
+
+    def share_hosts(self, context):
+        """
+        Move the state of every host with configured limits into shared memory, for worker
+        processes to adopt. Scaling a host's limits down by the number of processes can't
+        go below one request at a time per process, and a backoff would only slow down the
+        process that was throttled, so the hosts we know are paced for all processes at once.
+
+        Parameters:
+        - context: The multiprocessing context the worker processes will be started with.
+
+        Returns:
+        - dict: Host name mapped to its SharedHostState.
+        """
+        with self._lock:
+            for host, limit in self.limits.items():
+                if not isinstance(self.hosts.get(host), SharedHostState):
+                    self.hosts[host] = SharedHostState(context, limit["rate"], limit["burst"], limit["concurrency"])
+            return {host: state for host, state in self.hosts.items() if isinstance(state, SharedHostState)}
+
+    def adopt(self, states):
+        """
+        Pace hosts with the shared states of the coordinating process, see share_hosts.
+        """
+        with self._lock:
+            self.hosts.update(states)
+
+    def state(self, host):
+        with self._lock:
+            if host not in self.hosts:
+                limit = self.limits.get(host, DEFAULT_LIMIT)
+                self.hosts[host] = HostState(rate=limit["rate"] * self.share,
+                                             burst=max(1, limit["burst"] * self.share),
+                                             concurrency=max(1, int(limit["concurrency"] * self.share)))
+            return self.hosts[host]
+
+    @contextmanager
+    def slot(self, url):
+        """
+        Hold one request slot for the host of url, waiting for the host's
+        concurrency cap, any active backoff and a token from its bucket.
+        """
+        state = self.state(host_of(url))
+        with state.slots:
+            state.wait_for_token()
+            yield state
+
+    def observe(self, url, response):
+        """
+        Adapt the host's pace to a response it sent.
+        """
+        state = self.state(host_of(url))
+        delay = retry_after_seconds(response)
+        if response.status_code in THROTTLED:
+            print(f"{host_of(url)} is throttling us (HTTP {response.status_code}), backing off")
+            state.throttled(delay)
+        elif delay:
+            # Zotero sends Backoff on successful responses when it is under load
+            state.throttled(delay)
+        else:
+            state.succeeded()
+
+
+_scheduler      = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Return the process-wide request scheduler, creating it on first use.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RequestScheduler()
+    return _scheduler
+
+
+@contextmanager
+def zotero_call(zot):
+    """
+    Pace a pyzotero call like any other request to api.zotero.org, and adapt to the
+    response it got, including when pyzotero raised on it (e.g. on a 429).
+    """
+    scheduler = get_scheduler()
+    previous  = getattr(zot, "request", None)
+    response  = None
+    try:
+        with scheduler.slot("api.zotero.org"):
+            yield
+    except Exception as e:
+        response = getattr(e, "response", None)
+        raise
+    finally:
+        # pyzotero keeps the last response on the client; an unchanged one belongs to an earlier call
+        if response is None and getattr(zot, "request", None) is not previous:
+            response = zot.request
+        if getattr(response, "status_code", None) is not None:
+            scheduler.observe("api.zotero.org", response)
@@ -1,16 +1,195 @@
 #.utils.search2zotero.py
+import queue
 import threading
-from pyzotero import zotero
 
 import json
-import pandas as pd
-import requests
-import re
-import urllib.parse
 try:
     from .arxiv_helpers import *
+    from .cache import normalize_doi
+    from .endpoints import zotero_client
+    from .metrics import span
+    from .library_snapshot import LibrarySnapshot
+    from .near_duplicates import TitleLSH
+    from .journal import FINAL_STAGES
 except:
     from arxiv_helpers import *
+    from cache import normalize_doi
+    from endpoints import zotero_client
+    from metrics import span
+    from library_snapshot import LibrarySnapshot
+    from near_duplicates import TitleLSH
+    from journal import FINAL_STAGES
+
+def load_library(self, zot):
+    """
+    Get the Zotero library, syncing only what changed since the last run when a
+    local snapshot is enabled.
+
+    Parameters:
+    - zot (Zotero Object): The library to load.
+
+    Returns:
+    - (LibrarySnapshot): The up to date library with its DOI/URL index.
+    """
+    with span("library_sync"):
+        if self.library_snapshot is not None:
+            self.library_snapshot.sync(zot)
+            library = self.library_snapshot
+        else:
+            library = LibrarySnapshot()
+            # Read first, so a write that loses its reply can look up what changed since
+            library.version = zot.last_modified_version()
+            for item in zot.everything(zot.items()):
+                library.add(item)
+    self.library = library
+
+    if self.FUZZY_DEDUPE_THRESHOLD:
+        with span("title_index"):
+            self.title_index = TitleLSH.from_items(library.all_items(), threshold=self.FUZZY_DEDUPE_THRESHOLD)
+        print(f"Indexed {len(self.title_index)} titles for near-duplicate detection.")
+    return library
+
+
+def search_term(self, term, options):
+    """
+    Search one term in this process.
+
+    Returns:
+    - (set): The (doi, abstract) pairs the term found.
+    """
+    print(f"Searching Scholar for: {term}")
+    self.search_scholar(term=term, **options)
+    return set(self.doiSet)
+
+
+def batch_search2zotero(self, terms, min_year="", download_sources=None, max_searches=50, download_lib=True,
+                        FIELD="title", concurrent=True, source_timeout=None, run_id=None):
+    """
+    Search several terms and add everything they find to Zotero in one pass.
+
+    The library is synced once, candidates from all terms are collected and de-duplicated
+    by DOI, DOIs that are already in the library with an attachment are dropped, and a single
+    citation/upload/download pass runs over what is left.
+
+    Parameters:
+    - terms (list): The search terms.
+    - min_year (str): The earliest publication year for articles.
+    - download_sources (dict): The sources to search, as for search_scholar.
+    - max_searches (int): The max number of Google Scholar results per term.
+    - download_lib (bool): Whether to load the Zotero library to avoid duplicates.
+    - FIELD (str): The field of the search result to use, default is 'title'.
+    - concurrent (bool): Query the sources of each term at the same time.
+    - source_timeout (float or dict): Seconds to wait for each source, as for search_scholar.
+    - run_id (int): Job journal run these terms belong to. Terms the run already searched
+      and DOIs it already finished are skipped. None starts (and finishes) a run of its own.
+
+    Returns:
+    - (int): Status code indicating the operation's success (0) or failure.
+    """
+    journal = self.journal
+    own_run = journal is not None and run_id is None
+    if own_run:
+        run_id = journal.start_run(terms, dict(min_year=min_year, download_sources=download_sources,
+                                               max_searches=max_searches, download_lib=download_lib, FIELD=FIELD,
+                                               concurrent=concurrent, source_timeout=source_timeout))
+    self.run_id = run_id
+    searched    = journal.searched_terms(run_id) if journal is not None else dict()
+
+    if download_lib:
+        zot = zotero_client(self.ZOT_ID, self.ZOT_KEY)
+        self.load_library(zot)
+
+    # Search the terms the run hasn't searched yet, across the worker processes when there are any
+    results = {term: searched[term] for term in terms if term in searched}
+    for term, doiSet in results.items():
+        print(f"Already searched in run {run_id}, taking its results from the job journal: {term}")
+        self.emit("term", term=term, dois=len(doiSet))
+    options = dict(min_year=min_year, download_sources=download_sources, max_searches=max_searches,
+                   concurrent=concurrent, source_timeout=source_timeout)
+    pending = [term for term in terms if term not in results]
+    workers = self.start_workers() if len(pending) > 1 else self.workers
+    if workers is not None:
+        print(f"Searching Scholar for {len(pending)} terms in {workers.processes} worker processes")
+        outcomes = ((term, set(dois)) for term, dois in workers.search(pending, options))
+    else:
+        outcomes = ((term, self.search_term(term, options)) for term in pending)
+    for term, doiSet in outcomes:
+        if workers is not None:
+            self.serp_requests = workers.serp_requests.value
+        results[term] = doiSet
+        # A term the SerpApi budget may have cut short is searched again on resume
+        if self.serp_budget_spent():
+            self.emit("term", term=term, dois=len(doiSet), status="budget_exhausted")
+            break
+        if journal is not None:
+            journal.record_term(run_id, term, doiSet)
+        self.emit("term", term=term, dois=len(doiSet))
+    # Once the budget is used up, the remaining terms are left for a resumed run
+    for term in pending:
+        if term not in results:
+            self.emit("term", term=term, status="budget_exhausted", reason="not searched")
+
+    candidates = dict()
+    found_by   = dict()
+    for term in terms:
+        for doi, abstract in results.get(term, ()):
+            key = normalize_doi(doi)
+            found_by.setdefault(key, []).append(term)
+            # Keep one candidate per DOI, preferring one that came with an abstract
+            if key not in candidates or (candidates[key][1] is None and abstract is not None):
+                candidates[key] = (doi, abstract)
+
+    found = len(candidates)
+    known, missing = set(), set()
+    if self.library is not None:
+        known   = {normalize_doi(doi) for doi in self.library.doi_index}
+        missing = {normalize_doi(doi) for doi in self.library.missing_attachments()}
+    for key, (doi, _) in candidates.items():
+        status = "missing_pdf" if key in missing else "in_library" if key in known else "new"
+        self.emit("doi", doi=doi, status=status, terms=found_by[key])
+    candidates = {key: candidate for key, candidate in candidates.items() if key not in known or key in missing}
+
+    # DOIs the run already finished are done; uploaded ones may still need their PDF
+    self.resumed_uploads = dict()
+    if journal is not None:
+        states = journal.doi_states(run_id)
+        for key in list(candidates):
+            stage, item_keys = states.get(key, (None, []))
+            if stage in FINAL_STAGES or (stage == "uploaded" and (not self.enable_pdf_download or not item_keys)):
+                del candidates[key]
+            elif stage == "uploaded":
+                self.resumed_uploads[candidates[key][0]] = item_keys[0]
+    print(f"Found {found} unique DOIs across {len(terms)} terms, {len(candidates)} still to process.")
+
+    self.doiSet = set(candidates.values())
+    status = self.search2zotero(query="; ".join(terms), FIELD=FIELD, download_lib=download_lib)
+    if own_run and not self.serp_budget_spent():
+        journal.finish_run(run_id)
+    return status
+
+
+def resume_search2zotero(self, run_id=None):
+    """
+    Resume a batch run recorded in the job journal where it stopped: terms it already
+    searched are not searched again and DOIs it already uploaded are not uploaded again.
+
+    Parameters:
+    - run_id (int): The run to resume. None resumes the most recent unfinished run.
+
+    Returns:
+    - (int): Status code indicating the operation's success (0) or failure.
+    """
+    run = self.journal.get_run(run_id) if self.journal is not None else None
+    if run is None:
+        print("There is no unfinished run in the job journal to resume." if run_id is None
+              else f"Run {run_id} is not in the job journal.")
+        return 1
+    print(f"Resuming run {run['id']} with {len(run['terms'])} terms")
+    status = self.batch_search2zotero(run['terms'], run_id=run['id'], **run['params'])
+    # A run that failed again, or was cut short by the SerpApi budget, stays resumable
+    if status == 0 and not self.serp_budget_spent():
+        self.journal.finish_run(run['id'])
+    return status
 
 # Convert RIS Result ID to Bibtex Citation
 def search2zotero(self, query, FIELD="title", download_lib=True):
@@ -23,22 +202,16 @@ def search2zotero(self, query, FIELD="title", download_lib=True):
     Returns:
     - (int): Status code indicating the operation's success (0) or failure.
     """
-    df = pd.DataFrame()
-
-    try:
-        df = self.df
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        print("Missing a search result dataframe.")
-
     # Connect to Zotero
-    zot = zotero.Zotero(self.ZOT_ID, 'user', self.ZOT_KEY)
+    zot = zotero_client(self.ZOT_ID, self.ZOT_KEY)
     # template = zot.item_template('journalArticle')  # Set Template
 
     # Retrieve doi numbers of existing articles to avoid duplication of citations
     items = []
+    library = LibrarySnapshot()
     if download_lib:
-        items = zot.everything(zot.items())
+        library = self.library if self.library is not None else self.load_library(zot)
+        items   = library.all_items()
 
     else:
         json_data = '''{
@@ -91,25 +264,19 @@ def search2zotero(self, query, FIELD="title", download_lib=True):
         items = [data_dict]
 
     if not self.DOI_HOLDER:  # Populate it only if it's empty
-        for item in items:
-            try:
-                doi = item["data"].get("doi") or item["data"].get("DOI")
-                if not doi:
-                    raise KeyError
-                self.DOI_HOLDER.add(doi)
-                if item['links'].get('attachment') == None:
-                    # This could also be a pdf document.
-                    if item['data'].get('parentItem') != None:
-                        continue
-                    self.downloadAttachment[doi] =  item['key']
-            except KeyError:
-                try:
-                    url = item['data']['url']
-                    if url:
-                        self.DOI_HOLDER.add(url)
-                except:
-                    continue
+        self.DOI_HOLDER.update(library.doi_index)
+        self.downloadAttachment.update(library.missing_attachments())
+    # Items a resumed run created before it stopped, so only their PDFs are fetched
+    for doi, item_key in getattr(self, 'resumed_uploads', {}).items():
+        self.DOI_HOLDER.add(doi)
+        self.downloadAttachment[doi] = item_key
     doiSet = self.doiSet
+
+    # Cited DOIs flow to the download workers through a bounded queue
+    self.download_queue = None
+    if self.enable_pdf_download:
+        self.download_queue = queue.Queue(maxsize=self.DOWNLOAD_QUEUE_SIZE)
+
     citation_thread = threading.Thread(target=self.processBibsAndUpload,
                                        args=(doiSet, zot, items, FIELD, True))
     upload_thread = threading.Thread(target=self.processBibsAndUpload,
@@ -121,6 +288,7 @@ def search2zotero(self, query, FIELD="title", download_lib=True):
     citation_thread.join()
     upload_thread.join()
 
+    self.export_metrics()
     return 0
 
 '''
@@ -1,31 +1,184 @@
 #.utils.search_scholar.py
 
 # Libraries
-from serpapi import GoogleSearch
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
 import json
-import pandas as pd
-import requests
 from urllib.parse import urlencode
-import urllib.request as libreq
 import re 
+import time
+try:
+    from .cache import serp_cache_key
+    from .metrics import get_metrics, span
+    from .near_duplicates import item_year
+    from .http_session import DEFAULT_TIMEOUT, get_session
+except ImportError:
+    from cache import serp_cache_key
+    from metrics import get_metrics, span
+    from near_duplicates import item_year
+    from http_session import DEFAULT_TIMEOUT, get_session
+
+# SerpApi engine -> pipeline stage it is timed under
+SERP_STAGES = {"google_scholar": "serp_page", "google_scholar_cite": "cite_lookup"}
+
+# SERP_CACHE_MODE values: "on" reads and fills the cache, "record" always queries SerpApi
+# and refreshes the cache, "replay" answers only from the cache and never queries SerpApi.
+# Only SerpApi is cached: Crossref, arXiv, medRxiv, bioRxiv and the PDF sources still go out
+SERP_CACHE_MODES = ("off", "on", "record", "replay")
+
+# Scholar titles shorter than this are too generic to skip a result on before its DOI is known
+PREFILTER_MIN_WORDS = 4
+
+
+def scholar_result_metadata(result):
+    """
+    The year and author surnames of a Google Scholar result, from its publication_info,
+    e.g. {"summary": "A Smith, B Jones - Nature, 2020 - nature.com", "authors": [...]}.
+
+    Returns:
+    - tuple: (int or None, list of str) year and surnames.
+    """
+    info = result.get('publication_info') or {}
+    if not isinstance(info, dict):
+        return None, []
+    parts = str(info.get('summary') or "").split(" - ")
+    names = [author.get('name', "") for author in info.get('authors') or []]
+    # The authors come first, unless Scholar only has the venue and year
+    if len(parts) > 1 and item_year(parts[0]) is None:
+        names = names or parts[0].split(",")
+        parts = parts[1:]
+    # Scholar abbreviates given names ("A Smith") and cuts long lists off with an ellipsis
+    surnames = [name.split()[-1] for name in names if name.strip() and "\u2026" not in name]
+    return item_year(" - ".join(parts)), surnames
+
+
+def deadline_timeout(deadline):
+    """
+    The (connect, read) timeout for a request a source makes before its deadline.
+
+    Parameters:
+    - deadline (float): time.monotonic() by which the source must be done, or None.
+
+    Returns:
+    - tuple: The timeout to pass to the session. Raises TimeoutError once the deadline has passed.
+    """
+    if deadline is None:
+        return DEFAULT_TIMEOUT
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("source deadline has passed")
+    return (min(DEFAULT_TIMEOUT[0], left), min(DEFAULT_TIMEOUT[1], left))
 
 
-def serpSearch(self, term, min_year, save_bib, max_searches):
+class SerpBudgetExceeded(RuntimeError):
     """
-    Searches on medArxiv and returns adds the dois to a list
+    Raised instead of querying SerpApi once SERP_BUDGET requests have been made.
+    """
+
+
+class SerpCacheMiss(LookupError):
+    """
+    Raised in replay mode for a SerpApi query that isn't in the cache. It is never
+    swallowed like a failed search, so a replay that isn't complete fails loudly.
+    """
+
+
+def serp_request(self, params, raw=False, deadline=None):
+    """
+    Run one SerpApi query, paced by the serpapi.com rate limit and answered from the
+    local response cache when it has seen the same query before.
+
+    Parameters:
+    - params (dict): The SerpApi query parameters.
+    - raw (bool): Return the raw JSON text instead of the parsed dict.
+    - deadline (float): time.monotonic() by which the query must be answered, or None.
+
+    Returns:
+    - (dict or str): The SerpApi response.
+    """
+    cache = getattr(self, 'serp_cache', None)
+    mode  = getattr(self, 'SERP_CACHE_MODE', "off") if cache is not None else "off"
+    key   = serp_cache_key(params) if mode != "off" else None
+
+    if mode in ("on", "replay"):
+        response = cache.get(key)
+        get_metrics().cache_lookup("serp", response is not None)
+        if response is not None:
+            return json.dumps(response) if raw else response
+        if mode == "replay":
+            raise SerpCacheMiss(f"SerpApi query not in the replay cache: {params.get('engine')} {params.get('q')!r}")
+
+    # Raises once the deadline has passed, before a credit is spent on the query
+    timeout = deadline_timeout(deadline)
+
+    # Only requests that reach SerpApi cost credits, so cache hits don't count against the budget
+    # Worker processes share the coordinator's count, so the budget holds across all of them
+    budget = getattr(self, 'SERP_BUDGET', None)
+    shared = getattr(self, 'shared_serp_requests', None)
+    with self.lock, (shared.get_lock() if shared is not None else nullcontext()):
+        spent = shared.value if shared is not None else self.serp_requests
+        if budget is not None and spent >= budget:
+            raise SerpBudgetExceeded(f"SerpApi budget of {budget} requests is used up")
+        if shared is not None:
+            shared.value += 1
+        self.serp_requests += 1
+
+    # The query is sent through the pooled session, which paces it as serpapi.com and backs off
+    # when SerpApi throttles, instead of through the client's own requests.get
+    from serpapi import GoogleSearch
+    search = GoogleSearch(params)
+    search.params_dict["output"] = "json"
+    url, query = search.construct_url("/search")
+    with span(SERP_STAGES.get(params.get("engine"), "serpapi")):
+        response = get_session().get(url, params=query, timeout=timeout).json()
+
+    # Errors (bad key, out of credits, ...) are not worth replaying
+    if key is not None and isinstance(response, dict) and "error" not in response:
+        cache.set(key, response)
+    return json.dumps(response) if raw else response
+
+
+def serp_budget_spent(self):
+    """
+    Whether SERP_BUDGET requests have been made, by this process and any worker processes.
+    Searches made since then may have been cut short.
+
+    Returns:
+    - (bool): True once the budget is used up, False without a budget.
+    """
+    budget  = getattr(self, 'SERP_BUDGET', None)
+    workers = getattr(self, 'workers', None)
+    shared  = workers.serp_requests if workers is not None else getattr(self, 'shared_serp_requests', None)
+    spent   = shared.value if shared is not None else self.serp_requests
+    return budget is not None and spent >= budget
+
+
+def iter_scholar_pages(self, term, min_year, max_searches, page_size=20, deadline=None):
+    """
+    Yields Google Scholar results page by page until the search budget is spent.
+
+    Paging stops early when a page comes back short or brings no result ids that
+    earlier pages didn't already have, so no SerpApi credits are spent past the
+    end of the results.
 
     Parameters:
     - term (str): The query to search for
     - min_year(int): The year after which the search should be done
+    - max_searches (int): The maximum number of results to fetch
+    - page_size (int): Results per page; Google Scholar returns at most 20
+    - deadline (float): time.monotonic() after which no further page is requested
 
     Returns:
-    - (list): a list of DOIs
+    - (generator): Lists of new organic result records, one list per page
     """
-    # Search Parameters
-    
-    google_local_search_count_per_pages = 20      # Only 20 search results per pages 
-    start = 0                                     # Start is the page number in search
-    while( max_searches > 0 ):
+    seen      = set()
+    start     = 0                                 # Offset of the first result on the page
+    remaining = max_searches
+    while remaining > 0:
+        if deadline is not None and time.monotonic() >= deadline:
+            print(f"Out of time for Google Scholar, stopping after {start} results")
+            return
+        num    = min(page_size, remaining)
         params = {
             "api_key": self.SERP_API_KEY,
             "device": "desktop",
@@ -33,97 +186,150 @@ def serpSearch(self, term, min_year, save_bib, max_searches):
             "q": term,
             "hl": "en",
             "start": str(start),
-            "num": max_searches,
+            "num": num,
             "as_ylo": min_year
         }
-        max_searches -= google_local_search_count_per_pages
-        start += google_local_search_count_per_pages
-            
-        # Search
-        search = GoogleSearch(params)
-        # Set SAVE_BIB for search2_zotero
-        self.SAVE_BIB = save_bib
-
-        # Scrape Results, Extract Result Id's
-        df = pd.DataFrame()  # ignore warning - it gets used
         try:
-            json_data = search.get_raw_json()
-            data = json.loads(json_data)
-            if (self.df.empty):
-                self.df = pd.json_normalize(data['organic_results'])
-            else:
-                self.df = self.df._append(pd.json_normalize(data['organic_results']), ignore_index = True)
-            df = self.df
-            ris = df['result_id']
-            self.ris = ris
+            data = json.loads(self.serp_request(params, raw=True, deadline=deadline))
+        except SerpBudgetExceeded as e:
+            print(f"{e}, stopping Google Scholar after {start} results")
+            return
+        except SerpCacheMiss:
+            raise
         except Exception as e:
-            print(f"An error occurred while filling into Pandas: {str(e)}")
+            print(f"An error occurred while searching Google Scholar: {str(e)}")
+            return
+        results = data.get('organic_results') or []
+        new     = [r for r in results if r.get('result_id') not in seen]
+        seen.update(r.get('result_id') for r in new)
+        if new:
+            yield new
+        if len(results) < num or not new:
+            return
+        remaining -= num
+        start     += num
+
+
+def serpSearch(self, term, min_year, save_bib, max_searches, deadline=None):
+    """
+    Searches Google Scholar and resolves the results to DOIs
 
+    Nothing is stored on self, so a search that outlives its timeout can't
+    interfere with the next one.
 
-    df = pd.DataFrame()
-    doiList = []
-    try:
-        df = self.df
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        print("Missing a search result dataframe.")
+    Parameters:
+    - term (str): The query to search for
+    - min_year(int): The year after which the search should be done
+    - save_bib (bool): Unused; search_scholar sets SAVE_BIB
+    - max_searches (int): The maximum number of results to fetch
+    - deadline (float): time.monotonic() by which to stop; results resolved by then are returned
 
+    Returns:
+    - (list): a list of (DOI, abstract) tuples
+    """
+    import pandas as pd
+
+    # Scrape Results, Extract Result Id's; the DataFrame is built once from all pages
+    records = [record for page in self.iter_scholar_pages(term, min_year, max_searches, deadline=deadline)
+               for record in page]
+    df  = pd.json_normalize(records) if records else pd.DataFrame()
+    ris = list(df['result_id']) if 'result_id' in df else []
+    print(f"Number of items to process : {len(ris)}")
+
+    # Processing everything we got from search_scholar. The cite and Crossref lookups for
+    # each result are independent, so they run on a bounded pool; map() keeps the order.
+    snippets = list(df['snippet']) if 'snippet' in df else [None] * len(ris)
+
+    # Drop results that are near-duplicates of papers already in the library before paying for
+    # their cite and Crossref lookups. Only titles long enough to be specific count, and the
+    # year and authors must agree where Scholar has them; admit_citation checks the rest later.
+    title_index = getattr(self, 'title_index', None)
+    if title_index is not None and len(records) == len(ris):
+        keep = []
+        for n, record in enumerate(records):
+            title = record.get('title')
+            if isinstance(title, str) and len(title.split()) >= PREFILTER_MIN_WORDS:
+                year, surnames = scholar_result_metadata(record)
+                if title_index.find_duplicate(title, year=year, authors=surnames):
+                    continue
+            keep.append(n)
+        if len(keep) < len(ris):
+            print(f"Skipping {len(ris) - len(keep)} results that are already in your library")
+        ris      = [ris[n] for n in keep]
+        snippets = [snippets[n] for n in keep]
+
+    workers  = max(1, int(getattr(self, 'RESOLVE_WORKERS', 1) or 1))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resolve") as executor:
+        resolved = executor.map(lambda result_id, snippet: self.resolveResultId(result_id, snippet, deadline=deadline),
+                                ris, snippets)
+        doiList  = [doi for doi in resolved if doi is not None]
 
-    try:
-        ris = self.ris
-        print(f"Number of items to process : {len(ris)}")
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        print("No results? Or an API key problem, maybe?")
-        print("Fatal error!")
-        ris = ""
+    print("Completed SerpApi search! DOIs found:")
+    for doi in doiList:
+        print(doi)
+
+    return doiList
+
+def resolveResultId(self, result_id, snippet=None, deadline=None):
+    """
+    Resolves a Google Scholar result id to a DOI via its citation and Crossref
 
-    # Processing everything we got from search_scholar
-    for i in ris:
-        # Announce status
-        print(f'Now processing: {i}')
+    Parameters:
+    - result_id (str): The Google Scholar result id to resolve
+    - snippet (str): The search result snippet, kept as the abstract
+    - deadline (float): time.monotonic() after which the result is not looked up
+
+    Returns:
+    - (tuple): (doi, snippet), or None if the lookup failed
+    """
+    if deadline is not None and time.monotonic() >= deadline:
+        return None
+
+    # Announce status
+    print(f'Now processing: {result_id}')
 
+    try:
         # Get the Citation from SerpApi search!
         params = {
             "api_key": self.SERP_API_KEY,
             "device": "desktop",
             "engine": "google_scholar_cite",
-            "q": i
+            "q": result_id
         }
 
-        search = GoogleSearch(params)
-        citation = search.get_dict()
+        try:
+            citation = self.serp_request(params, deadline=deadline)
+        except SerpBudgetExceeded:
+            # The term is reported as cut short by the budget; no need to say so for every result
+            return None
 
         # Cross-reference the Citation with Crossref to Get Bibtext
         base     = 'https://api.crossref.org/works?query.'
         api_url  = {'bibliographic': citation['citations'][1]['snippet']}
         url      = urlencode(api_url)
         url      = base + url
-        response = requests.get(url)
-
-        # Parse Bibtext from Crossref
-        try:
+        with span("crossref"):
+            response     = get_session().get(url, timeout=deadline_timeout(deadline))
             jsonResponse = response.json()
-            jsonResponse = jsonResponse['message']
-            jsonResponse = jsonResponse['items']
-            jsonResponse = jsonResponse[0]
-        except Exception as e:
-            print(f"An error occurred: {str(e)}")
-            continue
-        doiList.append((jsonResponse['DOI'], df['snippet'][0]))
 
-    print("Completed SerpApi search! DOIs found:")
-    for doi in doiList:
-        print(doi)
-
-    return doiList
+        # Parse Bibtext from Crossref
+        jsonResponse = jsonResponse['message']
+        jsonResponse = jsonResponse['items']
+        jsonResponse = jsonResponse[0]
+        return (jsonResponse['DOI'], snippet if isinstance(snippet, str) else None)
+    except SerpCacheMiss:
+        raise
+    except Exception as e:
+        print(f"An error occurred while resolving {result_id}: {str(e)}")
+        return None
 
-def searchArxiv( self, query ):
+def searchArxiv( self, query, deadline=None ):
     """
     Searches on arxiv and returns adds the dois to a list
 
     Parameters:
     - query (str): The query to search for
+    - deadline (float): time.monotonic() by which the search must be done
 
     Returns:
     - (list): a list of DOIs
@@ -133,7 +339,7 @@ def searchArxiv( self, query ):
     doiList = []
     # arXiv processing of DOIs
     url = f"http://export.arxiv.org/api/query?search_query=all:{queryStr}&start=0&max_results=50"
-    r = libreq.urlopen(url).read()
+    r = get_session().get(url, timeout=deadline_timeout(deadline)).content
     out = re.findall('http:\/\/dx.doi.org\/[^"]*', str(r))
     arxivCount = 0
     for doiLink in out:
@@ -150,12 +356,13 @@ def searchArxiv( self, query ):
         print(doi[0])
     return doiList
 
-def searchMedArxiv(self, query):
+def searchMedArxiv(self, query, deadline=None):
     """
     Searches on medArxiv and returns adds the dois to a list
 
     Parameters:
     - query (str): The query to search for
+    - deadline (float): time.monotonic() by which the search must be done
 
     Returns:
     - (list): a list of DOIs
@@ -166,7 +373,7 @@ def searchMedArxiv(self, query):
     queryStr = "+".join(queryList)
     doiList = []
     medUrl = f"https://www.medrxiv.org/search/{queryStr}"
-    response = requests.get(medUrl)
+    response = get_session().get(medUrl, timeout=deadline_timeout(deadline))
 
     # process all the DOIs we find
     medDois = re.findall("\/\/doi.org\/([^\s]+)", response.text)
@@ -187,12 +394,13 @@ def searchMedArxiv(self, query):
 
     return doiList
 
-def boiArxivSearch(self, query):
+def boiArxivSearch(self, query, deadline=None):
     """
     Searches on bioArxiv and returns adds the dois to a list
 
     Parameters:
     - query (str): The query to search for
+    - deadline (float): time.monotonic() by which the search must be done
 
     Returns:
     - (list): a list of DOIs
@@ -203,7 +411,7 @@ def boiArxivSearch(self, query):
     queryStr = "+".join(queryList)
     doiList = []
     bioUrl = f"https://www.biorxiv.org/search/{queryStr}"
-    response = requests.get(bioUrl)
+    response = get_session().get(bioUrl, timeout=deadline_timeout(deadline))
 
     # process all the DOIs we find
     bioDois = re.findall("\/\/doi.org\/([^\s]+)", response.text)
@@ -225,7 +433,8 @@ def boiArxivSearch(self, query):
 
 
 # Search for RIS Result ID's on Google Scholar
-def search_scholar(self, term="", min_year="", save_bib=False, download_sources=None, max_searches=50):
+def search_scholar(self, term="", min_year="", save_bib=False, download_sources=None, max_searches=50,
+                   concurrent=True, source_timeout=None):
     """
     Search Google Scholar for articles matching the specified criteria and update Zotero library.
 
@@ -234,6 +443,9 @@ def search_scholar(self, term="", min_year="", save_bib=False, download_sources=
     - min_year (str): The earliest publication year for articles.
     - save_bib (bool): Whether to save the search results as a BibTeX file.
     - max_searches (int): The integer value of this is the max number of searches that has to be done 
+    - concurrent (bool): Query all enabled sources at the same time instead of one after another.
+    - source_timeout (float or dict): Seconds to wait for each source in concurrent mode, either one
+      value for all sources or a dict keyed like download_sources. None waits indefinitely.
 
     Returns:
     - (int): Status code indicating success (0) or failure (non-zero).
@@ -250,22 +462,106 @@ def search_scholar(self, term="", min_year="", save_bib=False, download_sources=
             "bioArxiv": 1,
         }
 
-    if download_sources.get('serp'):
-        print("Starting Serp Search")
-        serpDoiList = self.serpSearch(term, min_year, save_bib, max_searches)
-        doiSet.update(serpDoiList)
-
-    if download_sources.get('arxiv'):
-        arxivSearchResult = self.searchArxiv(term)
-        doiSet.update(arxivSearchResult)
-
-    if download_sources.get('medArxiv'):
-        medArxivSearchResult = self.searchMedArxiv(term)
-        doiSet.update(medArxivSearchResult)
+    # Set SAVE_BIB for search2_zotero here, not in a source thread that may outlive its timeout
+    if download_sources.get("serp"):
+        self.SAVE_BIB = save_bib
 
-    if download_sources.get('bioArxiv'):
-        boiArxivSearchResult = self.boiArxivSearch(term)
-        doiSet.update(boiArxivSearchResult)
+    # Each source is told its deadline so it stops on its own once it has been given up on
+    start     = time.monotonic()
+    deadlines = source_deadlines(download_sources, source_timeout if concurrent else None, start)
+    searches  = {
+        "serp": lambda: self.serpSearch(term, min_year, save_bib, max_searches, deadline=deadlines["serp"]),
+        "arxiv": lambda: self.searchArxiv(term, deadline=deadlines["arxiv"]),
+        "medArxiv": lambda: self.searchMedArxiv(term, deadline=deadlines["medArxiv"]),
+        "bioArxiv": lambda: self.boiArxivSearch(term, deadline=deadlines["bioArxiv"]),
+    }
+    searches = {source: timed_search(source, search) for source, search in searches.items()
+                if download_sources.get(source)}
+
+    if not concurrent:
+        for source, search in searches.items():
+            if source == "serp":
+                print("Starting Serp Search")
+            doiSet.update(search())
+    else:
+        doiSet.update(fan_out_searches(searches, source_timeout, start=start))
 
     self.doiSet = doiSet
     return 0
+
+
+def source_deadlines(sources, source_timeout, start):
+    """
+    The time.monotonic() deadline of each source: start plus its timeout, or None without one.
+
+    Parameters:
+    - sources (iterable): Source names.
+    - source_timeout (float or dict): One timeout for all sources or a dict keyed by source name.
+    - start (float): time.monotonic() at which the sources were started.
+    """
+    deadlines = dict()
+    for source in ("serp", "arxiv", "medArxiv", "bioArxiv", *sources):
+        timeout = source_timeout.get(source) if isinstance(source_timeout, dict) else source_timeout
+        deadlines[source] = start + timeout if timeout is not None else None
+    return deadlines
+
+
+def timed_search(source, search):
+    """
+    Wrap a source search so each run is timed as a "search" stage for that source.
+    """
+    def run():
+        with span("search", source=source):
+            return search()
+    return run
+
+
+def fan_out_searches(searches, source_timeout=None, start=None):
+    """
+    Run several source searches at the same time and collect their DOIs as each one finishes.
+
+    Parameters:
+    - searches (dict): Source name mapped to a callable returning a list of (doi, abstract) tuples.
+    - source_timeout (float or dict): Seconds to wait for each source, either one value for all
+      sources or a dict keyed by source name. None waits indefinitely.
+    - start (float): time.monotonic() the timeouts count from; now if None.
+
+    Returns:
+    - (set): The merged (doi, abstract) tuples from every source that finished in time.
+    """
+    doiSet = set()
+    if not searches:
+        return doiSet
+
+    start     = time.monotonic() if start is None else start
+    executor  = ThreadPoolExecutor(max_workers=len(searches), thread_name_prefix="source")
+    futures   = {executor.submit(search): source for source, search in searches.items()}
+    by_source = source_deadlines(searches, source_timeout, start)
+    deadlines = {future: by_source[source] for future, source in futures.items()}
+    print(f"Searching {', '.join(searches)} concurrently")
+
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        for future in [f for f in pending if deadlines[f] is not None and deadlines[f] <= now]:
+            print(f"Search on {futures[future]} timed out, moving on without it")
+            future.cancel()
+            pending.discard(future)
+        if not pending:
+            break
+
+        open_deadlines = [deadlines[f] for f in pending if deadlines[f] is not None]
+        wait_for = max(0, min(open_deadlines) - now) if open_deadlines else None
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                doiSet.update(future.result())
+            except SerpCacheMiss:
+                executor.shutdown(wait=False)
+                raise
+            except Exception as e:
+                print(f"Search on {futures[future]} failed: {str(e)}")
+
+    # Don't block on sources that timed out; they were given the same deadline and stop soon after it
+    executor.shutdown(wait=False)
+    return doiSet
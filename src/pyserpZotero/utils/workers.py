@@ -0,0 +1,265 @@
+# utils/workers.py
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+# SerpZot settings the coordinator passes on to its workers, on top of what they read from the config file
+WORKER_SETTINGS = ("SERP_API_KEY", "ZOT_ID", "ZOT_KEY", "DOWNLOAD_DEST", "enable_pdf_download", "RESOLVE_WORKERS",
+                   "DOWNLOAD_WORKERS", "PDF_HEDGE_DELAY", "PDF_DOWNLOAD_TIMEOUT", "SERP_BUDGET", "SAVE_BIB", "SERP_CACHE_MODE")
+
+# The SerpZot and Zotero client of this worker process
+_worker = None
+_zot    = None
+
+
+def _init_worker(config_path, settings, processes, serp_requests, host_states, pdf_jobs, pdf_results, log_path):
+    """
+    Set up a worker process: its own SerpZot configured like the coordinator's (without the
+    metrics server, library snapshot and journal only the coordinator uses), the request
+    pacing it shares with the coordinator (1/processes of the rate for other hosts), the
+    coordinator's SerpApi request counter, and DOWNLOAD_WORKERS threads downloading PDFs.
+    """
+    global _worker, _zot
+    # Workers print to stderr (or nowhere), never to stdout, which may be carrying JSON records
+    sys.stdout = open(log_path, "w") if log_path else sys.stderr
+
+    try:
+        from ..pyserpZotero import SerpZot
+        from .endpoints import zotero_client
+        from .rate_limit import get_scheduler
+    except ImportError:
+        from pyserpZotero import SerpZot
+        from endpoints import zotero_client
+        from rate_limit import get_scheduler
+
+    worker = SerpZot(config_path=config_path, worker=True)
+    for name, value in settings.items():
+        setattr(worker, name, value)
+    worker.shared_serp_requests = serp_requests
+    get_scheduler().scale(1 / processes)
+    get_scheduler().adopt(host_states)
+
+    _worker = worker
+    _zot    = zotero_client(worker.ZOT_ID, worker.ZOT_KEY)
+
+    # PDFs are downloaded next to whatever task the process is running, so downloads run
+    # DOWNLOAD_WORKERS at a time in every process instead of one at a time
+    for n in range(worker.download_worker_count()):
+        threading.Thread(target=_download_loop, args=(pdf_jobs, pdf_results), name=f"download-{n}", daemon=True).start()
+
+
+def _search_term(job):
+    term, options = job
+    # The coordinator stops at the first term the budget cut short; don't start the ones queued after it
+    if _worker.serp_budget_spent():
+        return term, []
+    _worker.search_scholar(term=term, **options)
+    return term, list(_worker.doiSet)
+
+
+def _build_citation(job):
+    doi, abstract, FIELD = job
+    template = _zot.item_template('journalArticle')
+    try:
+        template, bib_dict, problem = _worker.build_citation(doi, abstract, template, FIELD)
+    except Exception as e:
+        return doi, None, None, None, str(e)
+    return doi, template, bib_dict, problem, None
+
+
+def _fetch_pdf(job):
+    doi, title = job
+    downloaded, pdf_path, md5 = _worker.fetch_pdf(doi, title=title, download_dest=_worker.DOWNLOAD_DEST)
+    # The coordinator may run in another directory than the worker resolved pdf_path in
+    return downloaded, os.path.abspath(pdf_path) if downloaded and pdf_path else pdf_path, md5
+
+
+def _download_loop(jobs, results):
+    """
+    Download the PDFs the coordinator queues in jobs until it sends None. For each, put
+    (job id, pid, None, None) on results when starting it, so the coordinator knows which
+    process has it, and (job id, pid, result, error) when done.
+    """
+    pid = os.getpid()
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_id, doi, title = job
+        results.put((job_id, pid, None, None))
+        try:
+            results.put((job_id, pid, _fetch_pdf((doi, title)), None))
+        except Exception as e:
+            results.put((job_id, pid, None, str(e)))
+
+
+def pdf_job_timeout(serp_zot):
+    """
+    Seconds the coordinator waits for a worker to download one PDF: the race deadline,
+    or every source one after another when there is none, plus one read timeout for a
+    source that is stuck in the middle of a transfer.
+    """
+    try:
+        from .http_session import DEFAULT_TIMEOUT
+    except ImportError:
+        from http_session import DEFAULT_TIMEOUT
+    connect_timeout, read_timeout = DEFAULT_TIMEOUT
+    timeout = getattr(serp_zot, 'PDF_DOWNLOAD_TIMEOUT', None)
+    if timeout is None:
+        # arXiv, Sci-Hub, medRxiv and bioRxiv
+        timeout = 4 * ((getattr(serp_zot, 'PDF_HEDGE_DELAY', None) or 0) + connect_timeout + read_timeout)
+    return timeout + connect_timeout + read_timeout
+
+
+class WorkerPool:
+    """
+    Local worker processes that do the CPU-heavy parts of a run for a coordinating SerpZot:
+    searching terms (result parsing, resolving DOIs), building citations (BibTeX parsing,
+    template filling) and downloading PDFs.
+
+    Workers never write to Zotero. They hand everything back to the coordinator, which
+    de-duplicates against the library and the job journal and does every upload itself,
+    so each citation and PDF is uploaded exactly once however the work was sharded.
+
+    Parameters:
+    - serp_zot (SerpZot): The coordinator.
+    - processes (int): Number of worker processes.
+    - config_path (str): The config file the workers read.
+    """
+    def __init__(self, serp_zot, processes, config_path="config.yaml"):
+        try:
+            from .rate_limit import get_scheduler
+        except ImportError:
+            from rate_limit import get_scheduler
+        context   = multiprocessing.get_context("spawn")
+        settings  = {name: getattr(serp_zot, name) for name in WORKER_SETTINGS if hasattr(serp_zot, name)}
+        log_path  = os.devnull if getattr(sys.stdout, 'name', None) == os.devnull else None
+
+        self.processes     = processes
+        self.threads       = serp_zot.download_worker_count()
+        self.serp_requests = context.Value('i', serp_zot.serp_requests)
+        self.pdf_jobs      = context.Queue()
+        self.pdf_results   = context.Queue()
+        self.pending_pdfs  = dict()   # job id -> (threading.Event, dict for the pid and result)
+        self.pdf_timeout   = pdf_job_timeout(serp_zot)
+        self._job_ids      = itertools.count()
+        self._lock         = threading.Lock()
+        self.pool          = context.Pool(processes, initializer=_init_worker,
+                                          initargs=(os.path.abspath(config_path), settings, processes,
+                                                    self.serp_requests, get_scheduler().share_hosts(context),
+                                                    self.pdf_jobs, self.pdf_results, log_path))
+        self.collector     = threading.Thread(target=self._collect_pdfs, name="pdf-results", daemon=True)
+        self.collector.start()
+        print(f"Started {processes} worker processes")
+
+    def search(self, terms, options):
+        """
+        Search terms across the workers.
+
+        Yields:
+        - tuple: (term, list of (doi, abstract)) in the order the searches finish.
+        """
+        yield from self.pool.imap_unordered(_search_term, [(term, options) for term in terms])
+
+    def citations(self, doiSet, FIELD):
+        """
+        Build citations across the workers, yielding them as they are done, as built_citations does.
+        """
+        jobs = [(doi, abstract, FIELD) for doi, abstract in doiSet]
+        yield from self.pool.imap_unordered(_build_citation, jobs, chunksize=max(1, len(jobs) // (self.processes * 8)))
+
+    def fetch_pdf(self, doi, title=None):
+        """
+        Download the PDF for a DOI in the download threads of the workers, blocking the
+        calling thread until it is done. Up to processes * DOWNLOAD_WORKERS downloads run at
+        once, so the coordinator waits on them with that many threads (see download_worker_count).
+
+        Gives up when the download isn't started or done within pdf_timeout seconds, or
+        the worker process downloading it dies.
+
+        Returns:
+        - tuple: (bool, str, str) as for fetch_pdf.
+        """
+        done, outcome = threading.Event(), dict()
+        with self._lock:
+            job_id = next(self._job_ids)
+            self.pending_pdfs[job_id] = (done, outcome)
+        self.pdf_jobs.put((job_id, doi, title))
+
+        deadline, started = time.monotonic() + self.pdf_timeout, False
+        while not done.wait(1):
+            pid = outcome.get('pid')
+            if pid is not None and not started:
+                # A worker took it off the queue; it gets the whole timeout from now
+                deadline, started = time.monotonic() + self.pdf_timeout, True
+            if pid is not None and pid not in {child.pid for child in multiprocessing.active_children()}:
+                problem = f"worker process {pid} died"
+            elif time.monotonic() > deadline:
+                problem = f"no result after {self.pdf_timeout:.0f} seconds"
+            else:
+                continue
+            with self._lock:
+                if self.pending_pdfs.pop(job_id, None) is None:
+                    break   # Done after all
+            print(f"Giving up on the PDF for {doi}: {problem}")
+            return False, None, None
+
+        if outcome['error'] is not None:
+            raise RuntimeError(outcome['error'])
+        return outcome['result']
+
+    def _collect_pdfs(self):
+        """
+        Hand each finished download to the thread waiting for it, in the order they finish.
+        """
+        while True:
+            finished = self.pdf_results.get()
+            if finished is None:
+                return
+            job_id, pid, result, error = finished
+            with self._lock:
+                if result is None and error is None:
+                    # Started: the timeout counts from here
+                    if job_id in self.pending_pdfs:
+                        self.pending_pdfs[job_id][1]['pid'] = pid
+                    continue
+                done, outcome = self.pending_pdfs.pop(job_id, (None, None))
+            if done is None:
+                continue    # The waiting thread already gave up on it
+            outcome.update(result=result, error=error)
+            done.set()
+
+    def close(self):
+        for _ in range(self.processes * self.threads):
+            self.pdf_jobs.put(None)
+        self.pool.close()
+        self.pool.join()
+        self.pdf_results.put(None)
+        self.collector.join()
+
+
+def start_workers(self, processes=None):
+    """
+    Start the worker processes used by batch_search2zotero, once; WORKER_PROCESSES
+    sets how many. Does nothing with fewer than two.
+
+    Returns:
+    - (WorkerPool): The running pool, or None.
+    """
+    processes = int(processes or getattr(self, 'WORKER_PROCESSES', 1) or 1)
+    if self.workers is None and processes > 1:
+        self.workers = WorkerPool(self, processes, config_path=self.config_path)
+    return self.workers
+
+
+def close_workers(self):
+    """
+    Stop the worker processes, if any were started.
+    """
+    if self.workers is not None:
+        self.serp_requests = self.workers.serp_requests.value
+        self.workers.close()
+        self.workers = None
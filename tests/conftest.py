@@ -0,0 +1,25 @@
+# tests/conftest.py
+from pathlib import Path
+
+import sys
+
+import pytest
+
+# Test the source tree, not an installed copy, against the stub services of the benchmarks
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+
+@pytest.fixture
+def stubs():
+    """
+    The benchmark stub services with a small library, and every service pointed at them.
+    """
+    from stubs import StubServices
+    from pyserpZotero.utils import endpoints
+
+    services = StubServices(library_size=40, results_per_term=6, pdf_rate=0.5).start()
+    endpoints.configure(services.endpoints())
+    yield services
+    endpoints.configure({})
+    services.stop()
@@ -0,0 +1,91 @@
+# tests/test_batch.py
+import io
+import json
+
+import pytest
+import yaml
+
+from bench_pipeline import bench_config
+from pyserpZotero.batch import batch_main, build_parser, read_terms
+
+
+def run(stubs, tmp_path, *argv):
+    """
+    Run psz batch against the stubs, SerpApi only, and return its exit status and JSON records.
+    """
+    config = tmp_path / "config.yaml"
+    if not config.exists():
+        config.write_text(yaml.safe_dump(bench_config(stubs, str(tmp_path), False)))
+    output = tmp_path / "out.jsonl"
+    output.write_text("")
+    status = batch_main(["--config", str(config), "--quiet", "-o", str(output),
+                         "--sources", "serp", "--max-searches", "6", *argv])
+    return status, [json.loads(line) for line in output.read_text().splitlines()]
+
+
+def test_read_terms(tmp_path, monkeypatch):
+    terms = tmp_path / "terms.txt"
+    terms.write_text("# reviews\nprotein folding\n\n  gene therapy  \nprotein folding\n")
+    monkeypatch.setattr("sys.stdin", io.StringIO("crispr\n# skipped\ngene therapy\n"))
+    assert read_terms([str(terms), "-"], ["dark matter", "crispr"]) == \
+        ["dark matter", "crispr", "protein folding", "gene therapy"]
+
+
+def test_parser():
+    parser = build_parser()
+    args   = parser.parse_args(["terms.txt", "-t", "crispr", "--sources", "serp,arxiv", "--min-year", "2020",
+                                "--budget", "100", "--chunk-size", "5", "--processes", "2"])
+    assert (args.terms_files, args.term, args.sources) == (["terms.txt"], ["crispr"], ["serp", "arxiv"])
+    assert (args.min_year, args.budget, args.chunk_size, args.processes) == ("2020", 100, 5, 2)
+    assert args.resume is None
+    assert parser.parse_args(["--resume"]).resume == "last"
+    assert parser.parse_args(["--resume", "7"]).resume == "7"
+    for bad in (["--sources", "serp,scopus"], ["--min-year", "20"], ["--resume", "latest"]):
+        with pytest.raises(SystemExit):
+            parser.parse_args(bad)
+
+
+def test_chunks_stream_their_records(stubs, tmp_path):
+    terms = ["topic alpha", "topic beta", "topic gamma"]
+    status, records = run(stubs, tmp_path, *[arg for term in terms for arg in ("-t", term)],
+                          "--chunk-size", "1", "--no-pdf")
+    assert status == 0
+    events = [record["event"] for record in records]
+    # Each chunk is uploaded before the next one is searched
+    starts = [n for n, event in enumerate(events) if event == "term"]
+    assert [records[n]["term"] for n in starts] == terms
+    for start, following in zip(starts, starts[1:]):
+        assert "upload" in events[start:following]
+    summary = records[-1]
+    assert summary["event"] == "summary" and summary["terms"] == 3 and not summary["budget_exhausted"]
+    assert summary["counts"]["upload.created"] == stubs.servers["zotero"].store.created == 18
+
+    # The finished run is not left to resume
+    status, records = run(stubs, tmp_path, "--resume")
+    assert status == 1
+    assert (records[-1]["event"], records[-1]["error"]) == ("error", "nothing to resume")
+
+
+def test_budget_stop_and_resume(stubs, tmp_path):
+    terms = ["topic alpha", "topic beta", "topic gamma"]
+    status, records = run(stubs, tmp_path, *[arg for term in terms for arg in ("-t", term)],
+                          "--budget", "10", "--no-pdf")
+    assert status == 0
+    exhausted = [record["term"] for record in records if record.get("status") == "budget_exhausted"]
+    assert exhausted and set(exhausted) <= set(terms[1:])
+    summary = records[-1]
+    assert summary["budget_exhausted"] and summary["serp_requests"] == 10
+    created = stubs.servers["zotero"].store.created
+    assert 0 < created < 18
+
+    # Resuming searches only what the budget cut short and uploads nothing twice
+    requests = stubs.request_counts()["serpapi"]
+    status, records = run(stubs, tmp_path, "--resume", "--no-pdf")
+    assert status == 0
+    # A results page and six cite lookups per term, for the two terms not done yet
+    assert stubs.request_counts()["serpapi"] - requests == 2 * 7
+    searched = [record["term"] for record in records if record["event"] == "term"]
+    assert sorted(searched) == sorted(terms) and not records[-1]["budget_exhausted"]
+    store = stubs.servers["zotero"].store
+    dois  = [item["data"]["DOI"] for item in store.items.values() if item["data"].get("DOI")]
+    assert store.created == 18 and len(set(dois)) == len(dois)
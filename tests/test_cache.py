@@ -0,0 +1,98 @@
+# tests/test_cache.py
+import threading
+
+import pytest
+
+from pyserpZotero.utils import cache as cache_module
+from pyserpZotero.utils.cache import SqliteCache, normalize_doi, serp_cache_key
+from pyserpZotero.utils.search_scholar import SerpCacheMiss, iter_scholar_pages, serp_request
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return clock
+
+
+def test_keys():
+    assert normalize_doi("https://dx.doi.org/10.1000/ABC") == normalize_doi("doi: 10.1000/abc") == "10.1000/abc"
+    assert serp_cache_key({"q": "x", "start": 0, "api_key": "secret"}) == serp_cache_key({"start": "0", "q": "x"})
+    assert serp_cache_key({"q": "x"}) != serp_cache_key({"q": "y"})
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+    cache.set("a", {"value": 1})
+    clock.now += 59
+    assert cache.get("a") == {"value": 1}
+    clock.now += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("a", 1)
+    clock.now += 1
+    cache.set("b", 2)
+    clock.now += 1
+    assert cache.get("a") == 1     # Now b is the least recently used
+    clock.now += 1
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+    # Entries outlive the instance
+    assert SqliteCache(cache.path).get("c") == 3
+
+
+class Searcher:
+    serp_request       = serp_request
+    iter_scholar_pages = iter_scholar_pages
+
+    def __init__(self, cache, mode):
+        self.lock            = threading.Lock()
+        self.serp_requests   = 0
+        self.SERP_BUDGET     = None
+        self.SERP_API_KEY    = "key"
+        self.serp_cache      = cache
+        self.SERP_CACHE_MODE = mode
+
+
+QUERY = {"engine": "google_scholar", "q": "graph networks", "start": "0", "num": 6}
+
+
+def test_record_then_replay_offline(tmp_path, stubs):
+    cache    = SqliteCache(str(tmp_path / "serp.sqlite3"))
+    recorded = Searcher(cache, "record").serp_request(dict(QUERY))
+    assert len(recorded["organic_results"]) == 6
+
+    # Replay answers from the cache only, costing no requests or credits
+    replay = Searcher(cache, "replay")
+    assert replay.serp_request(dict(QUERY, api_key="another key")) == recorded
+    assert replay.serp_requests == 0
+    assert stubs.request_counts()["serpapi"] == 1
+
+
+def test_on_mode_queries_serpapi_once(tmp_path, stubs):
+    searcher = Searcher(SqliteCache(str(tmp_path / "serp.sqlite3")), "on")
+    first    = searcher.serp_request(dict(QUERY))
+    assert searcher.serp_request(dict(QUERY)) == first
+    assert searcher.serp_requests == stubs.request_counts()["serpapi"] == 1
+
+
+def test_replay_miss_fails_the_search(tmp_path):
+    searcher = Searcher(SqliteCache(str(tmp_path / "serp.sqlite3")), "replay")
+    with pytest.raises(SerpCacheMiss):
+        searcher.serp_request(dict(QUERY))
+    # Not swallowed like a failed search, which would look like a search without results
+    with pytest.raises(SerpCacheMiss):
+        list(searcher.iter_scholar_pages("graph networks", "", 6))
@@ -0,0 +1,116 @@
+# tests/test_helpers.py
+import pytest
+
+from pyserpZotero.utils.helpers import LatexCleaner
+
+# The replaces cleanZot used to chain, in order and with the strings Python made of them:
+# several had unescaped "\t", "\a" or "\1" in them, so they matched a tab, bell or \x01
+CHAINED_REPLACES = (
+    ('{', ''), ('}', ''), ('$\\less', ''), ('$scp', ''), ('$\\greater', ''), ('/scp', ''), ('$$', ''), ('$', ''),
+    ('\\upkappa', 'k'), ('\\upalpha', 'α'), ('\\textdollar', '$'), ('\\mathplus', '+'),
+    ('\\textquotedblleft', '"'), ('\\textquotedblright', '"'),
+    ('{\\textquotesingle}', "'"), ('{\\\textquotesingle}', "'"), ('{\\\\textquotesingle}', "'"),
+    ('\\textendash', '-'), ('$\textbackslashsqrt', ''), ('\\textbackslashsqrt', ''), ('\\textbackslash', ''),
+    ('\textemdash', '-'), ('\\lbraces', ''), ('\\lbrace=', ''), ('\\rbrace=', ''), ('\\rbrace', ''),
+    ('$\\sim$', '~'), ('\\&amp', '&'), ('\\mathsemicolon', ';'), ('\\mathcolon', ':'), ('\\#', ':'),
+    ('\\textregistered', '®'), ('\textregistered', '®'), ('\\\textregistered', '®'),
+    ('#1I/`', "'"), ('1I/', "'"), ('\x01I/', "'"),
+    ('{\\’{\x07}}', 'a'), ('{\\’{\\e}}', 'e'), ('{\\’{\\i}}', 'i'), ('{\\’{\\o}}', 'o'),
+    ('{\\’{a}}', 'a'), ('{\\’{e}}', 'e'), ('{\\’{i}}', 'i'), ('{\\’{o}}', 'o'),
+)
+
+
+def chained_clean(text):
+    for pattern, replacement in CHAINED_REPLACES:
+        text = text.replace(pattern, replacement)
+    return text
+
+
+# Titles as Crossref's BibTeX has them, which both cleaners turn into the same text
+BIBTEX_TITLES = [
+    "Deep Residual Learning for Image Recognition",
+    "{CRISPR}-Cas9 genome editing in human cells",
+    "Observation of a new boson at a mass of 125 {GeV} with the {CMS} experiment at the {LHC}",
+    "Inhibition of {NF}-{$\\upkappa$}B signaling by {TNF}-{$\\upalpha$}",
+    "The {$\\less$}scp{$\\greater$}p53{$\\less$}/scp{$\\greater$} pathway in cancer",
+    "Electron transport in {MoS}$_2$ monolayers",
+    "Poverty below {\\textdollar}2 a day",
+    "Growth of {\\textquotedblleft}smart{\\textquotedblright} hydrogels",
+    "Cost{\\textendash}benefit analysis of screening",
+    "Square roots: {$\\textbackslashsqrt$}2 revisited",
+    "Research {\\&amp}amp; development",
+    "Ratio 1{\\mathcolon}2 and 3{\\mathsemicolon} more",
+    "Tweet {\\#}1 in {\\lbrace=}braces{\\rbrace}",
+    "Tumour markers{\\textregistered} in 2{\\mathplus}2 assays",
+]
+
+
+@pytest.mark.parametrize("title", BIBTEX_TITLES)
+def test_single_pass_matches_chained_replaces(title):
+    assert LatexCleaner().clean(title) == chained_clean(title)
+
+
+# Rules the chain never applied, because an earlier replace had already taken the text
+# apart or the pattern held a tab/bell, and which the single pass now does apply
+@pytest.mark.parametrize("title, chained, cleaned", [
+    ("Particles of $\\sim$10 nm", "Particles of \\sim10 nm", "Particles of ~10 nm"),
+    ("Don{\\textquotesingle}t panic", "Don\\textquotesinglet panic", "Don't panic"),
+    ("Don{\\\\textquotesingle}t panic", "Don\\\\textquotesinglet panic", "Don't panic"),
+    ("Gas sensing {\\textemdash} a review", "Gas sensing \\textemdash a review", "Gas sensing - a review"),
+    ("Brand\\\\textregistered", "Brand\\®", "Brand®"),
+    ("Sim{\\’{o}}es and {\\’{\\a}}lvarez", "Sim\\’oes and \\’\\alvarez", "Simoes and alvarez"),
+])
+def test_intended_differences(title, chained, cleaned):
+    assert chained_clean(title) == chained
+    assert LatexCleaner().clean(title) == cleaned
+
+
+def test_control_characters_are_left_alone():
+    # The chain replaced a tab or \x01 followed by the rest of its garbled patterns
+    title = "Tab\textemdash, \x01I/ and bell{\\’{\x07}}"
+    assert chained_clean(title) == "Tab-, ' and bell\\’\x07"
+    assert LatexCleaner().clean(title) == "Tab\textemdash, \x01I/ and bell\\’\x07"
+
+
+# arXiv titles, and the capwords()-ed item titles arxiv_download used to compare them to
+ARXIV_TITLES = [
+    "Deep Residual Learning for Image Recognition",
+    "Language Models are Few-Shot Learners",
+    "BERT: Pre-training of Deep Bidirectional Transformers for Language Understanding",
+    "Generative Adversarial Networks",
+    "Adam: A Method for Stochastic Optimization",
+    "Highly accurate protein structure prediction with AlphaFold",
+]
+
+
+@pytest.mark.parametrize("title", [
+    "Deep Residual Learning For Image Recognition",
+    "Generative Adversarial Networks",
+    "Adam: A Method For Stochastic Optimization",
+    "Bert: Pre-training Of Deep Bidirectional Transformers For Language Understanding",
+    "Protein Folding",
+])
+def test_title_matcher_matches_get_cosine(title):
+    from pyserpZotero.utils.helpers import TitleMatcher, get_cosine, text_to_vector
+
+    # Lower-cased, get_cosine scores what TitleMatcher does
+    expected = [get_cosine(text_to_vector(title.lower()), text_to_vector(candidate.lower())) for candidate in ARXIV_TITLES]
+    assert list(TitleMatcher(ARXIV_TITLES).scores(title)) == pytest.approx(expected)
+
+
+def test_title_matcher_ignores_case():
+    from pyserpZotero.utils.helpers import TitleMatcher, get_cosine, text_to_vector
+
+    # get_cosine tells "Protein" from "protein", so a capwords()-ed title missed its arXiv entry
+    title, arxiv_title = "Highly Accurate Protein Structure Prediction With Alphafold", ARXIV_TITLES[5]
+    assert get_cosine(text_to_vector(title), text_to_vector(arxiv_title)) == pytest.approx(1 / 6)
+    assert TitleMatcher(ARXIV_TITLES).best_match(title) == (5, pytest.approx(1.0))
+
+    # With the case agreeing, both accept and reject the same titles at the 0.85 threshold
+    matcher = TitleMatcher(ARXIV_TITLES)
+    for candidate in ARXIV_TITLES:
+        vector = text_to_vector(candidate)
+        best   = [n for n, other in enumerate(ARXIV_TITLES) if get_cosine(vector, text_to_vector(other)) > .85]
+        assert matcher.best_match(candidate)[0] == best[0]
+    assert matcher.best_match("Generative Models")[0] is None
+    assert get_cosine(text_to_vector("Generative Models"), text_to_vector(ARXIV_TITLES[3])) <= .85
@@ -0,0 +1,61 @@
+# tests/test_journal.py
+from types import SimpleNamespace
+
+import pytest
+
+from pyserpZotero.utils.journal import JobJournal
+from pyserpZotero.utils.search2zotero import resume_search2zotero
+
+DOI = "10.1000/ABC.123"
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return JobJournal(str(tmp_path / "journal" / "journal.sqlite3"))
+
+
+def test_runs_are_recorded_and_finished(journal):
+    run_id = journal.start_run(["alpha", "beta"], {"max_searches": 20})
+    run = journal.get_run()
+    assert (run["id"], run["finished"], run["terms"], run["params"]) == (run_id, None, ["alpha", "beta"], {"max_searches": 20})
+    journal.finish_run(run_id)
+    assert journal.get_run() is None
+    assert journal.get_run(run_id)["finished"] is not None
+    assert journal.get_run(run_id + 1) is None
+
+
+def test_searched_terms(journal):
+    run_id = journal.start_run(["alpha", "beta"], {})
+    journal.record_term(run_id, "alpha", {(DOI, "An abstract"), ("10.1000/xyz", None)})
+    assert journal.searched_terms(run_id) == {"alpha": {(DOI, "An abstract"), ("10.1000/xyz", None)}}
+    assert journal.stage_counts(run_id) == {"found": 2}
+
+
+def test_stages_only_move_forward(journal):
+    run_id = journal.start_run(["alpha"], {})
+    journal.record_term(run_id, "alpha", {(DOI, None)})
+    key = DOI.lower()
+
+    journal.record(run_id, "doi", {"doi": DOI, "status": "resolved"})
+    journal.record(run_id, "upload", {"doi": DOI, "status": "created", "keys": ["ITEM1"]})
+    assert journal.doi_states(run_id)[key] == ("uploaded", ["ITEM1"])
+
+    # A late "resolved" doesn't move it back, and an error keeps it where it is
+    journal.record(run_id, "doi", {"doi": DOI, "status": "resolved"})
+    journal.record(run_id, "download", {"doi": DOI, "status": "failed", "error": "timed out"})
+    assert journal.doi_states(run_id)[key] == ("uploaded", ["ITEM1"])
+
+    journal.record(run_id, "download", {"doi": DOI, "status": "attached"})
+    assert journal.doi_states(run_id)[key] == ("pdf_attached", ["ITEM1"])
+
+
+def resumable(journal, status, budget_spent):
+    return SimpleNamespace(journal=journal, serp_budget_spent=lambda: budget_spent,
+                           batch_search2zotero=lambda terms, run_id, **params: status)
+
+
+@pytest.mark.parametrize("status, budget_spent, finished", [(0, False, True), (1, False, False), (0, True, False)])
+def test_resume_only_finishes_completed_runs(journal, status, budget_spent, finished):
+    run_id = journal.start_run(["alpha"], {"max_searches": 20})
+    assert resume_search2zotero(resumable(journal, status, budget_spent)) == status
+    assert (journal.get_run(run_id)["finished"] is not None) == finished
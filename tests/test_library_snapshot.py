@@ -0,0 +1,37 @@
+# tests/test_library_snapshot.py
+from pyserpZotero.utils.endpoints import zotero_client
+from pyserpZotero.utils.library_snapshot import LibrarySnapshot
+
+
+def test_incremental_sync(stubs, tmp_path):
+    store = stubs.servers["zotero"].store
+    zot   = zotero_client("1", "benchmark")
+    path  = str(tmp_path / "library_1.json")
+
+    snapshot = LibrarySnapshot(path)
+    assert snapshot.sync(zot) == len(store.items)
+    assert "10.5555/library.0.3" in snapshot.doi_index and snapshot.version == store.version
+
+    # Nothing changed: only the library version is read
+    requests = stubs.request_counts()["zotero"]
+    assert LibrarySnapshot(path).sync(zot) == 0
+    assert stubs.request_counts()["zotero"] - requests == 1
+
+    # One item created, one retitled and one deleted since: only those come back
+    created = store.create({"itemType": "journalArticle", "title": "New", "DOI": "10.1/new"})
+    with store.lock:
+        store.version += 1
+        store.items["L0000001"]["version"] = store.version
+        store.items["L0000001"]["data"]["title"] = "Retitled"
+    store.delete("L0000002")
+
+    snapshot = LibrarySnapshot(path)
+    assert snapshot.sync(zot) == 3
+    assert snapshot.doi_index["10.1/new"] == {created["key"]}
+    assert snapshot.items["L0000001"]["data"]["title"] == "Retitled"
+    assert "L0000002" not in snapshot.items and "10.5555/library.0.2" not in snapshot.doi_index
+
+    # The version and the changes persist for the next run
+    reloaded = LibrarySnapshot(path)
+    assert reloaded.version == store.version
+    assert set(reloaded.items) == set(store.items)
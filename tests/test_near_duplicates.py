@@ -0,0 +1,44 @@
+# tests/test_near_duplicates.py
+from pyserpZotero.utils.near_duplicates import TitleLSH, item_year, normalize_title
+from pyserpZotero.utils.search_scholar import scholar_result_metadata
+
+TITLE = "Attention Is All You Need: Transformers for Sequence Transduction"
+
+
+def library():
+    return [
+        {'key': 'VASWANI', 'data': {'itemType': 'journalArticle', 'title': TITLE, 'date': "2017-06-12",
+                                    'creators': [{'firstName': "Ashish", 'lastName': "Vaswani"},
+                                                 {'firstName': "Noam", 'lastName': "Shazeer"}]}},
+        {'key': 'PDF', 'data': {'itemType': 'attachment', 'title': TITLE}},
+        {'key': 'OTHER', 'data': {'itemType': 'journalArticle', 'title': "Deep Residual Learning for Image Recognition",
+                                  'date': "2016", 'creators': [{'name': "He"}]}},
+    ]
+
+
+def test_normalize_and_year():
+    assert normalize_title("  Café: Ünïcode — Titles!") == "cafe unicode titles"
+    assert item_year("June 2017") == 2017
+    assert item_year("arXiv:2101.00001") is None
+
+
+def test_near_duplicate_title_is_found():
+    index = TitleLSH.from_items(library())
+    assert len(index) == 2
+    assert index.find_duplicate("Attention is all you need - transformers for sequence transduction.") == "VASWANI"
+    assert index.find_duplicate("A completely different paper about protein folding") is None
+
+
+def test_year_and_authors_must_agree_when_known():
+    index = TitleLSH.from_items(library())
+    assert index.find_duplicate(TITLE, year=2018, authors=["Vaswani"]) == "VASWANI"
+    assert index.find_duplicate(TITLE, year=2021) is None
+    assert index.find_duplicate(TITLE, authors=["Smith", "Jones"]) is None
+
+
+def test_scholar_metadata():
+    summary = "A Vaswani, N Shazeer, N Parmar… - Advances in neural information processing systems, 2017 - proceedings.neurips.cc"
+    assert scholar_result_metadata({'publication_info': {'summary': summary}}) == (2017, ["Vaswani", "Shazeer"])
+    assert scholar_result_metadata({'publication_info': {'summary': "Nature, 2020 - nature.com"}}) == (2020, [])
+    assert scholar_result_metadata({'publication_info': {'summary': "A Smith - books.google.com"}}) == (None, ["Smith"])
+    assert scholar_result_metadata({}) == (None, [])
@@ -0,0 +1,73 @@
+# tests/test_pdf_downloader.py
+import queue
+import threading
+from types import SimpleNamespace
+
+from pyserpZotero.utils.pdf_downloader import (DOWNLOADS_DONE, attempt_pdf_download, download_worker,
+                                               download_worker_count, finish_downloads, queue_download)
+
+
+class Downloader:
+    """
+    The download stage of a SerpZot, with fetch_pdf finding no PDFs (and failing on request).
+    """
+    download_worker_count = download_worker_count
+    queue_download        = queue_download
+    finish_downloads      = finish_downloads
+    download_worker       = download_worker
+    attempt_pdf_download  = attempt_pdf_download
+
+    def __init__(self, download_workers=3, queue_size=2):
+        self.DOWNLOAD_WORKERS = download_workers
+        self.DOWNLOAD_DEST    = "."
+        self.ZOT_ID, self.ZOT_KEY = "1", "key"
+        self.workers          = None
+        self.download_queue   = queue.Queue(maxsize=queue_size) if queue_size else None
+        self.events           = []
+
+    def fetch_pdf(self, doi, title=None, **kwargs):
+        if doi == "10.1/bad":
+            raise RuntimeError("source is down")
+        return False, None, None
+
+    def emit(self, event, **fields):
+        self.events.append((event, fields['doi'], fields['status']))
+
+
+def test_workers_drain_the_queue_and_stop():
+    downloader = Downloader()
+    dois       = [f"10.1/{n}" for n in range(10)] + ["10.1/bad"]
+
+    def cite():
+        # Blocks on the bounded queue until the workers catch up
+        for doi in dois:
+            downloader.queue_download(doi, [doi.upper()], {'title': doi})
+        downloader.finish_downloads()
+
+    citations = threading.Thread(target=cite)
+    downloads = threading.Thread(target=downloader.attempt_pdf_download, args=([],))
+    citations.start()
+    downloads.start()
+    citations.join(10)
+    downloads.join(10)
+
+    assert not downloads.is_alive() and not citations.is_alive()
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith("download-")]
+    assert sorted(downloader.events) == sorted([("download", doi, "not_found") for doi in dois[:-1]] +
+                                               [("download", "10.1/bad", "failed")])
+    assert downloader.download_queue.unfinished_tasks == 0 and downloader.download_queue.empty()
+
+
+def test_one_sentinel_per_worker():
+    downloader = Downloader(download_workers=2, queue_size=10)
+    downloader.workers = SimpleNamespace(processes=3)
+    downloader.finish_downloads()
+    sentinels = [downloader.download_queue.get_nowait() for _ in range(downloader.download_queue.qsize())]
+    assert len(sentinels) == 6 and all(job is DOWNLOADS_DONE for job in sentinels)
+
+
+def test_nothing_is_queued_without_pdf_downloads():
+    downloader = Downloader(queue_size=0)
+    downloader.queue_download("10.1/a", ["A"], {})
+    downloader.finish_downloads()
+    assert downloader.download_queue is None and downloader.events == []
@@ -0,0 +1,35 @@
+# tests/test_pdf_store.py
+import os
+
+from pyserpZotero.utils.pdf_store import PdfStore, file_digests
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 64
+
+
+def test_pdfs_are_stored_once_by_content(tmp_path):
+    store = PdfStore(str(tmp_path / "store"))
+    first, second = tmp_path / "first.pdf", tmp_path / "second.pdf"
+    first.write_bytes(PDF)
+    second.write_bytes(PDF)
+    entry = store.add("10.1000/ABC", str(first))
+    assert store.add("10.1000/other", str(second)) == entry
+    assert entry == {'sha256': file_digests(str(first))[0], 'md5': file_digests(str(first))[1], 'size': len(PDF)}
+    assert store.lookup("https://doi.org/10.1000/abc") == entry
+    assert store.lookup("10.1000/missing") is None
+
+
+def test_checkout_replaces_a_stale_file(tmp_path):
+    store = PdfStore(str(tmp_path / "store"))
+    (tmp_path / "download.pdf").write_bytes(PDF)
+    entry = store.add("10.1000/abc", str(tmp_path / "download.pdf"))
+
+    path = tmp_path / "paper.pdf"
+    assert store.checkout(entry, str(path)) == str(path)
+    assert path.read_bytes() == PDF
+
+    # A truncated file, and one of the same size with other bytes, are replaced by the stored PDF
+    for stale in (PDF[:100], PDF[::-1]):
+        os.remove(path)
+        path.write_bytes(stale)
+        store.checkout(entry, str(path))
+        assert file_digests(str(path))[1] == entry['md5']
@@ -0,0 +1,48 @@
+# tests/test_race_pdf_sources.py
+import os
+import threading
+import time
+
+from pyserpZotero.utils.arxiv_helpers import race_pdf_sources
+
+
+def stalled(cancelled):
+    """
+    A source that keeps a download going until it is cancelled.
+    """
+    def download(dest, cancel):
+        cancel.wait(10)
+        cancelled.set()
+        return False, None
+    return download
+
+
+def found(delay):
+    def download(dest, cancel):
+        time.sleep(delay)
+        path = os.path.join(dest, "paper.pdf")
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4")
+        return True, path
+    return download
+
+
+def test_first_pdf_wins_and_the_rest_are_cancelled(tmp_path):
+    cancelled = threading.Event()
+    downloaded, path = race_pdf_sources([("slow", stalled(cancelled)), ("fast", found(0.05))], str(tmp_path),
+                                        hedge_delay=0)
+    assert downloaded and path == str(tmp_path / "paper.pdf")
+    assert cancelled.wait(1)
+    assert os.listdir(tmp_path) == ["paper.pdf"]
+
+
+def test_race_gives_up_at_the_deadline(tmp_path):
+    cancelled = threading.Event()
+    start = time.monotonic()
+    # The second source would only start after the hedge delay, which is past the deadline
+    downloaded, path = race_pdf_sources([("stalled", stalled(cancelled)), ("late", found(0))], str(tmp_path),
+                                        hedge_delay=5, timeout=0.3)
+    assert (downloaded, path) == (False, None)
+    assert time.monotonic() - start < 2
+    assert cancelled.wait(1)
+    assert os.listdir(tmp_path) == []
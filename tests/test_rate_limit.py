@@ -0,0 +1,121 @@
+# tests/test_rate_limit.py
+import time
+
+import pytest
+
+from pyserpZotero.utils import rate_limit
+from pyserpZotero.utils.rate_limit import RequestScheduler, host_of, retry_after_seconds, zotero_call
+
+
+class Response:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers     = headers or {}
+
+
+class Zotero:
+    """
+    Stands in for a pyzotero client, which keeps its last response in request.
+    """
+    def __init__(self):
+        self.request = Response()
+
+    def call(self, response, error=None):
+        self.request = response
+        if error is not None:
+            raise error
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = RequestScheduler({"api.zotero.org": {"rate": 100, "burst": 100, "concurrency": 4}})
+    monkeypatch.setattr(rate_limit, "_scheduler", scheduler)
+    return scheduler
+
+
+def test_host_of():
+    assert host_of("https://API.Zotero.org/users/1/items?limit=100") == "api.zotero.org"
+    assert host_of("export.arxiv.org") == "export.arxiv.org"
+
+
+def test_token_bucket_paces_after_the_burst():
+    scheduler = RequestScheduler({"example.org": {"rate": 20, "burst": 2, "concurrency": 2}})
+    start = time.monotonic()
+    for _ in range(6):
+        with scheduler.slot("https://example.org/a"):
+            pass
+    # Two requests from the burst, then four at 20 per second
+    assert 0.15 <= time.monotonic() - start < 1
+
+
+def test_scale_shares_the_limits():
+    scheduler = RequestScheduler()
+    scheduler.scale(1 / 4)
+    state = scheduler.state("api.crossref.org")
+    assert state.rate == pytest.approx(10 / 4)
+    assert state.burst == pytest.approx(10 / 4)
+
+
+def test_retry_after_header():
+    assert retry_after_seconds(Response(429, {"Retry-After": "7"})) == 7
+    assert retry_after_seconds(Response(200, {"Backoff": "3.5"})) == 3.5
+    assert retry_after_seconds(Response(200)) is None
+
+
+def test_throttled_response_backs_off(scheduler):
+    state = scheduler.state("api.zotero.org")
+    scheduler.observe("api.zotero.org", Response(429, {"Retry-After": "5"}))
+    assert state.backoff_until - time.monotonic() > 4
+    assert state.rate == pytest.approx(50)
+
+    scheduler.observe("api.zotero.org", Response(200))
+    assert state.strikes == 0
+    assert state.rate == pytest.approx(60)
+
+
+def test_zotero_call_observes_raised_responses(scheduler):
+    zot   = Zotero()
+    state = scheduler.state("api.zotero.org")
+    with pytest.raises(RuntimeError):
+        with zotero_call(zot):
+            zot.call(Response(429, {"Retry-After": "5"}), RuntimeError("Too many requests"))
+    assert state.strikes == 1
+    assert state.backoff_until > time.monotonic()
+
+
+def test_zotero_call_ignores_a_previous_response(scheduler):
+    zot         = Zotero()
+    zot.request = Response(503)
+    state       = scheduler.state("api.zotero.org")
+    with pytest.raises(ConnectionError):
+        with zotero_call(zot):
+            raise ConnectionError("No route to host")
+    assert state.strikes == 0
+
+
+def _throttle(states):
+    scheduler = rate_limit.get_scheduler()
+    scheduler.adopt(states)
+    scheduler.observe("export.arxiv.org", Response(503, {"Retry-After": "30"}))
+
+
+def test_shared_hosts_back_off_in_every_process(monkeypatch):
+    import multiprocessing
+    context   = multiprocessing.get_context("spawn")
+    scheduler = RequestScheduler()
+    monkeypatch.setattr(rate_limit, "_scheduler", scheduler)
+    states    = scheduler.share_hosts(context)
+    assert scheduler.state("export.arxiv.org") is states["export.arxiv.org"]
+
+    # Scaling for worker processes leaves the shared hosts alone
+    scheduler.scale(1 / 4)
+    assert scheduler.state("export.arxiv.org") is states["export.arxiv.org"]
+    assert scheduler.state("example.org").rate == pytest.approx(10 / 4)
+
+    process = context.Process(target=_throttle, args=(states,))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+    state = scheduler.state("export.arxiv.org")
+    assert state.strikes == 1
+    assert state.backoff_until - time.monotonic() > 20
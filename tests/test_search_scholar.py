@@ -0,0 +1,73 @@
+# tests/test_search_scholar.py
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import threading
+import time
+
+import pytest
+import requests
+
+from pyserpZotero.utils import endpoints
+from pyserpZotero.utils.search_scholar import fan_out_searches, serp_request
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """
+    Answers like SerpApi, but only after a few seconds.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(3)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+
+@pytest.fixture
+def slow_serpapi():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    endpoints.configure({"serpapi.com": f"http://127.0.0.1:{httpd.server_address[1]}"})
+    yield httpd
+    endpoints.configure({})
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class Searcher:
+    serp_request = serp_request
+
+    def __init__(self):
+        self.lock          = threading.Lock()
+        self.serp_requests = 0
+        self.SERP_BUDGET   = None
+        self.serp_cache    = None
+
+
+def test_serp_request_keeps_to_the_deadline(slow_serpapi):
+    searcher = Searcher()
+    start    = time.monotonic()
+    with pytest.raises(requests.RequestException):
+        searcher.serp_request({"engine": "google_scholar", "q": "slow"}, deadline=time.monotonic() + 0.3)
+    assert time.monotonic() - start < 2
+
+
+def test_no_credit_is_spent_after_the_deadline(slow_serpapi):
+    searcher = Searcher()
+    with pytest.raises(TimeoutError):
+        searcher.serp_request({"engine": "google_scholar", "q": "late"}, deadline=time.monotonic() - 1)
+    assert searcher.serp_requests == 0
+
+
+def test_fan_out_returns_at_the_source_timeout():
+    start = time.monotonic()
+    found = fan_out_searches({"fast": lambda: [("10.1/a", None)],
+                              "slow": lambda: time.sleep(3) or [("10.1/b", None)]},
+                             source_timeout={"fast": None, "slow": 0.3})
+    assert found == {("10.1/a", None)}
+    assert time.monotonic() - start < 2
@@ -0,0 +1,137 @@
+# tests/test_stream_pdf.py
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import os
+import threading
+
+import pytest
+
+from pyserpZotero.utils import arxiv_helpers
+from pyserpZotero.utils.arxiv_helpers import claimed_partial, partial_path, set_partial_dir, stream_pdf
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 1024
+
+
+class PdfHandler(BaseHTTPRequestHandler):
+    """
+    Serves PDF, honouring Range requests unless the server says otherwise.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.ranges.append(self.headers.get("Range"))
+        offset = int(self.headers["Range"][len("bytes="):].rstrip("-")) if self.headers.get("Range") else 0
+        if offset and server.mode == "416":
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(PDF)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if offset and server.mode != "ignore":
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {offset}-{len(PDF) - 1}/{len(PDF)}")
+        else:
+            offset = 0
+            self.send_response(200)
+        body = PDF[offset:]
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if server.cut:
+            # Drop the connection halfway through, once
+            server.cut = False
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd        = ThreadingHTTPServer(("127.0.0.1", 0), PdfHandler)
+    httpd.mode   = "range"
+    httpd.cut    = False
+    httpd.ranges = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/paper.pdf"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def partial_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(arxiv_helpers, "PARTIAL_DIR", None)
+    set_partial_dir(str(tmp_path / "partial"))
+    return tmp_path / "partial"
+
+
+def test_interrupted_download_resumes_with_range(server, partial_dir, tmp_path):
+    server.cut = True
+    assert not stream_pdf(server.url, str(tmp_path / "first" / "paper.pdf"))
+    part = partial_path(str(tmp_path / "first" / "paper.pdf"), server.url)
+    assert os.path.dirname(part) == str(partial_dir)
+    size = os.path.getsize(part)
+    assert 0 < size < len(PDF)
+
+    # A later attempt resumes the same partial file, even into another directory
+    (tmp_path / "second").mkdir()
+    path = tmp_path / "second" / "paper.pdf"
+    assert stream_pdf(server.url, str(path))
+    assert server.ranges == [None, f"bytes={size}-"]
+    assert path.read_bytes() == PDF
+    assert not os.path.exists(part)
+
+
+def test_server_ignoring_range_restarts_download(server, partial_dir, tmp_path):
+    path = str(tmp_path / "paper.pdf")
+    with open(partial_path(path, server.url), "wb") as f:
+        f.write(PDF[:1000])
+    server.mode = "ignore"
+    assert stream_pdf(server.url, path)
+    assert server.ranges == ["bytes=1000-"]
+    with open(path, "rb") as f:
+        assert f.read() == PDF
+
+
+def test_unsatisfiable_range_drops_stale_partial(server, partial_dir, tmp_path):
+    path = str(tmp_path / "paper.pdf")
+    with open(partial_path(path, server.url), "wb") as f:
+        f.write(b"stale")
+    server.mode = "416"
+    assert stream_pdf(server.url, path)
+    assert server.ranges == ["bytes=5-", None]
+    with open(path, "rb") as f:
+        assert f.read() == PDF
+
+
+def test_old_partial_files_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(arxiv_helpers, "PARTIAL_DIR", None)
+    old, new = tmp_path / "old.part", tmp_path / "new.part"
+    old.write_bytes(b"%PDF")
+    new.write_bytes(b"%PDF")
+    os.utime(old, (0, 0))
+    set_partial_dir(str(tmp_path))
+    assert not old.exists() and new.exists()
+
+
+def test_concurrent_downloads_of_a_url_use_separate_partial_files(server, partial_dir, tmp_path):
+    path = str(tmp_path / "paper.pdf")
+    with claimed_partial(path, server.url) as shared:
+        assert shared == partial_path(path, server.url)
+        # Another thread downloading the same URL meanwhile doesn't touch the shared file
+        with open(shared, "wb") as f:
+            f.write(PDF[:1000])
+        result = []
+        thread = threading.Thread(target=lambda: result.append(stream_pdf(server.url, path)))
+        thread.start()
+        thread.join()
+        assert result == [True]
+        assert server.ranges == [None]
+        assert os.path.getsize(shared) == 1000
+    assert os.listdir(partial_dir) == [os.path.basename(shared)]
+    assert stream_pdf(server.url, path)
+    assert server.ranges == [None, "bytes=1000-"]
@@ -0,0 +1,103 @@
+# tests/test_upload.py
+import threading
+
+from pyserpZotero.utils.library_snapshot import LibrarySnapshot
+from pyserpZotero.utils.process_and_upload import fail_citations, record_citation, recover_citations, upload_citations
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers     = {}
+
+
+class Zotero:
+    """
+    Creates items like the Zotero Web API, failing writes as scripted: "lost" creates
+    the items but loses the reply, "503" and "400" refuse the write, like pyzotero
+    raising after keeping the response in request.
+    """
+    def __init__(self, outcomes=()):
+        self.library  = []
+        self.version  = 1
+        self.outcomes = list(outcomes)
+        self.posts    = []
+        self.request  = None
+
+    def create_items(self, templates):
+        self.posts.append([template['doi'] for template in templates])
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if outcome in ("503", "400") or (outcome == "bad" and any(t.get('bad') for t in templates)):
+            self.request = Response(400 if outcome == "bad" else int(outcome))
+            raise RuntimeError(f"Zotero answered {self.request.status_code}")
+        successful = dict()
+        for index, template in enumerate(templates):
+            self.version += 1
+            item = {'key': f"KEY{len(self.library)}", 'version': self.version, 'data': dict(template)}
+            self.library.append(item)
+            successful[str(index)] = item
+        self.request = Response(200)
+        if outcome == "lost":
+            raise ConnectionError("Connection reset by peer")
+        return {'successful': successful, 'failed': {}}
+
+    def items(self, since=0):
+        return [item for item in self.library if item['version'] > since]
+
+    def everything(self, items):
+        return items
+
+
+class Uploader:
+    upload_citations  = upload_citations
+    recover_citations = recover_citations
+    record_citation   = record_citation
+    fail_citations    = fail_citations
+
+    def __init__(self):
+        self.lock          = threading.Lock()
+        self.DOI_HOLDER    = set()
+        self.CITATION_DICT = dict()
+        self.library       = LibrarySnapshot()
+        self.library.version = 1
+        self.events        = []
+        self.downloads     = []
+
+    def emit(self, stage, **fields):
+        self.events.append(dict(fields, stage=stage))
+
+    def queue_download(self, doi, keys, bib_dict):
+        self.downloads.append(doi)
+
+
+def batch(*dois, bad=()):
+    return [(doi, {'doi': doi, 'title': doi, 'bad': doi in bad}, {'title': doi}) for doi in dois]
+
+
+def test_batch_is_created_in_one_write():
+    zot, uploader = Zotero(), Uploader()
+    assert uploader.upload_citations(zot, batch("10.1/a", "10.1/b")) == 2
+    assert zot.posts == [["10.1/a", "10.1/b"]]
+    assert uploader.downloads == ["10.1/a", "10.1/b"]
+
+
+def test_lost_reply_is_not_written_again():
+    zot, uploader = Zotero(["lost"]), Uploader()
+    assert uploader.upload_citations(zot, batch("10.1/a", "10.1/b")) == 2
+    assert len(zot.posts) == 1 and len(zot.library) == 2
+    assert uploader.CITATION_DICT["10.1/b"][0] == ["KEY1"]
+
+
+def test_refused_write_is_tried_once_more():
+    zot, uploader = Zotero(["503"]), Uploader()
+    assert uploader.upload_citations(zot, batch("10.1/a", "10.1/b")) == 2
+    assert len(zot.posts) == 2 and len(zot.library) == 2
+
+
+def test_bad_item_is_split_off():
+    zot, uploader = Zotero(["bad"] * 4), Uploader()
+    assert uploader.upload_citations(zot, batch("10.1/a", "10.1/b", "10.1/c", "10.1/d", bad={"10.1/c"})) == 3
+    assert zot.posts == [["10.1/a", "10.1/b", "10.1/c", "10.1/d"], ["10.1/a", "10.1/b"], ["10.1/c", "10.1/d"],
+                         ["10.1/c"], ["10.1/d"]]
+    assert [event['doi'] for event in uploader.events if event['status'] == "failed"] == ["10.1/c"]
+    assert len(zot.library) == 3
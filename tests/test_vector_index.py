@@ -0,0 +1,164 @@
+# tests/test_vector_index.py
+import pickle
+import sys
+import types
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pyserpZotero.ai.vector_index import VectorIndex, item_text
+
+
+class IndexFlatIP:
+    def __init__(self, d):
+        self.d = d
+
+
+class IndexIDMap2:
+    """
+    The part of a faiss IndexIDMap2 that VectorIndex uses, in numpy, so the tests don't need faiss.
+    """
+    def __init__(self, base):
+        self.ids     = np.zeros(0, dtype="int64")
+        self.vectors = np.zeros((0, base.d), dtype="float32")
+
+    @property
+    def ntotal(self):
+        return len(self.ids)
+
+    def add_with_ids(self, vectors, ids):
+        self.vectors = np.vstack([self.vectors, vectors])
+        self.ids     = np.concatenate([self.ids, ids])
+
+    def remove_ids(self, ids):
+        keep         = ~np.isin(self.ids, ids)
+        self.ids     = self.ids[keep]
+        self.vectors = self.vectors[keep]
+        return int((~keep).sum())
+
+    def search(self, queries, k):
+        scores = queries @ self.vectors.T
+        order  = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, order, axis=1), self.ids[order]
+
+
+def write_index(index, path):
+    with open(path, "wb") as f:
+        pickle.dump(index, f)
+
+
+def read_index(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class WordEmbedder:
+    """
+    Bag-of-words vectors; counts how many texts it embeds.
+    """
+    name = "test/words"
+
+    def __init__(self):
+        self.embedded = 0
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), 32), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, sum(map(ord, word)) % 32] += 1
+        self.embedded += len(texts)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def item(key, version, title, item_type="journalArticle"):
+    return {'key': key, 'version': version, 'data': {'itemType': item_type, 'title': title}}
+
+
+@pytest.fixture(autouse=True)
+def faiss(monkeypatch):
+    monkeypatch.setitem(sys.modules, "faiss", types.SimpleNamespace(IndexFlatIP=IndexFlatIP, IndexIDMap2=IndexIDMap2,
+                                                                    write_index=write_index, read_index=read_index))
+
+
+@pytest.fixture
+def library():
+    return [item("GNN", 1, "graph neural networks"), item("FOLD", 1, "protein folding"),
+            item("QEC", 1, "quantum error correction"), item("PDF", 1, "graph neural networks", "attachment")]
+
+
+def test_item_text():
+    text = item_text({'data': {'title': "Protein folding", 'creators': [{'firstName': "A", 'lastName': "Fold"}],
+                               'date': "2020", 'tags': [{'tag': "biology"}]}})
+    assert text == "Protein folding\nA Fold\n2020\nbiology"
+    assert item_text({'data': {'itemType': "note"}}) == ""
+
+
+def test_update_embeds_only_new_and_changed_items(tmp_path, library):
+    embedder = WordEmbedder()
+    index    = VectorIndex(str(tmp_path), embedder)
+    assert index.update(library) == (3, 0)
+    assert index.search("protein folding", 1)[0][0] == "FOLD"
+
+    # Unchanged items cost nothing, also after reloading from disk
+    assert index.update(library) == (0, 0)
+    index = VectorIndex(str(tmp_path), embedder)
+    assert len(index) == 3
+    assert index.update(library) == (0, 0)
+    assert embedder.embedded == 3 + 1   # The items and the query
+
+    # A changed item is re-embedded and a deleted one dropped
+    library[0] = item("GNN", 2, "graph transformers")
+    del library[2]
+    assert index.update(library) == (1, 1)
+    assert embedder.embedded == 5
+    assert len(index) == index.index.ntotal == 2
+    assert index.search("graph transformers", 1)[0][0] == "GNN"
+
+
+def test_index_of_another_model_is_rebuilt(tmp_path, library):
+    VectorIndex(str(tmp_path), WordEmbedder()).update(library)
+
+    class OtherEmbedder(WordEmbedder):
+        name = "test/other"
+    index = VectorIndex(str(tmp_path), OtherEmbedder())
+    assert len(index) == 0
+    assert index.update(library) == (3, 0)
+
+
+class Zotero:
+    """
+    A library whose version goes up with every change, as far as LibrarySnapshot.sync asks.
+    """
+    def __init__(self, items):
+        self.version = 1
+        self.library = {entry['key']: entry for entry in items}
+
+    def last_modified_version(self):
+        return self.version
+
+    def items(self, since=0):
+        return [entry for entry in self.library.values() if entry['version'] > since]
+
+    def everything(self, items):
+        return items
+
+    def deleted(self, since=0):
+        return {'items': []}
+
+
+def test_assistant_refreshes_when_the_library_version_changes(tmp_path, library):
+    from pyserpZotero.ai.ai import LangChainAssistant
+
+    zot       = Zotero(library)
+    embedder  = WordEmbedder()
+    assistant = types.SimpleNamespace(zot=zot, zot_id="1", cache_dir=str(tmp_path), embedder=embedder, pkl_path="",
+                                      vector_index=None, snapshot=None, indexed_version=None)
+    LangChainAssistant.refresh_index(assistant)
+    LangChainAssistant.refresh_index(assistant)
+    assert (embedder.embedded, assistant.indexed_version) == (3, 1)
+
+    zot.version = 2
+    zot.library["NEW"] = item("NEW", 2, "sparse attention")
+    LangChainAssistant.refresh_index(assistant)
+    assert (embedder.embedded, assistant.indexed_version, len(assistant.vector_index)) == (4, 2, 4)
@@ -0,0 +1,76 @@
+# tests/test_workers.py
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+from pyserpZotero.utils.workers import WorkerPool, pdf_job_timeout
+
+
+def pool(timeout):
+    """
+    A WorkerPool without processes: the test plays the workers through pdf_jobs and _collect_pdfs.
+    """
+    workers = WorkerPool.__new__(WorkerPool)
+    workers.pdf_jobs     = queue.Queue()
+    workers.pdf_results  = queue.Queue()
+    workers.pending_pdfs = dict()
+    workers.pdf_timeout  = timeout
+    workers._job_ids     = itertools.count()
+    workers._lock        = threading.Lock()
+    threading.Thread(target=workers._collect_pdfs, daemon=True).start()
+    return workers
+
+
+def fetch_in_background(workers):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(workers.fetch_pdf("10.1/a", title="A")))
+    thread.start()
+    return thread, result
+
+
+def test_pdf_job_timeout():
+    assert pdf_job_timeout(SimpleNamespace(PDF_DOWNLOAD_TIMEOUT=120, PDF_HEDGE_DELAY=2)) == 120 + 70
+    assert pdf_job_timeout(SimpleNamespace(PDF_DOWNLOAD_TIMEOUT=None, PDF_HEDGE_DELAY=None)) == 4 * 70 + 70
+
+
+def test_result_is_handed_to_the_waiting_thread():
+    workers = pool(30)
+    thread, result = fetch_in_background(workers)
+    job_id, doi, title = workers.pdf_jobs.get(timeout=5)
+    workers.pdf_results.put((job_id, 1234, None, None))
+    workers.pdf_results.put((job_id, 1234, (True, "/tmp/a.pdf", "md5"), None))
+    thread.join(5)
+    assert result == [(True, "/tmp/a.pdf", "md5")]
+    assert workers.pending_pdfs == {}
+    workers.pdf_results.put(None)
+
+
+def test_gives_up_when_the_worker_dies():
+    workers = pool(30)
+    thread, result = fetch_in_background(workers)
+    job_id, _, _ = workers.pdf_jobs.get(timeout=5)
+    # Started by a process that has exited since
+    dead = multiprocessing.get_context("spawn").Process(target=time.sleep, args=(0,))
+    dead.start()
+    dead.join()
+    workers.pdf_results.put((job_id, dead.pid, None, None))
+    thread.join(10)
+    assert result == [(False, None, None)]
+    assert workers.pending_pdfs == {}
+
+    # Its result turning up after all is dropped
+    workers.pdf_results.put((job_id, dead.pid, (True, "/tmp/a.pdf", None), None))
+    workers.pdf_results.put(None)
+
+
+def test_gives_up_after_the_timeout():
+    workers = pool(1)
+    start = time.monotonic()
+    thread, result = fetch_in_background(workers)
+    thread.join(10)
+    assert result == [(False, None, None)]
+    assert time.monotonic() - start < 5
+    workers.pdf_results.put(None)